@@ -13,16 +13,17 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'music',  # выше staticfiles: свой collectstatic собирает бандлы (music/assets.py)
     'django.contrib.staticfiles',
-    'music',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'music.instrumentation.QueryInstrumentationMiddleware',  # SQL/шаблоны -> Server-Timing и лог
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'music.auth_cache.CachedAuthenticationMiddleware',  # пользователь из кэша, см. USER_CACHE_*
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -31,7 +32,7 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'music.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -40,6 +41,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'music.context_processors.favorites',
+                'music.context_processors.catalog_version',
             ],
         },
     },
@@ -71,4 +74,71 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = 'login'
-LOGIN_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGIN_REDIRECT_URL = 'home'
+
+# Поиск по каталогу: FTS5-таблицы из миграции 0006
+SEARCH_BACKEND = 'music.search.SQLiteSearchBackend'
+
+# Как часто (в секундах) воркер перестраивает индекс подсказок /api/suggest/
+SUGGEST_INDEX_TTL = 600
+
+# Буфер прослушиваний (music/plays.py): 0 — писать каждое прослушивание сразу
+PLAY_BUFFER_SIZE = 0
+PLAY_BUFFER_INTERVAL = 5
+
+# Как часто (в секундах) воркер перечитывает список треков для /api/random-song/
+SHUFFLE_POOL_TTL = 300
+
+# Префикс internal location nginx для X-Accel-Redirect; None — отдавать аудио из Django
+AUDIO_ACCEL_REDIRECT = None
+
+# Размер куска при отдаче аудио из Python (music/streaming.py)
+AUDIO_STREAM_CHUNK_SIZE = 64 * 1024
+
+# True — стриминг и API-эндпоинты из music/async_views.py (для запуска под ASGI)
+ASYNC_API_VIEWS = False
+
+# Бюджет SQL-запросов по имени URL: при превышении music.perf пишет предупреждение
+QUERY_BUDGETS = {
+    'home': 15,  # новый пользователь: пользователь из БД и расчёт рекомендаций на лету; с готовыми — 6
+    'search': 8,
+    'artist_detail': 6,
+    'album_detail': 6,
+    'playlist_detail': 8,
+    'favorites': 6,
+    'play_song': 5,  # трек, его артист и альбом, история и проверка трека
+    'random_song': 3,
+    'similar_songs': 4,
+    'stream_audio': 3,
+    'songs_batch': 2,
+    'radio_queue': 8,
+}
+
+# Предупреждения о бюджете (music/instrumentation.py) — в консоль через logging.
+# Уровень INFO добавит строку JSON с замерами на каждый запрос
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'music.perf': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Кэш страниц каталога для гостей (music/page_cache.py): алиас из CACHES и время жизни.
+# Версия каталога всегда лежит в 'default' — на нескольких воркерах он должен быть общим
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_TIMEOUT = 300
+
+# Сессии и пользователь из кэша: ни django_session, ни auth_user на каждый запрос (music/auth_cache.py)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_TIMEOUT = 900
@@ -29,17 +29,18 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'music',  # выше staticfiles: свой collectstatic собирает бандлы (music/assets.py)
     'django.contrib.staticfiles',
-    'music',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Для статики
+    'music.instrumentation.QueryInstrumentationMiddleware',  # SQL/шаблоны -> Server-Timing и лог
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'music.auth_cache.CachedAuthenticationMiddleware',  # пользователь из кэша, см. USER_CACHE_*
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -48,7 +49,7 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'music.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -57,6 +58,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'music.context_processors.favorites',
+                'music.context_processors.catalog_version',
             ],
         },
     },
@@ -77,6 +80,19 @@ DATABASES = {
     }
 }
 
+# Поиск по каталогу: GIN-индекс pg_trgm по search_text (миграция 0006)
+SEARCH_BACKEND = 'music.search.PostgresSearchBackend'
+
+# Как часто (в секундах) воркер перестраивает индекс подсказок /api/suggest/
+SUGGEST_INDEX_TTL = 600
+
+# Как часто (в секундах) воркер перечитывает список треков для /api/random-song/
+SHUFFLE_POOL_TTL = 300
+
+# Буфер прослушиваний (music/plays.py): сбрасывается по 200 событий или раз в 5 секунд
+PLAY_BUFFER_SIZE = 200
+PLAY_BUFFER_INTERVAL = 5
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -109,6 +125,30 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Аудио отдаёт nginx через internal location /protected-media/ (см. nginx.conf),
+# Django только находит файл и отвечает заголовком X-Accel-Redirect
+AUDIO_ACCEL_REDIRECT = '/protected-media/'
+
+# stream_audio, play_song, random_song и similar_songs — async-версии для
+# ASGI-воркеров (gunicorn_asgi_config.py, bjfy-asgi.service)
+ASYNC_API_VIEWS = True
+
+# Бюджет SQL-запросов по имени URL: при превышении music.perf пишет предупреждение
+QUERY_BUDGETS = {
+    'home': 15,  # новый пользователь: пользователь из БД и расчёт рекомендаций на лету; с готовыми — 6
+    'search': 8,
+    'artist_detail': 6,
+    'album_detail': 6,
+    'playlist_detail': 8,
+    'favorites': 6,
+    'play_song': 5,  # трек, его артист и альбом, история и проверка трека
+    'random_song': 3,
+    'similar_songs': 4,
+    'stream_audio': 3,
+    'songs_batch': 2,
+    'radio_queue': 8,
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -143,6 +183,11 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        # music.perf пишет готовую JSON-строку
+        'perf': {
+            'format': '{asctime} {levelname} {message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'console': {
@@ -158,6 +203,14 @@ LOGGING = {
             'backupCount': 10,
             'formatter': 'verbose',
         },
+        'perf_file': {
+            'level': 'INFO',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': LOGS_DIR / 'perf.log',
+            'maxBytes': 1024 * 1024 * 15,  # 15MB
+            'backupCount': 5,
+            'formatter': 'perf',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -174,6 +227,13 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        # Замеры запросов (music/instrumentation.py): строка JSON на запрос
+        # и WARNING при превышении QUERY_BUDGETS
+        'music.perf': {
+            'handlers': ['perf_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -186,10 +246,43 @@ LOGGING = {
 # EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 # DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL')
 
-# Cache (опционально - Redis)
+# Cache: общий для всех воркеров на этом сервере (в LocMemCache у каждого
+# процесса был бы свой кэш и сброс, например, лайков не доходил бы до остальных)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+    # Готовые страницы для гостей: в памяти воркера, ключи включают общую версию каталога
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bjfy-pages',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+# Cache (опционально - Redis, для нескольких серверов)
 # CACHES = {
 #     'default': {
 #         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
 #         'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
-#     }
+#     },
+#     'pages': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+#         'KEY_PREFIX': 'pages',
+#     },
 # }
+
+# Кэш страниц каталога для гостей (music/page_cache.py)
+PAGE_CACHE_ALIAS = 'pages'
+PAGE_CACHE_TIMEOUT = 300
+
+# Сессии: cached_db читает из кэша и пишет и туда, и в БД; 'django.contrib.sessions.backends.db' —
+# по-старому. Кэш должен быть общим для воркеров, иначе выход из аккаунта увидит только один из них
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_CACHE_ALIAS = 'default'
+# Объект пользователя для CachedAuthenticationMiddleware (music/auth_cache.py); чтобы вернуть
+# чтение auth_user на каждый запрос, замените его в MIDDLEWARE на стандартный AuthenticationMiddleware
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_TIMEOUT = 900
@@ -1,14 +1,16 @@
 from django.contrib import admin
-from .models import Artist, Album, Song, Playlist, Favorite, PlayHistory
+from django.db.models import Max
+from .models import Artist, Album, Song, Playlist, PlaylistSong, Favorite, PlayHistory, IngestJob
+from .playlists import POSITION_STEP
 
 @admin.register(Artist)
 class ArtistAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_at']
+    list_display = ['name', 'song_count', 'album_count', 'total_plays', 'created_at']
     search_fields = ['name']
 
 @admin.register(Album)
 class AlbumAdmin(admin.ModelAdmin):
-    list_display = ['title', 'artist', 'release_date']
+    list_display = ['title', 'artist', 'release_date', 'song_count', 'total_plays']
     list_filter = ['release_date']
     search_fields = ['title', 'artist__name']
 
@@ -17,12 +19,43 @@ class SongAdmin(admin.ModelAdmin):
     list_display = ['title', 'artist', 'album', 'plays', 'created_at']
     list_filter = ['created_at']
     search_fields = ['title', 'artist__name']
+    readonly_fields = ['codec', 'bitrate', 'sample_rate']
+
+class PlaylistSongInline(admin.TabularInline):
+    model = PlaylistSong
+    fields = ['song', 'position']
+    raw_id_fields = ['song']
+    extra = 0
 
 @admin.register(Playlist)
 class PlaylistAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'created_at']
     list_filter = ['created_at']
     search_fields = ['name', 'user__username']
+    inlines = [PlaylistSongInline]
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is PlaylistSong:
+            # Новые строки без позиции встают в конец, а не в начало (default=0)
+            positions = [f.cleaned_data.get('position') or 0 for f in formset.forms if f.cleaned_data]
+            last = PlaylistSong.objects.filter(playlist=form.instance).aggregate(last=Max('position'))['last'] or 0
+            last = max([last, *positions])
+            for extra in formset.extra_forms:
+                if extra.has_changed() and not extra.cleaned_data.get('position'):
+                    last += POSITION_STEP
+                    extra.instance.position = last
+        super().save_formset(request, form, formset, change)
 
 admin.site.register(Favorite)
-admin.site.register(PlayHistory)
\ No newline at end of file
+admin.site.register(PlayHistory)
+
+@admin.register(IngestJob)
+class IngestJobAdmin(admin.ModelAdmin):
+    list_display = ['song', 'status', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status']
+    list_select_related = ['song__artist']
+    actions = ['requeue']
+
+    @admin.action(description='Поставить в очередь заново')
+    def requeue(self, request, queryset):
+        queryset.update(status=IngestJob.PENDING, attempts=0, error='')
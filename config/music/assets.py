@@ -0,0 +1,105 @@
+"""
+Сборка CSS и JS из static/ в бандлы.
+
+Раньше стили и весь плеер были вписаны в base.html, и каждая HTML-страница
+заново везла ~60 КБ, которые браузер не мог закэшировать. Теперь исходники
+лежат в static/css и static/js, а ``build_assets`` (её же вызывает
+``collectstatic``) склеивает их по ``BUNDLES``, ужимает и пишет в
+static/bundles/. Дальше ``CompressedManifestStaticFilesStorage`` добавляет
+к имени хэш содержимого и кладёт рядом .gz и .br (пакет Brotli из
+requirements.txt; без него collectstatic предупреждает),
+так что бандл отдаётся с вечным кэшем и меняет адрес при каждом изменении.
+
+Тег ``{% bundle %}`` (music/templatetags/assets.py) при DEBUG подключает
+исходники по одному, чтобы правки были видны без сборки.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+BUNDLE_DIR = 'bundles'
+BUNDLES = {
+    'app.css': ['css/app.css'],
+    'app.js': ['js/player.js', 'js/lists.js', 'js/suggest.js'],
+}
+
+# Строки и комментарии разбираются одним проходом: ужимается только код между
+# строками, поэтому их содержимое не меняется, а /* внутри строки — не комментарий
+_CSS_TOKEN = re.compile(r'''(/\*.*?\*/)|("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''', re.S)
+_CSS_SPACE = re.compile(r'\s*([{};,>])\s*')
+# В JS комментарий — только // или /* в начале строки или после пробела: так
+# регулярные выражения вроде /a\/\// не принимаются за комментарий
+_JS_TOKEN = re.compile(
+    r'''(?:^|(?<=\s))(?://[^\n]*|/\*.*?\*/)'''
+    r'''|('(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)''',
+    re.S | re.M,
+)
+
+
+def _minify(source, token, minify_code):
+    """Ужимает код между строковыми литералами; комментарии (токены без группы строки) выбрасываются."""
+    parts, code, pos = [], [], 0
+    for match in token.finditer(source):
+        code.append(source[pos:match.start()])
+        pos = match.end()
+        if match.group(match.re.groups):
+            parts += [minify_code(''.join(code)), match.group()]
+            code = []
+    code.append(source[pos:])
+    parts.append(minify_code(''.join(code)))
+    return ''.join(parts).strip()
+
+
+def _minify_css_code(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = _CSS_SPACE.sub(r'\1', code)
+    code = re.sub(r':\s+', ':', code)
+    return code.replace(';}', '}')
+
+
+def minify_css(source):
+    """Убирает комментарии и лишние пробелы; пробел перед ':' остаётся — он значим в селекторах."""
+    return _minify(source, _CSS_TOKEN, _minify_css_code)
+
+
+def minify_js(source):
+    """
+    Осторожное ужатие: отступы, пустые строки и комментарии. Переводы строк
+    остаются, иначе сломается автоматическая расстановка ``;``; строки,
+    в том числе многострочные `шаблоны`, не трогаются.
+    """
+    return _minify(source, _JS_TOKEN, lambda code: re.sub(r'[ \t]*\n\s*', '\n', code))
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def bundle_path(name):
+    return f'{BUNDLE_DIR}/{name}'
+
+
+def build_bundle(name):
+    """Текст бандла: исходники по порядку, каждый ужат отдельно."""
+    minify = MINIFIERS[name[name.rindex('.'):]]
+    parts = []
+    for path in BUNDLES[name]:
+        found = finders.find(path)
+        if found is None:
+            raise FileNotFoundError(f'Исходник бандла {name} не найден: {path}')
+        with open(found, encoding='utf-8') as f:
+            parts.append(minify(f.read()))
+    separator = '\n' if name.endswith('.css') else '\n;\n'
+    return separator.join(parts) + '\n'
+
+
+def build_all(output_dir=None):
+    """Пишет все бандлы в output_dir (по умолчанию static/bundles/). Возвращает {имя: размер}."""
+    output_dir = output_dir or settings.BASE_DIR / 'static' / BUNDLE_DIR
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sizes = {}
+    for name in BUNDLES:
+        data = build_bundle(name).encode('utf-8')
+        (output_dir / name).write_bytes(data)
+        sizes[name] = len(data)
+    return sizes
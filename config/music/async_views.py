@@ -0,0 +1,156 @@
+"""
+Асинхронные версии стриминга и лёгких JSON-эндпоинтов.
+
+Подключаются в urls.py при ``ASYNC_API_VIEWS = True`` и рассчитаны на
+ASGI-воркеры (gunicorn_asgi_config.py): медленный слушатель занимает
+корутину, а не целый sync-воркер. Запросы к БД идут через async ORM,
+работа с файлами (stat, open, чтение, загрузка модели соседей) — через
+пул потоков.
+"""
+import mimetypes
+import os
+import random
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+
+from . import seektable, shuffle, similarity
+from .models import SeekIndex, Song
+from .plays import record_play
+from .streaming import serve_file
+from . import views
+from .views import (
+    SONGS_BATCH_LIMIT, _batch_etag, _batch_headers, _batch_ids, _batch_response, _similar_by_catalog, _song_json,
+    _query_ids,
+)
+
+
+def _user_id(request):
+    return request.user.pk if request.user.is_authenticated else None
+
+
+async def stream_audio(request, song_pk):
+    """Async-версия views.stream_audio."""
+    song = await Song.objects.only('audio_file').filter(pk=song_pk).afirst()
+    if song is None:
+        raise Http404('Song not found')
+    if not song.audio_file:
+        return HttpResponse('Audio file not found', status=404)
+
+    seconds = seektable.parse_seconds(request.GET.get('t'))
+    accel_prefix = getattr(settings, 'AUDIO_ACCEL_REDIRECT', None)
+    if accel_prefix and seconds is None:
+        content_type, _ = mimetypes.guess_type(song.audio_file.name)
+        response = HttpResponse(content_type=content_type or 'audio/mpeg')
+        response['X-Accel-Redirect'] = accel_prefix + quote(song.audio_file.name)
+        return response
+
+    file_path = song.audio_file.path
+    # Файловая система (stat, open) — в пуле потоков, не в event loop
+    if not await sync_to_async(os.path.exists, thread_sensitive=False)(file_path):
+        return HttpResponse('Audio file not found', status=404)
+    content_type, _ = mimetypes.guess_type(file_path)
+    # Под WSGI асинхронный итератор был бы вычитан в память, поэтому смотрим на тип запроса
+    asynchronous = isinstance(request, ASGIRequest)
+    if seconds is not None:
+        index = await SeekIndex.objects.filter(song_id=song.pk).afirst()
+        if index is None:
+            return HttpResponse('Seek index not found', status=404)
+        prefix, start, end, start_seconds = await sync_to_async(seektable.seek, thread_sensitive=False)(
+            index, file_path, seconds,
+        )
+        response = await sync_to_async(serve_file, thread_sensitive=False)(
+            request, file_path, content_type or 'audio/mpeg', asynchronous=asynchronous,
+            start=start, end=end, prefix=prefix,
+        )
+        response['X-Seek-Start'] = str(start_seconds)
+        return response
+    return await sync_to_async(serve_file, thread_sensitive=False)(
+        request, file_path, content_type or 'audio/mpeg', asynchronous=asynchronous,
+    )
+
+
+async def play_song(request, song_pk):
+    """Async-версия views.play_song."""
+    user_id = await sync_to_async(_user_id)(request)
+    if not await sync_to_async(record_play)(song_pk, user_id):
+        raise Http404('Song not found')
+    return JsonResponse({'status': 'success'})
+
+
+async def random_song(request):
+    """Async-версия views.random_song."""
+    exclude_param = request.GET.get('exclude', '')
+    exclude_ids = set(_query_ids(exclude_param))
+    weighted = request.GET.get('weighted') in ('1', 'true')
+
+    song = None
+    for _ in range(2):
+        pool = await sync_to_async(shuffle.get_pool)()
+        pk = pool.sample(exclude=exclude_ids, weighted=weighted)
+        if pk is None:
+            break
+        song = await Song.objects.select_related('artist', 'album').filter(pk=pk).afirst()
+        if song:
+            break
+        exclude_ids.add(pk)
+        shuffle.invalidate()
+
+    if song:
+        return JsonResponse({
+            'id': song.pk,
+            'url': song.get_stream_url(),
+            'title': song.title,
+            'artist': song.artist.name if song.artist else '',
+            'cover': song.get_cover(640)
+        })
+    return JsonResponse({'error': 'No songs available'}, status=404)
+
+
+async def similar_songs(request, song_id):
+    """Async-версия views.similar_songs."""
+    exclude_param = request.GET.get('exclude', '')
+    exclude_ids = _query_ids(exclude_param)
+    if song_id not in exclude_ids:
+        exclude_ids.append(song_id)
+
+    # Первое обращение или новый файл модели — np.load с диска, не в event loop
+    candidates = await sync_to_async(similarity.sample_neighbors, thread_sensitive=False)(
+        song_id, exclude=exclude_ids, count=3,
+    )
+    if candidates:
+        songs = await Song.objects.select_related('artist', 'album').ain_bulk(candidates)
+        for pk in candidates:
+            if pk in songs:
+                return JsonResponse(_song_json(songs[pk]))
+
+    current_song = await Song.objects.filter(pk=song_id).afirst()
+    if current_song is None:
+        return JsonResponse({'error': 'Song not found'}, status=404)
+
+    similar = await sync_to_async(_similar_by_catalog)(current_song, exclude_ids)
+    if similar:
+        return JsonResponse(_song_json(random.choice(similar)))
+    return JsonResponse({'error': 'No similar songs found'}, status=404)
+
+
+async def songs_batch(request):
+    """Async-версия views.songs_batch."""
+    ids = _batch_ids(request)
+    if len(ids) > SONGS_BATCH_LIMIT:
+        return JsonResponse({'error': f'Не больше {SONGS_BATCH_LIMIT} id за запрос'}, status=400)
+    etag = await sync_to_async(_batch_etag)(ids)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _batch_headers(not_modified, etag)
+    songs = await Song.objects.select_related('artist', 'album').ain_bulk(ids)
+    return _batch_response(ids, etag, songs)
+
+
+async def radio_queue(request, song_id):
+    """Async-версия views.radio_queue: сессия и три запроса — одним заходом в пул потоков."""
+    return await sync_to_async(views.radio_queue)(request, song_id)
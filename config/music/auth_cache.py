@@ -0,0 +1,62 @@
+"""
+Пользователь запроса из кэша вместо ``auth_user``.
+
+Стандартный AuthenticationMiddleware на каждый запрос авторизованного
+пользователя читает строку ``auth_user``, а сессия из БД добавляет ещё
+запрос к ``django_session`` — для пингов плеера вроде ``play_song`` это
+большая часть работы. Сессии закрывает движок ``cached_db``
+(SESSION_ENGINE в настройках), а ``CachedAuthenticationMiddleware``
+держит объект пользователя в кэше ``USER_CACHE_ALIAS``.
+
+Проверка сессии та же, что в ``django.contrib.auth.get_user``: хэш пароля
+из закэшированного объекта сверяется с хэшем в сессии, а при расхождении
+запрос идёт обычным путём через БД (он же сбрасывает чужую сессию).
+Ключ удаляется сигналами на User (music/signals.py) — смена пароля,
+is_active, is_staff и is_superuser сразу видны. Группы и права в кэш не
+попадают: ``has_perm`` по-прежнему читает их из БД. ``update()`` мимо
+сигналов доживёт до ``USER_CACHE_TIMEOUT``.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+
+def _cache():
+    return caches[getattr(settings, 'USER_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f'music:user:{user_id}'
+
+
+def invalidate(user_id):
+    _cache().delete(_key(user_id))
+
+
+def get_user(request):
+    """Как ``auth.get_user``, но без запроса к БД, пока пользователь лежит в кэше."""
+    user_id = request.session.get(auth.SESSION_KEY)
+    backend_path = request.session.get(auth.BACKEND_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    user = _cache().get(_key(user_id))
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if user is not None and session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return user
+
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        _cache().set(_key(user_id), user, getattr(settings, 'USER_CACHE_TIMEOUT', 900))
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware с пользователем из кэша (get_user выше)."""
+
+    def process_request(self, request):
+        super().process_request(request)  # проверка, что SessionMiddleware подключён
+        request.user = SimpleLazyObject(lambda: get_user(request))
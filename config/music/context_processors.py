@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+from .favorite_cache import get_favorite_ids
+from .page_cache import catalog_version as get_catalog_version
+
+
+def favorites(request):
+    """favorite_ids во всех шаблонах; кэш читается, только если шаблон к нему обратился."""
+    user = getattr(request, 'user', None)
+    if user is None:
+        return {'favorite_ids': frozenset()}
+    return {'favorite_ids': SimpleLazyObject(lambda: get_favorite_ids(user))}
+
+
+def catalog_version(request):
+    """Версия каталога для {% cache %}: фрагменты сбрасываются вместе со страницами."""
+    return {'catalog_version': SimpleLazyObject(get_catalog_version)}
@@ -0,0 +1,118 @@
+"""
+Денормализованные счётчики Artist.song_count/album_count/total_plays и
+Album.song_count/total_plays.
+
+Раньше популярных артистов ранжировали через ``annotate(Count('songs'))`` —
+GROUP BY по всей таблице Song на каждый запрос главной. Теперь это
+индексированные колонки. Их поддерживают сигналы (music/signals.py) и учёт
+прослушиваний (music/plays.py) атомарными ``F()``-обновлениями. Всё, что
+обходит сигналы (bulk_create, queryset.update, правки в БД руками),
+выравнивает ``reconcile()`` — команда ``reconcile_counters``.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+
+from .models import Album, Artist, Song
+
+
+def _add(model, pk, **deltas):
+    # Счётчики могли разойтись (bulk_create мимо сигналов): уменьшение не должно
+    # упереться в CHECK >= 0 у PositiveIntegerField и сорвать удаление
+    deltas = {
+        field: Greatest(F(field) + delta, 0) if delta < 0 else F(field) + delta
+        for field, delta in deltas.items() if delta
+    }
+    if pk is not None and deltas:
+        model.objects.filter(pk=pk).update(**deltas)
+
+
+def song_saved(song, created, previous=None):
+    """previous — (artist_id, album_id, plays) до сохранения, см. signals.remember_song_state."""
+    if created:
+        _add(Artist, song.artist_id, song_count=1, total_plays=song.plays)
+        _add(Album, song.album_id, song_count=1, total_plays=song.plays)
+        return
+    if previous is None:
+        return
+    old_artist, old_album, old_plays = previous
+    for model, old_pk, new_pk in ((Artist, old_artist, song.artist_id), (Album, old_album, song.album_id)):
+        if old_pk == new_pk:
+            _add(model, new_pk, total_plays=song.plays - old_plays)
+        else:
+            _add(model, old_pk, song_count=-1, total_plays=-old_plays)
+            _add(model, new_pk, song_count=1, total_plays=song.plays)
+
+
+def song_deleted(song):
+    _add(Artist, song.artist_id, song_count=-1, total_plays=-song.plays)
+    _add(Album, song.album_id, song_count=-1, total_plays=-song.plays)
+
+
+def album_saved(album, created, previous_artist_id=None):
+    if created:
+        _add(Artist, album.artist_id, album_count=1)
+    elif previous_artist_id is not None and previous_artist_id != album.artist_id:
+        _add(Artist, previous_artist_id, album_count=-1)
+        _add(Artist, album.artist_id, album_count=1)
+
+
+def album_deleted(album):
+    _add(Artist, album.artist_id, album_count=-1)
+
+
+def add_plays(rows, counts):
+    """
+    Переносит прирост прослушиваний треков на их артистов и альбомы.
+
+    rows — (song_id, artist_id, album_id), counts — {song_id: прирост}.
+    Как и в plays.write_plays, один UPDATE на каждое значение прироста.
+    """
+    per_artist, per_album = Counter(), Counter()
+    for song_id, artist_id, album_id in rows:
+        per_artist[artist_id] += counts.get(song_id, 0)
+        per_album[album_id] += counts.get(song_id, 0)
+    for model, per_pk in ((Artist, per_artist), (Album, per_album)):
+        by_increment = defaultdict(list)
+        for pk, n in per_pk.items():
+            if n:
+                by_increment[n].append(pk)
+        for n, pks in by_increment.items():
+            model.objects.filter(pk__in=pks).update(total_plays=F('total_plays') + n)
+
+
+def _grouped(queryset, key, **aggregates):
+    return {
+        row.pop(key): row
+        for row in queryset.order_by().values(key).annotate(**aggregates)
+    }
+
+
+def reconcile(batch_size=1000):
+    """Пересчитывает счётчики по факту и записывает только разошедшиеся. Возвращает {модель: число исправленных}."""
+    songs_by_artist = _grouped(Song.objects, 'artist_id', song_count=Count('pk'), total_plays=Sum('plays'))
+    albums_by_artist = _grouped(Album.objects, 'artist_id', album_count=Count('pk'))
+    songs_by_album = _grouped(Song.objects, 'album_id', song_count=Count('pk'), total_plays=Sum('plays'))
+
+    fixed = {}
+    for model, fields, sources in (
+        (Artist, ('song_count', 'album_count', 'total_plays'), (songs_by_artist, albums_by_artist)),
+        (Album, ('song_count', 'total_plays'), (songs_by_album,)),
+    ):
+        drifted = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=batch_size):
+            actual = {}
+            for source in sources:
+                actual.update(source.get(obj.pk, {}))
+            changed = False
+            for field in fields:
+                value = actual.get(field) or 0
+                if getattr(obj, field) != value:
+                    setattr(obj, field, value)
+                    changed = True
+            if changed:
+                drifted.append(obj)
+        model.objects.bulk_update(drifted, fields, batch_size=batch_size)
+        fixed[model.__name__] = len(drifted)
+    return fixed
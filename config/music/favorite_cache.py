@@ -0,0 +1,34 @@
+"""
+Множество id лайкнутых треков пользователя в кэше Django.
+
+Раньше каждая вьюха делала свой ``values_list('song_id')`` в список, а
+шаблоны проверяли ``song.pk in favorite_ids`` перебором. Теперь это
+frozenset из кэша: один запрос на промах, проверка в шаблоне за O(1).
+Ключ сбрасывается сигналами на Favorite (music/signals.py) после коммита.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Favorite
+
+
+def _cache():
+    return caches[getattr(settings, 'FAVORITES_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f'music:favorites:{user_id}'
+
+
+def get_favorite_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    ids = _cache().get(_key(user.pk))
+    if ids is None:
+        ids = frozenset(Favorite.objects.filter(user=user).values_list('song_id', flat=True))
+        _cache().set(_key(user.pk), ids, getattr(settings, 'FAVORITES_CACHE_TIMEOUT', 24 * 3600))
+    return ids
+
+
+def invalidate(user_id):
+    _cache().delete(_key(user_id))
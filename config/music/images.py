@@ -0,0 +1,115 @@
+"""
+Уменьшенные копии обложек и фото артистов.
+
+Шаблоны раньше отдавали оригинал загрузки даже для миниатюр 48px. Теперь
+для каждой картинки один раз строятся квадратные копии размеров
+``COVER_SIZES`` в WebP и JPEG и кладутся рядом в storage:
+``derived/<путь оригинала>/<размер>.<формат>``. Строятся при сохранении
+модели (music/signals.py), а для старых файлов — командой
+``build_cover_derivatives``. Оригинал после загрузки не меняется (Django не
+перезаписывает файлы с тем же именем), поэтому готовая копия никогда не
+устаревает.
+
+``image_url`` вызывается при рендеринге и в async JSON-вьюхах, поэтому
+ничего не строит: пока копии нет, отдаётся оригинал. Найденные копии
+запоминаются в памяти процесса, и stat делается один раз на файл, а
+отсутствующие перепроверяются не чаще раза в ``MISSING_RECHECK`` секунд.
+"""
+import io
+import logging
+import posixpath
+import time
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+COVER_SIZES = (48, 96, 200, 400, 640)
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+DERIVED_DIR = 'derived'
+PLACEHOLDER = '/static/placeholder.png'
+MISSING_RECHECK = 60
+KNOWN_LIMIT = 100_000
+
+_existing = set()
+_missing = {}  # имя копии -> monotonic-время, после которого проверить снова
+
+
+def derivative_name(name, size, fmt):
+    return posixpath.join(DERIVED_DIR, name, f'{size}.{EXTENSIONS[fmt]}')
+
+
+def _render(source, size, fmt):
+    image = ImageOps.exif_transpose(source)
+    if image.mode not in ('RGB', 'RGBA') or (fmt == 'jpeg' and image.mode == 'RGBA'):
+        image = image.convert('RGB')
+    image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, **FORMATS[fmt])
+    return buffer.getvalue()
+
+
+def ensure_derivatives(fieldfile, sizes=COVER_SIZES, formats=FORMATS):
+    """Строит недостающие копии. Возвращает число созданных файлов."""
+    if not fieldfile:
+        return 0
+    storage = fieldfile.storage
+    missing = [
+        (size, fmt) for size in sizes for fmt in formats
+        if not storage.exists(derivative_name(fieldfile.name, size, fmt))
+    ]
+    if not missing:
+        return 0
+    try:
+        with fieldfile.storage.open(fieldfile.name, 'rb') as f:
+            source = Image.open(f)
+            source.load()
+    except (OSError, ValueError):
+        logger.warning('Не удалось открыть картинку %s', fieldfile.name)
+        return 0
+    for size, fmt in missing:
+        name = storage.save(derivative_name(fieldfile.name, size, fmt), ContentFile(_render(source, size, fmt)))
+        _existing.add(name)
+        _missing.pop(name, None)
+    return len(missing)
+
+
+def _derivative_exists(storage, name):
+    if name in _existing:
+        return True
+    now = time.monotonic()
+    if _missing.get(name, 0) > now:
+        return False
+    if len(_existing) >= KNOWN_LIMIT or len(_missing) >= KNOWN_LIMIT:
+        _existing.clear()
+        _missing.clear()
+    if storage.exists(name):
+        _existing.add(name)
+        _missing.pop(name, None)
+        return True
+    _missing[name] = now + MISSING_RECHECK
+    return False
+
+
+def image_url(fieldfile, size=None, fmt='jpeg'):
+    """URL картинки нужного размера; size=None или копии ещё нет — оригинал."""
+    if not fieldfile:
+        return PLACEHOLDER
+    if size is None:
+        return fieldfile.url
+    if size not in COVER_SIZES:
+        raise ValueError(f'Размер {size} не входит в COVER_SIZES')
+    name = derivative_name(fieldfile.name, size, fmt)
+    if not _derivative_exists(fieldfile.storage, name):
+        return fieldfile.url
+    return fieldfile.storage.url(name)
+
+
+def retina_size(size):
+    """Ближайший размер из COVER_SIZES для экранов 2x."""
+    return next((s for s in COVER_SIZES if s >= size * 2), COVER_SIZES[-1])
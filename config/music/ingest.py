@@ -0,0 +1,219 @@
+"""
+Фоновый разбор загруженных аудиофайлов.
+
+Раньше ``Song.save()`` вызывал mutagen прямо в запросе админки и
+сохранял трек второй раз ради ``duration`` — на больших FLAC это секунды
+занятого sync-воркера. Теперь ``save()`` только ставит задачу в таблицу
+IngestJob, а команда ``ingest_worker`` забирает задачи пачками и разбирает
+файлы в пуле процессов: длительность, битрейт, кодек, частота
+дискретизации, встроенная обложка и таблица перемотки
+(music/seektable.py). Результат пишется в Song одним UPDATE.
+"""
+import base64
+import datetime
+import logging
+import mimetypes
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import images
+from .models import IngestJob, SeekIndex, Song
+from .page_cache import bump_catalog_version
+from .seektable import build_seek_table
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+
+def enqueue(song):
+    """Ставит трек в очередь, если для него ещё нет невыполненной задачи."""
+    pending = IngestJob.objects.filter(song=song, status=IngestJob.PENDING)
+    if not pending.exists():
+        IngestJob.objects.create(song=song)
+
+
+def enqueue_missing():
+    """
+    Ставит в очередь треки, которые ещё ни разу не разбирались, и MP3/FLAC/WAV
+    без таблицы перемотки. Возвращает их число.
+    """
+    without_seek_index = Q(seek_index__isnull=True, audio_file__iregex=r'\.(mp3|flac|wav)$')
+    songs = Song.objects.filter(Q(codec='') | without_seek_index).exclude(audio_file='') \
+        .exclude(ingest_jobs__status__in=[IngestJob.PENDING, IngestJob.RUNNING]) \
+        .values_list('pk', flat=True)
+    jobs = IngestJob.objects.bulk_create(IngestJob(song_id=pk) for pk in songs.iterator())
+    return len(jobs)
+
+
+def claim_jobs(limit, stale_after):
+    """
+    Забирает до limit задач: из очереди и зависшие в running дольше
+    stale_after секунд (воркер умер). Зависшая задача тратит попытку —
+    файл, который роняет воркер, не будет разбираться вечно. На Postgres
+    параллельные воркеры не получат одну задачу благодаря SKIP LOCKED;
+    SQLite и так пишет по одному.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=stale_after)
+    with transaction.atomic():
+        jobs = list(
+            IngestJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=IngestJob.PENDING) | Q(status=IngestJob.RUNNING, started_at__lt=stale))
+            .order_by('created_at')[:limit]
+        )
+        reclaimed = [job for job in jobs if job.status == IngestJob.RUNNING]
+        for job in reclaimed:
+            job.attempts += 1
+        IngestJob.objects.filter(pk__in=[job.pk for job in reclaimed]).update(attempts=F('attempts') + 1)
+        exhausted = {job.pk for job in reclaimed if job.attempts >= MAX_ATTEMPTS}
+        if exhausted:
+            IngestJob.objects.filter(pk__in=exhausted).update(
+                status=IngestJob.FAILED, finished_at=now, error='Воркер не завершил задачу за отведённое время',
+            )
+            logger.warning('Задачи %s зависали %d раз и помечены как failed', sorted(exhausted), MAX_ATTEMPTS)
+        jobs = [job for job in jobs if job.pk not in exhausted]
+        IngestJob.objects.filter(pk__in=[job.pk for job in jobs]).update(status=IngestJob.RUNNING, started_at=now)
+    return jobs
+
+
+def _embedded_cover(audio):
+    """(bytes, mime) первой встроенной картинки или None."""
+    tags = getattr(audio, 'tags', None)
+    pictures = getattr(audio, 'pictures', None)  # FLAC
+    if pictures:
+        return pictures[0].data, pictures[0].mime
+    if tags is None:
+        return None
+    if hasattr(tags, 'getall'):  # ID3: MP3, AIFF, WAV
+        frames = tags.getall('APIC')
+        if frames:
+            return frames[0].data, frames[0].mime
+        return None
+    covers = tags.get('covr') if hasattr(tags, 'get') else None  # MP4/M4A
+    if covers:
+        cover = covers[0]
+        mime = 'image/png' if getattr(cover, 'imageformat', None) == 14 else 'image/jpeg'
+        return bytes(cover), mime
+    blocks = tags.get('metadata_block_picture') if hasattr(tags, 'get') else None  # Ogg Vorbis/Opus
+    if blocks:
+        from mutagen.flac import Picture
+        picture = Picture(base64.b64decode(blocks[0]))
+        return picture.data, picture.mime
+    return None
+
+
+def extract_metadata(path):
+    """
+    Разбирает файл. Выполняется в процессе пула, поэтому не трогает ORM и
+    возвращает только простые значения.
+    """
+    from mutagen import File as MutagenFile
+
+    audio = MutagenFile(path)
+    if audio is None:
+        raise ValueError(f'mutagen не распознал формат: {path}')
+    info = audio.info
+    length = getattr(info, 'length', None)
+    return {
+        'duration': int(length) if length else None,
+        'bitrate': getattr(info, 'bitrate', None) or None,
+        'codec': (getattr(info, 'codec', None) or type(audio).__name__).lower()[:32],
+        'sample_rate': getattr(info, 'sample_rate', None) or None,
+        'cover': _embedded_cover(audio),
+        'seek_table': build_seek_table(path),
+    }
+
+
+def apply_metadata(song, metadata):
+    """Записывает результат разбора одним UPDATE; обложку — только если её ещё нет."""
+    fields = {
+        'bitrate': metadata['bitrate'],
+        'codec': metadata['codec'],
+        'sample_rate': metadata['sample_rate'],
+    }
+    if metadata['duration']:
+        fields['duration'] = datetime.timedelta(seconds=metadata['duration'])
+    if metadata['cover'] and not song.cover:
+        data, mime = metadata['cover']
+        extension = mimetypes.guess_extension(mime or '') or '.jpg'
+        field = Song._meta.get_field('cover')
+        name = field.generate_filename(song, f'{song.pk}{extension}')
+        fields['cover'] = field.storage.save(name, ContentFile(data))
+    Song.objects.filter(pk=song.pk).update(**fields)
+    if 'cover' in fields:
+        # UPDATE обходит post_save, поэтому копии обложки строим здесь (music/images.py)
+        song.cover = fields['cover']
+        images.ensure_derivatives(song.cover)
+    if metadata['seek_table']:
+        kind, offsets = metadata['seek_table']
+        SeekIndex.objects.update_or_create(song_id=song.pk, defaults={'kind': kind, 'offsets': offsets})
+
+
+def finish_job(job, error=None):
+    now = timezone.now()
+    if error is None:
+        IngestJob.objects.filter(pk=job.pk).update(status=IngestJob.DONE, finished_at=now, error='')
+        return
+    attempts = job.attempts + 1
+    status = IngestJob.FAILED if attempts >= MAX_ATTEMPTS else IngestJob.PENDING
+    IngestJob.objects.filter(pk=job.pk).update(status=status, attempts=attempts, error=error, finished_at=now)
+    logger.warning('Не удалось разобрать трек %s (попытка %d): %s', job.song_id, attempts, error.splitlines()[-1])
+
+
+def _run_jobs(jobs, executor):
+    """Разбирает файлы задач в executor. Возвращает (число успешных, задачи, которые не успел сломанный пул)."""
+    songs = Song.objects.only('pk', 'audio_file', 'cover').in_bulk([job.song_id for job in jobs])
+    futures = {}
+    broken = []
+    for job in jobs:
+        song = songs.get(job.song_id)
+        if song is None or not song.audio_file:
+            finish_job(job, 'Трек удалён или у него нет файла')
+            continue
+        try:
+            futures[job.pk] = (job, song, executor.submit(extract_metadata, song.audio_file.path))
+        except BrokenProcessPool:
+            broken.append(job)
+
+    done = 0
+    for job, song, future in futures.values():
+        try:
+            apply_metadata(song, future.result())
+        except BrokenProcessPool:
+            broken.append(job)
+        except Exception:
+            finish_job(job, traceback.format_exc())
+        else:
+            finish_job(job)
+            done += 1
+    return done, broken
+
+
+def process_jobs(jobs, executor):
+    """
+    Разбирает файлы задач в executor и записывает результаты. Возвращает
+    (число успешных, сломан ли executor — тогда его нужно пересоздать).
+
+    Если дочерний процесс упал (segfault в декодере, OOM), пул ломается
+    и все его задачи получают BrokenProcessPool, а какой файл виноват —
+    неизвестно. Поэтому такие задачи разбираются заново по одной в
+    отдельном процессе, и попытку тратит только та, что роняет и его.
+    """
+    done, broken = _run_jobs(jobs, executor)
+    for job in broken:
+        with ProcessPoolExecutor(max_workers=1) as single:
+            single_done, crashed = _run_jobs([job], single)
+        done += single_done
+        if crashed:
+            finish_job(job, 'Процесс разбора аварийно завершился на этом файле')
+    if done:
+        # UPDATE обходит сигналы, а длительность и обложка видны на закэшированных страницах
+        bump_catalog_version()
+    return done, bool(broken)
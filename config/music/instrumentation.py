@@ -0,0 +1,191 @@
+"""
+Замеры SQL и шаблонов на каждый запрос.
+
+``QueryInstrumentationMiddleware`` через ``connection.execute_wrapper``
+считает запросы и время в БД (работает и при DEBUG = False), находит
+повторы одного и того же запроса и N+1 (один и тот же SQL с разными
+параметрами), а ``InstrumentedDjangoTemplates`` добавляет время рендеринга
+шаблонов. Итог уходит в заголовок ``Server-Timing`` и строкой JSON в
+логгер ``music.perf``. Если у вьюхи есть бюджет в ``QUERY_BUDGETS``
+(по имени URL) и он превышен, пишется предупреждение (точки сохранения
+транзакции в бюджет не входят).
+
+Middleware умеет работать и синхронно, и асинхронно: под ASGI async-вьюхи
+(music/async_views.py) не перекладываются в поток. Запросы async-вьюх идут
+через ``sync_to_async`` в другом потоке со своим соединением, поэтому
+обёртка ставится на каждое соединение (сигнал ``connection_created``), а
+текущий запрос она находит через ContextVar — он переходит в поток вместе
+с контекстом.
+"""
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger('music.perf')
+
+_current = ContextVar('music_request_stats', default=None)
+
+# С какого числа повторов одного SQL считаем это N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+# Точки сохранения делает atomic() внутри уже открытой транзакции (в тестах —
+# обёртка TestCase); в бюджет QUERY_BUDGETS они не входят
+_SAVEPOINT_SQL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = []   # (sql, params, секунды)
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, time.perf_counter() - started))
+
+    @property
+    def budget_queries(self):
+        return sum(1 for sql, _, _ in self.queries if not sql.startswith(_SAVEPOINT_SQL))
+
+    @property
+    def db_time(self):
+        return sum(q[2] for q in self.queries)
+
+    def duplicates(self):
+        """Сколько запросов повторили уже выполненный SQL с теми же параметрами."""
+        seen = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return sum(count - 1 for count in seen.values())
+
+    def n_plus_one(self):
+        shapes = Counter(sql for sql, _, _ in self.queries)
+        return [
+            {'sql': sql[:200], 'count': count}
+            for sql, count in shapes.most_common()
+            if count >= N_PLUS_ONE_THRESHOLD
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install(conn):
+    if _record_query not in conn.execute_wrappers:
+        conn.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def _install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Соединение могло открыться раньше, чем загрузился этот модуль
+        install(connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        total = time.perf_counter() - started
+
+        db_ms = stats.db_time * 1000
+        template_ms = stats.template_time * 1000
+        total_ms = total * 1000
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="{len(stats.queries)} queries", '
+                f'tpl;dur={template_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        n_plus_one = stats.n_plus_one()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': len(stats.queries),
+            'db_ms': round(db_ms, 2),
+            'template_ms': round(template_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'duplicates': stats.duplicates(),
+            'n_plus_one': n_plus_one,
+        }
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and stats.budget_queries > budget:
+            logger.warning(
+                'Query budget exceeded: %s made %d queries (budget %d)',
+                view_name, stats.budget_queries, budget,
+            )
+        return response
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            if stats is not None:
+                stats.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, который добавляет время рендеринга в замеры запроса."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
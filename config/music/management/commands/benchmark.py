@@ -0,0 +1,147 @@
+import json
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from music.models import Album, Artist, Song
+
+# Запросы к сессиям и пользователям: с кэшем (music/auth_cache.py) в установившемся режиме их нет
+AUTH_TABLES = ('"django_session"', '"auth_user"')
+
+ENDPOINTS = ['home', 'search', 'artist_detail', 'album_detail', 'stream_audio', 'similar_songs', 'play_song']
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу; values должны быть отсортированы."""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон основных эндпоинтов внутри процесса: по каждому '
+        'считает p50/p95/p99, пропускную способность и число SQL-запросов '
+        'и печатает JSON. Данные для прогона — команда seed_catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на эндпоинт')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Через запятую')
+        parser.add_argument('--user', default=None, help='Имя пользователя, от которого идут запросы (по умолчанию первый bench_user_*)')
+        parser.add_argument('--anonymous', action='store_true', help='Запросы без авторизации')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', default=None, help='Файл для JSON-отчёта (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        endpoints = [e.strip() for e in options['endpoints'].split(',') if e.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+
+        song_ids = list(Song.objects.values_list('pk', flat=True)[:10000])
+        artist_ids = list(Artist.objects.values_list('pk', flat=True)[:10000])
+        album_ids = list(Album.objects.values_list('pk', flat=True)[:10000])
+        terms = [name.split()[-1][:4] for name in Artist.objects.values_list('name', flat=True)[:1000]]
+        if not (song_ids and artist_ids and album_ids):
+            raise CommandError('Каталог пуст — сначала запустите seed_catalog')
+
+        user = None
+        if not options['anonymous']:
+            users = User.objects.filter(username=options['user']) if options['user'] else \
+                User.objects.filter(username__startswith='bench_user_').order_by('pk')
+            user = users.first()
+            if user is None:
+                raise CommandError('Пользователь для прогона не найден (или укажите --anonymous)')
+
+        rng = random.Random(options['seed'])
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                if user is not None:
+                    local.client.force_login(user)
+            return local.client
+
+        def make_request(c, endpoint):
+            if endpoint == 'home':
+                return c.get(reverse('home'))
+            if endpoint == 'search':
+                return c.get(reverse('search'), {'q': rng.choice(terms)})
+            if endpoint == 'artist_detail':
+                return c.get(reverse('artist_detail', args=[rng.choice(artist_ids)]))
+            if endpoint == 'album_detail':
+                return c.get(reverse('album_detail', args=[rng.choice(album_ids)]))
+            if endpoint == 'stream_audio':
+                return c.get(reverse('stream_audio', args=[rng.choice(song_ids)]), HTTP_RANGE='bytes=0-65535')
+            if endpoint == 'similar_songs':
+                return c.get(reverse('similar_songs', args=[rng.choice(song_ids)]))
+            return c.post(reverse('play_song', args=[rng.choice(song_ids)]))
+
+        def timed(endpoint):
+            c = client()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = make_request(c, endpoint)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - started
+            auth_queries = sum(1 for q in queries if any(table in q['sql'] for table in AUTH_TABLES))
+            return elapsed, len(queries), response.status_code, auth_queries
+
+        report = {
+            'config': {
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'authenticated': user is not None,
+                'catalog': {'songs': Song.objects.count(), 'artists': len(artist_ids), 'albums': len(album_ids)},
+            },
+            'endpoints': {},
+        }
+        for endpoint in endpoints:
+            # Прогрев: ленивые индексы и кэши строятся до замеров
+            timed(endpoint)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(timed, [endpoint] * options['requests']))
+            wall = time.perf_counter() - started
+
+            latencies = sorted(r[0] * 1000 for r in results)
+            query_counts = [r[1] for r in results]
+            # 404 на отсутствующем файле или 403 от CSRF — тоже ошибка, а не быстрый ответ
+            error_statuses = Counter(r[2] for r in results if r[2] >= 400)
+            report['endpoints'][endpoint] = {
+                'requests': len(results),
+                'errors': sum(error_statuses.values()),
+                'error_statuses': {str(status): n for status, n in sorted(error_statuses.items())},
+                'throughput_rps': round(len(results) / wall, 1),
+                'mean_ms': round(statistics.fmean(latencies), 2),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'queries_mean': round(statistics.fmean(query_counts), 2),
+                'queries_max': max(query_counts),
+                'auth_queries_mean': round(statistics.fmean(r[3] for r in results), 2),
+            }
+            self.stderr.write(f'{endpoint}: p50 {report["endpoints"][endpoint]["p50_ms"]} ms')
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
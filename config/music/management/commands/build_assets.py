@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from music.assets import build_all
+
+
+class Command(BaseCommand):
+    help = 'Собирает CSS и JS из static/ в ужатые бандлы static/bundles/ (запускается из collectstatic)'
+
+    def handle(self, *args, **options):
+        for name, size in build_all().items():
+            self.stdout.write(f'{name}: {size / 1024:.1f} КБ')
+        self.stdout.write(self.style.SUCCESS('Бандлы собраны'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from music.images import ensure_derivatives
+from music.models import Album, Artist, Playlist, Song
+
+
+class Command(BaseCommand):
+    help = 'Строит недостающие уменьшенные копии (WebP и JPEG) обложек и фото артистов'
+
+    def handle(self, *args, **options):
+        created = 0
+        for model, field in ((Artist, 'image'), (Album, 'cover'), (Song, 'cover'), (Playlist, 'cover')):
+            for obj in model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).only('pk', field).iterator():
+                created += ensure_derivatives(getattr(obj, field))
+        self.stdout.write(self.style.SUCCESS(f'Создано файлов: {created}'))
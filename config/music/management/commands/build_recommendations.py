@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from music.recommendations import last_build, mark_built, refresh_recommendations, stale_user_ids
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу рекомендаций для главной страницы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать всех пользователей, а не только тех, у кого появились новые прослушивания или лайки',
+        )
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help='ID пользователя (можно несколько)')
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        if options['user_ids']:
+            users = User.objects.filter(pk__in=options['user_ids'])
+        elif options['all']:
+            users = User.objects.all()
+        else:
+            # Без отметки о прошлом запуске (первый раз или ключ вытеснен) — вся история
+            users = User.objects.filter(pk__in=stale_user_ids(since=last_build()))
+
+        count = 0
+        for user in users.iterator():
+            refresh_recommendations(user)
+            count += 1
+        if not options['user_ids']:
+            mark_built(started_at)
+        self.stdout.write(self.style.SUCCESS(f'Рекомендации пересчитаны для {count} пользователей'))
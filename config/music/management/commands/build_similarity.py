@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from music.similarity import build_model, model_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит таблицу похожих треков для /api/similar-songs/. '
+        'Запускайте по расписанию (например, раз в час из cron) — '
+        'воркеры подхватывают новый файл сами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=50, help='Сколько соседей хранить для каждого трека')
+
+    def handle(self, *args, **options):
+        count = build_model(k=options['k'])
+        self.stdout.write(self.style.SUCCESS(f'Модель построена для {count} треков: {model_path()}'))
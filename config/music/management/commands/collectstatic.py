@@ -0,0 +1,14 @@
+from django.contrib.staticfiles.management.commands import collectstatic
+from django.core.management import call_command
+
+
+class Command(collectstatic.Command):
+    """collectstatic, который сначала собирает бандлы (music/assets.py), чтобы они получили хэш и .gz/.br."""
+
+    def handle(self, **options):
+        try:
+            import brotli  # noqa: F401 — им пользуется CompressedManifestStaticFilesStorage
+        except ImportError:
+            self.stderr.write(self.style.WARNING('Brotli не установлен: рядом с бандлами будут только .gz'))
+        call_command('build_assets', verbosity=options['verbosity'], stdout=self.stdout, stderr=self.stderr)
+        return super().handle(**options)
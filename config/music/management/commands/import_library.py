@@ -0,0 +1,41 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music.library import LibraryImporter
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует аудиофайлы из каталога (рекурсивно): теги разбираются в пуле '
+        'процессов, артисты, альбомы и треки создаются пачками. Повторный запуск '
+        'обрабатывает только новые и изменённые файлы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Размер пула процессов')
+        parser.add_argument('--batch-size', type=int, default=500, help='Сколько файлов записывать в БД за одну транзакцию')
+        parser.add_argument('--chunksize', type=int, default=8, help='Сколько файлов отдавать процессу пула за раз')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Каталог не найден: {directory}')
+
+        importer = LibraryImporter(
+            processes=options['processes'], batch_size=options['batch_size'], chunksize=options['chunksize'],
+        )
+        stats = importer.run(directory)
+
+        for path, error in stats.errors:
+            self.stderr.write(f'{path}: {error}')
+        self.stdout.write(
+            f'Файлов: {stats.files}, без изменений: {stats.unchanged}, разобрано: {stats.scanned}\n'
+            f'Треков создано: {stats.created}, обновлено: {stats.updated}, дубликатов: {stats.duplicates}, '
+            f'ошибок: {len(stats.errors)}\n'
+            f'Новых артистов: {stats.artists}, альбомов: {stats.albums}'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {stats.elapsed:.1f} с ({stats.files_per_second:.0f} файлов/с)'
+        ))
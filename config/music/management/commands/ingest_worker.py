@@ -0,0 +1,50 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from music.ingest import claim_jobs, enqueue_missing, process_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Фоновый разбор загруженных аудиофайлов: длительность, битрейт, кодек, '
+        'частота дискретизации и встроенная обложка (очередь IngestJob)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Размер пула процессов')
+        parser.add_argument('--batch-size', type=int, default=20, help='Сколько задач забирать за раз')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Пауза (с), когда очередь пуста')
+        parser.add_argument('--stale-after', type=int, default=600, help='Через сколько секунд задача в running считается зависшей')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и выйти')
+        parser.add_argument('--enqueue-missing', action='store_true', help='Сначала поставить в очередь все ещё не разобранные треки')
+
+    def handle(self, *args, **options):
+        if options['enqueue_missing']:
+            self.stdout.write(f'Поставлено в очередь: {enqueue_missing()}')
+
+        total = 0
+        executor = ProcessPoolExecutor(max_workers=options['processes'])
+        try:
+            while True:
+                close_old_connections()
+                jobs = claim_jobs(options['batch_size'], options['stale_after'])
+                if jobs:
+                    done, broken = process_jobs(jobs, executor)
+                    total += done
+                    self.stdout.write(f'Разобрано {done} из {len(jobs)}')
+                    if broken:
+                        # Упавший процесс ломает пул насовсем: следующий submit бросил бы исключение
+                        self.stderr.write('Пул процессов сломан, создаю новый')
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        executor = ProcessPoolExecutor(max_workers=options['processes'])
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+        finally:
+            executor.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Готово: {total} файлов'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from music.models import Album, Artist, Song
+from music.search import build_search_text, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает search_text и перестраивает поисковый индекс каталога'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+
+        artists = list(Artist.objects.only('id', 'name'))
+        for artist in artists:
+            artist.search_text = build_search_text(artist.name)
+        Artist.objects.bulk_update(artists, ['search_text'], batch_size=500)
+        backend.rebuild(Artist)
+
+        for model in (Album, Song):
+            objects = list(model.objects.select_related('artist').only('id', 'title', 'artist__name'))
+            for obj in objects:
+                obj.search_text = build_search_text(obj.title, obj.artist.name)
+            model.objects.bulk_update(objects, ['search_text'], batch_size=500)
+            backend.rebuild(model)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс перестроен: {len(artists)} артистов, '
+            f'{Album.objects.count()} альбомов, {Song.objects.count()} треков'
+        ))
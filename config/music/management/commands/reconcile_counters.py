@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from music.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счётчики артистов и альбомов '
+        '(song_count, album_count, total_plays) и исправляет разошедшиеся'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено: {fixed["Artist"]} артистов, {fixed["Album"]} альбомов'
+        ))
@@ -0,0 +1,176 @@
+import datetime
+import math
+import random
+import struct
+import time
+import wave
+from collections import Counter
+from itertools import accumulate
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from music.models import Album, Artist, Favorite, PlayHistory, Song
+from music.counters import reconcile
+from music.page_cache import bump_catalog_version
+from music.search import build_search_text, get_backend
+
+ARTIST_PREFIX = 'Bench Artist'
+USER_PREFIX = 'bench_user_'
+AUDIO_DIR = 'songs/bench'
+SAMPLE_RATE = 8000
+
+# Слоги для названий: латиница и кириллица, чтобы поиск работал на обеих
+SYLLABLES = ['ла', 'ми', 'соль', 'ра', 'до', 'ночь', 'свет', 'sun', 'rain', 'blue', 'moon', 'fire', 'star', 'road']
+
+
+def _title(rng, words):
+    return ' '.join(rng.choice(SYLLABLES).capitalize() + rng.choice(SYLLABLES) for _ in range(words))
+
+
+def _write_tone(path, seconds, frequency):
+    """Короткий моно WAV с синусом — настоящий аудиофайл для stream_audio."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    frames = b''.join(
+        struct.pack('<h', int(8000 * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE)))
+        for i in range(int(seconds * SAMPLE_RATE))
+    )
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(frames)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическим каталогом для нагрузочного тестирования (см. команду benchmark)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artists', type=int, default=100)
+        parser.add_argument('--albums-per-artist', type=int, default=3)
+        parser.add_argument('--songs-per-album', type=int, default=10)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--plays', type=int, default=100000, help='Сколько строк PlayHistory создать')
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--audio-files', type=int, default=10, help='Сколько разных WAV-файлов сгенерировать (треки делят их между собой)')
+        parser.add_argument('--audio-seconds', type=float, default=2.0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--flush', action='store_true', help='Удалить ранее созданные синтетические данные и выйти')
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            self._flush()
+            return
+
+        rng = random.Random(options['seed'])
+        batch = options['batch_size']
+        started = time.perf_counter()
+
+        audio_names = []
+        for i in range(options['audio_files']):
+            name = f'{AUDIO_DIR}/tone_{i:03d}.wav'
+            _write_tone(Path(settings.MEDIA_ROOT) / name, options['audio_seconds'], 220 + 40 * i)
+            audio_names.append(name)
+        duration = datetime.timedelta(seconds=int(options['audio_seconds']))
+
+        offset = Artist.objects.filter(name__startswith=ARTIST_PREFIX).count()
+        artists = []
+        for i in range(options['artists']):
+            name = f'{ARTIST_PREFIX} {offset + i} {_title(rng, 1)}'
+            artists.append(Artist(name=name, search_text=build_search_text(name)))
+        artists = Artist.objects.bulk_create(artists, batch_size=batch)
+        self.stdout.write(f'Артисты: {len(artists)}')
+
+        albums = []
+        for artist in artists:
+            for _ in range(options['albums_per_artist']):
+                title = _title(rng, rng.randint(1, 3))
+                albums.append(Album(
+                    title=title, artist=artist,
+                    release_date=datetime.date(1970, 1, 1) + datetime.timedelta(days=rng.randrange(20000)),
+                    search_text=build_search_text(title, artist.name),
+                ))
+        albums = Album.objects.bulk_create(albums, batch_size=batch)
+        self.stdout.write(f'Альбомы: {len(albums)}')
+
+        # Популярность по Ципфу: несколько хитов и длинный хвост
+        song_specs = []
+        for album in albums:
+            for _ in range(options['songs_per_album']):
+                song_specs.append((album, _title(rng, rng.randint(1, 4))))
+        rng.shuffle(song_specs)
+        cum_weights = list(accumulate(1.0 / (rank + 1) for rank in range(len(song_specs))))
+        play_indices = rng.choices(range(len(song_specs)), cum_weights=cum_weights, k=options['plays']) if song_specs else []
+        play_counts = Counter(play_indices)
+
+        songs = [
+            Song(
+                title=title, artist=album.artist, album=album,
+                audio_file=rng.choice(audio_names), duration=duration,
+                plays=play_counts.get(i, 0),
+                search_text=build_search_text(title, album.artist.name),
+            )
+            for i, (album, title) in enumerate(song_specs)
+        ]
+        songs = Song.objects.bulk_create(songs, batch_size=batch)
+        self.stdout.write(f'Треки: {len(songs)}')
+
+        user_offset = User.objects.filter(username__startswith=USER_PREFIX).count()
+        password = make_password('bench-password')
+        users = User.objects.bulk_create([
+            User(username=f'{USER_PREFIX}{user_offset + i}', password=password)
+            for i in range(options['users'])
+        ], batch_size=batch)
+        self.stdout.write(f'Пользователи: {len(users)} (пароль bench-password)')
+
+        if users and songs:
+            favorites = []
+            for user in users:
+                for idx in set(rng.choices(range(len(songs)), cum_weights=cum_weights, k=options['favorites_per_user'])):
+                    favorites.append(Favorite(user=user, song=songs[idx]))
+            Favorite.objects.bulk_create(favorites, batch_size=batch, ignore_conflicts=True)
+            self.stdout.write(f'Лайки: {len(favorites)}')
+
+            now = timezone.now()
+            created = 0
+            for start in range(0, len(play_indices), batch):
+                rows = [
+                    PlayHistory(
+                        user=users[rng.randrange(len(users))], song=songs[idx],
+                        played_at=now - datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+                    )
+                    for idx in play_indices[start:start + batch]
+                ]
+                with transaction.atomic():
+                    PlayHistory.objects.bulk_create(rows, batch_size=batch)
+                created += len(rows)
+                self.stdout.write(f'Прослушивания: {created}/{len(play_indices)}', ending='\r')
+            self.stdout.write('')
+
+        # bulk_create обходит сигналы, поэтому поисковый индекс, счётчики и версию каталога обновляем явно
+        backend = get_backend()
+        for model in (Artist, Album, Song):
+            backend.rebuild(model)
+        reconcile()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def _flush(self):
+        users = User.objects.filter(username__startswith=USER_PREFIX)
+        artists = Artist.objects.filter(name__startswith=ARTIST_PREFIX)
+        user_count, artist_count = users.count(), artists.count()
+        users.delete()
+        artists.delete()
+        backend = get_backend()
+        for model in (Artist, Album, Song):
+            backend.rebuild(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено: {user_count} пользователей, {artist_count} артистов со всеми альбомами и треками'
+        ))
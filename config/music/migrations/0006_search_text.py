@@ -0,0 +1,78 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+from music.search import build_search_text
+
+SEARCH_TABLES = ['music_artist', 'music_album', 'music_song']
+
+
+def fill_search_text(apps, schema_editor):
+    Artist = apps.get_model('music', 'Artist')
+    Album = apps.get_model('music', 'Album')
+    Song = apps.get_model('music', 'Song')
+
+    artists = list(Artist.objects.all())
+    for artist in artists:
+        artist.search_text = build_search_text(artist.name)
+    Artist.objects.bulk_update(artists, ['search_text'], batch_size=500)
+
+    for model in (Album, Song):
+        objects = list(model.objects.select_related('artist').only('id', 'title', 'artist__name'))
+        for obj in objects:
+            obj.search_text = build_search_text(obj.title, obj.artist.name)
+        model.objects.bulk_update(objects, ['search_text'], batch_size=500)
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in SEARCH_TABLES:
+            schema_editor.execute(
+                f'CREATE INDEX {table}_search_trgm ON {table} USING gin (search_text gin_trgm_ops)'
+            )
+    elif vendor == 'sqlite':
+        for table in SEARCH_TABLES:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {table}_fts USING fts5(search_text, tokenize='unicode61')"
+            )
+            schema_editor.execute(
+                f'INSERT INTO {table}_fts (rowid, search_text) SELECT id, search_text FROM {table}'
+            )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in SEARCH_TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(f'DROP INDEX IF EXISTS {table}_search_trgm')
+        elif vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0005_make_album_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
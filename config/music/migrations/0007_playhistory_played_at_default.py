@@ -0,0 +1,19 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_search_text'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='playhistory',
+            name='played_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
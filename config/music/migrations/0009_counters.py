@@ -0,0 +1,75 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:52
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def _aggregate(queryset, key, aggregate):
+    subquery = queryset.filter(**{key: OuterRef('pk')}).order_by().values(key) \
+        .annotate(value=aggregate).values('value')
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Artist = apps.get_model('music', 'Artist')
+    Album = apps.get_model('music', 'Album')
+    Song = apps.get_model('music', 'Song')
+
+    Artist.objects.update(
+        song_count=_aggregate(Song.objects, 'artist', Count('pk')),
+        album_count=_aggregate(Album.objects, 'artist', Count('pk')),
+        total_plays=_aggregate(Song.objects, 'artist', Sum('plays')),
+    )
+    Album.objects.update(
+        song_count=_aggregate(Song.objects, 'album', Count('pk')),
+        total_plays=_aggregate(Song.objects, 'album', Sum('plays')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0008_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='song_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='album',
+            name='total_plays',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='album_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='song_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='total_plays',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-total_plays'], name='music_album_total_plays'),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['-song_count'], name='music_artist_song_count'),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['-total_plays'], name='music_artist_total_plays'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
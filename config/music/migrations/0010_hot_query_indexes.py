@@ -0,0 +1,49 @@
+# Generated by Django 4.2.25 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-release_date'], name='music_album_release'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['artist', '-release_date'], name='music_album_artist_release'),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at'], name='music_fav_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='playhistory',
+            index=models.Index(fields=['user', '-played_at'], name='music_ph_user_played'),
+        ),
+        migrations.AddIndex(
+            model_name='playhistory',
+            index=models.Index(fields=['user', 'song'], name='music_ph_user_song'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['-plays'], name='music_song_plays'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['-created_at'], name='music_song_created'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['artist', '-plays'], name='music_song_artist_plays'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['album', '-created_at'], name='music_song_album_created'),
+        ),
+    ]
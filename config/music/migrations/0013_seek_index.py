@@ -0,0 +1,22 @@
+# Generated by Django 4.2.25 on 2026-10-18 09:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_library_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeekIndex',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seek_index', serialize=False, to='music.song')),
+                ('kind', models.CharField(max_length=4)),
+                ('offsets', models.BinaryField()),
+            ],
+        ),
+    ]
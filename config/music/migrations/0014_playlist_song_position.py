@@ -0,0 +1,68 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSITION_STEP = 1024
+
+
+def fill_positions(apps, schema_editor):
+    """Прежний порядок — порядок добавления (id строки M2M)."""
+    PlaylistSong = apps.get_model('music', 'PlaylistSong')
+    batch = []
+    playlist_id, index = None, 0
+    for entry in PlaylistSong.objects.order_by('playlist_id', 'id').only('pk', 'playlist_id').iterator():
+        if entry.playlist_id != playlist_id:
+            playlist_id, index = entry.playlist_id, 0
+        index += 1
+        entry.position = index * POSITION_STEP
+        batch.append(entry)
+        if len(batch) >= 1000:
+            PlaylistSong.objects.bulk_update(batch, ['position'])
+            batch = []
+    PlaylistSong.objects.bulk_update(batch, ['position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0013_seek_index'),
+    ]
+
+    operations = [
+        # Автоматическая таблица M2M становится явной моделью без пересоздания:
+        # в состоянии — новая модель, в базе — та же music_playlist_songs
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PlaylistSong',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('playlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='music.playlist')),
+                        ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playlist_entries', to='music.song')),
+                    ],
+                    options={
+                        'db_table': 'music_playlist_songs',
+                        'unique_together': {('playlist', 'song')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='playlist',
+                    name='songs',
+                    field=models.ManyToManyField(blank=True, related_name='playlists', through='music.PlaylistSong', to='music.song'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='playlistsong',
+            name='position',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='playlistsong',
+            options={'ordering': ['playlist', 'position', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='playlistsong',
+            index=models.Index(fields=['playlist', 'position'], name='music_playlist_song_pos'),
+        ),
+    ]
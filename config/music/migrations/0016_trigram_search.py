@@ -0,0 +1,32 @@
+from django.db import migrations
+
+SEARCH_TABLES = ['music_artist', 'music_album', 'music_song']
+
+
+def _recreate(schema_editor, tokenizer):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {table}_fts USING fts5(search_text, tokenize='{tokenizer}')")
+        schema_editor.execute(f'INSERT INTO {table}_fts (rowid, search_text) SELECT id, search_text FROM {table}')
+
+
+def use_trigrams(apps, schema_editor):
+    # Подстрочный поиск, как LIKE по pg_trgm в Postgres
+    _recreate(schema_editor, 'trigram')
+
+
+def use_words(apps, schema_editor):
+    _recreate(schema_editor, 'unicode61')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_activity_time_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(use_trigrams, use_words),
+    ]
@@ -1,19 +1,38 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-import datetime
+
+from .images import image_url
+from .search import build_search_text
 
 class Artist(models.Model):
     name = models.CharField(max_length=200)
     bio = models.TextField(blank=True)
     image = models.ImageField(upload_to='artists/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    search_text = models.TextField(blank=True, default='', editable=False)
+    # Денормализованные счётчики, см. music/counters.py
+    song_count = models.PositiveIntegerField(default=0, editable=False)
+    album_count = models.PositiveIntegerField(default=0, editable=False)
+    total_plays = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    def get_cover(self, size=None, fmt='jpeg'):
+        """Фото артиста; size — один из music.images.COVER_SIZES"""
+        return image_url(self.image, size, fmt)
+
+    def save(self, *args, **kwargs):
+        self.search_text = build_search_text(self.name)
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['-song_count'], name='music_artist_song_count'),
+            models.Index(fields=['-total_plays'], name='music_artist_total_plays'),
+        ]
 
 class Album(models.Model):
     title = models.CharField(max_length=200)
@@ -21,12 +40,27 @@ class Album(models.Model):
     cover = models.ImageField(upload_to='albums/', blank=True, null=True)
     release_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    search_text = models.TextField(blank=True, default='', editable=False)
+    song_count = models.PositiveIntegerField(default=0, editable=False)
+    total_plays = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"{self.title} - {self.artist.name}"
 
+    def get_cover(self, size=None, fmt='jpeg'):
+        return image_url(self.cover, size, fmt)
+
+    def save(self, *args, **kwargs):
+        self.search_text = build_search_text(self.title, self.artist.name)
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-release_date']
+        indexes = [
+            models.Index(fields=['-total_plays'], name='music_album_total_plays'),
+            models.Index(fields=['-release_date'], name='music_album_release'),
+            models.Index(fields=['artist', '-release_date'], name='music_album_artist_release'),
+        ]
 
 class Song(models.Model):
     title = models.CharField(max_length=200)
@@ -37,17 +71,22 @@ class Song(models.Model):
     duration = models.DurationField(blank=True, null=True)
     plays = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    search_text = models.TextField(blank=True, default='', editable=False)
+    # Заполняются фоновым разбором файла (music/ingest.py)
+    bitrate = models.PositiveIntegerField(blank=True, null=True, editable=False)  # бит/с
+    codec = models.CharField(max_length=32, blank=True, default='', editable=False)
+    sample_rate = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    # SHA-256 содержимого файла, по нему import_library узнаёт уже загруженные треки
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False, db_index=True)
 
     def __str__(self):
         return f"{self.title} - {self.artist.name}"
     
-    def get_cover(self):
-        """Возвращает обложку трека или альбома"""
+    def get_cover(self, size=None, fmt='jpeg'):
+        """Возвращает обложку трека или альбома; size — один из music.images.COVER_SIZES"""
         if self.cover:
-            return self.cover.url
-        elif self.album.cover:  # album теперь всегда существует
-            return self.album.cover.url
-        return '/static/placeholder.png'
+            return image_url(self.cover, size, fmt)
+        return self.album.get_cover(size, fmt)  # album теперь всегда существует
     
     def get_stream_url(self):
         """Возвращает URL для стриминга с поддержкой Range requests"""
@@ -70,38 +109,56 @@ class Song(models.Model):
             return f"{minutes}:{seconds:02d}"
 
     def save(self, *args, **kwargs):
-        # First save to ensure file is stored and has a filesystem path
-        is_new = self.pk is None
+        # Новый трек или только что загруженный файл (ещё не записан в storage)
+        needs_ingest = self.pk is None or (self.audio_file and not self.audio_file._committed)
+        self.search_text = build_search_text(self.title, self.artist.name)
         super().save(*args, **kwargs)
-        # If duration not set, try to calculate from audio file
-        if not self.duration and self.audio_file:
-            try:
-                from mutagen import File as MutagenFile
-                audio = MutagenFile(self.audio_file.path)
-                length = getattr(getattr(audio, 'info', None), 'length', None)
-                if length:
-                    self.duration = datetime.timedelta(seconds=int(length))
-                    # avoid recursion depth; update only the duration field
-                    super(Song, self).save(update_fields=['duration'])
-            except Exception:
-                # silently ignore if mutagen fails; admin can edit later
-                pass
+        # Длительность, битрейт и обложку из файла достаёт фоновый воркер (ingest_worker)
+        if needs_ingest and self.audio_file:
+            from .ingest import enqueue
+            enqueue(self)
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-plays'], name='music_song_plays'),
+            models.Index(fields=['-created_at'], name='music_song_created'),
+            models.Index(fields=['artist', '-plays'], name='music_song_artist_plays'),
+            models.Index(fields=['album', '-created_at'], name='music_song_album_created'),
+        ]
 
 class Playlist(models.Model):
     name = models.CharField(max_length=200)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='playlists')
-    songs = models.ManyToManyField(Song, related_name='playlists', blank=True)
+    songs = models.ManyToManyField(Song, through='PlaylistSong', related_name='playlists', blank=True)
     cover = models.ImageField(upload_to='playlists/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.name} - {self.user.username}"
 
+    def get_cover(self, size=None, fmt='jpeg'):
+        return image_url(self.cover, size, fmt)
+
     class Meta:
         ordering = ['-created_at']
 
+
+class PlaylistSong(models.Model):
+    """Трек в плейлисте. Позиции разрежены (шаг music.playlists.POSITION_STEP), перенос трека — UPDATE одной строки"""
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE, related_name='entries')
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='playlist_entries')
+    position = models.BigIntegerField(default=0)
+
+    class Meta:
+        # Таблица осталась от автоматической M2M-таблицы Playlist.songs
+        db_table = 'music_playlist_songs'
+        unique_together = ['playlist', 'song']
+        ordering = ['playlist', 'position', 'id']
+        indexes = [models.Index(fields=['playlist', 'position'], name='music_playlist_song_pos')]
+
+    def __str__(self):
+        return f"{self.playlist_id}: {self.song_id} @ {self.position}"
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='favorited_by')
@@ -110,11 +167,90 @@ class Favorite(models.Model):
     class Meta:
         unique_together = ['user', 'song']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='music_fav_user_created'),
+            # Новые лайки с прошлого расчёта рекомендаций (recommendations.stale_user_ids)
+            models.Index(fields=['created_at'], name='music_fav_created'),
+        ]
 
 class PlayHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='play_history')
     song = models.ForeignKey(Song, on_delete=models.CASCADE)
-    played_at = models.DateTimeField(auto_now_add=True)
+    # default вместо auto_now_add: буфер прослушиваний пишет время события, а не сброса
+    played_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['-played_at']
+        indexes = [
+            models.Index(fields=['user', '-played_at'], name='music_ph_user_played'),
+            # Покрывающий для values_list('song_id') по пользователю (рекомендации)
+            models.Index(fields=['user', 'song'], name='music_ph_user_song'),
+            models.Index(fields=['played_at'], name='music_ph_played'),
+        ]
+
+
+class Recommendation(models.Model):
+    """Заранее посчитанная рекомендация для пользователя (см. music/recommendations.py)"""
+    SONG = 'song'
+    ARTIST = 'artist'
+    ALBUM = 'album'
+    KIND_CHOICES = [(SONG, 'Трек'), (ARTIST, 'Исполнитель'), (ALBUM, 'Альбом')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    kind = models.CharField(max_length=6, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    album = models.ForeignKey(Album, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['user', 'kind', 'rank']
+        indexes = [models.Index(fields=['user', 'kind', 'rank'], name='music_rec_user_kind_rank')]
+
+
+class IngestJob(models.Model):
+    """Задача фонового разбора загруженного аудиофайла (см. music/ingest.py)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'В очереди'), (RUNNING, 'Выполняется'), (DONE, 'Готово'), (FAILED, 'Ошибка')]
+
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='ingest_jobs')
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.song_id}: {self.status}"
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'], name='music_ingest_status_created')]
+
+
+class SeekIndex(models.Model):
+    """Таблица перемотки трека: смещение кадра на каждую секунду (см. music/seektable.py)"""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='seek_index')
+    kind = models.CharField(max_length=4)
+    offsets = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.song_id}: {self.kind}, {len(self.offsets) // 4} с"
+
+
+class LibraryFile(models.Model):
+    """Файл, импортированный командой import_library: по размеру и mtime повторный прогон его пропускает"""
+    path = models.CharField(max_length=1024, unique=True)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    content_hash = models.CharField(max_length=64)
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='library_files')
+    imported_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.path
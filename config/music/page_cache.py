@@ -0,0 +1,79 @@
+"""
+Кэш отрендеренных страниц каталога для анонимных пользователей.
+
+Для гостя ``home``, ``artist_detail`` и ``album_detail`` одинаковы у всех,
+поэтому готовый HTML кладётся в кэш ``PAGE_CACHE_ALIAS``. В ключ входит
+глобальная версия каталога: сигналы на Artist/Album/Song (music/signals.py)
+увеличивают её после коммита, и после правки в админке все старые страницы
+и фрагменты просто перестают находиться. Сама версия хранится в кэше ``default`` —
+он должен быть общим для всех воркеров (FileBasedCache или Redis), а
+страницы можно держать и в локальной памяти процесса.
+
+Фрагменты шаблонов кэшируются тегом ``{% cache %}`` с ``catalog_version``
+из контекст-процессора в качестве vary-аргумента.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+
+VERSION_KEY = 'music:catalog_version'
+UNCACHED_HEADERS = {'content-length', 'set-cookie'}
+
+
+def _pages():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Ключ мог вытесниться: стартуем с метки времени, чтобы не совпасть со старыми версиями
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def _page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'music:page:{catalog_version()}:{path}'
+
+
+def cache_anonymous_page(view):
+    """Отдаёт гостям GET-ответ из кэша; авторизованные всегда получают свежую страницу."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        key = _page_key(request)
+        cached = _pages().get(key)
+        if cached is not None:
+            content, headers = cached
+            response = HttpResponse(content)
+            for name, value in headers:
+                response[name] = value
+            return response
+
+        response = view(request, *args, **kwargs)
+        # Ответы с куками и с CSRF-токеном внутри (он у каждого свой) и ошибки не кэшируем
+        cacheable = (
+            response.status_code == 200 and not response.streaming
+            and not response.cookies and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        )
+        if cacheable:
+            # Заголовки вьюхи (Content-Type, Vary, Cache-Control и т. п.); длину HttpResponse посчитает сам
+            headers = [(name, value) for name, value in response.items() if name.lower() not in UNCACHED_HEADERS]
+            _pages().set(key, (response.content, headers), getattr(settings, 'PAGE_CACHE_TIMEOUT', 300))
+        return response
+    return wrapper
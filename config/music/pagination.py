@@ -0,0 +1,156 @@
+"""
+Keyset-пагинация (по курсору) для длинных списков треков.
+
+OFFSET заставляет базу прочитать и выбросить все строки до нужной
+страницы, поэтому глубокая страница избранного или плейлиста стоила тем
+дороже, чем дальше пролистали. Курсор — значения полей сортировки
+последней показанной строки; следующая страница начинается с условия
+``(created_at, id) < (курсор)`` по индексу и стоит одинаково на любой
+глубине.
+
+Последнее поле сортировки должно быть уникальным (обычно ``id``), иначе
+строки с одинаковым ключом на границе страниц потеряются. Поля не должны
+меняться между запросами: строка, у которой счётчик вроде ``plays``
+перескочил курсор, пропадёт или покажется дважды.
+"""
+import base64
+import binascii
+import datetime
+import json
+from dataclasses import dataclass
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+
+PAGE_SIZE = 50
+# Целые за пределами bigint база не примет (OverflowError при выполнении запроса)
+BIGINT_MIN, BIGINT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else v for v in values]
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Список значений или None, если курсор пустой или испорчен."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _value(obj, path):
+    for attr in path.split('__'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _field(model, path):
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def clean_cursor(model, ordering, values):
+    """
+    Значения курсора, приведённые к типам полей ordering, или None, если
+    курсор не годится для запроса: не тот тип, дата не разбирается, целое
+    не влезает в bigint. Queryset ленивый, поэтому проверять надо до filter().
+    """
+    cleaned = []
+    for field, value in zip(ordering, values):
+        if value is None or isinstance(value, (bool, list, dict)):
+            return None
+        try:
+            value = _field(model, field.lstrip('-')).to_python(value)
+        except (TypeError, ValueError, OverflowError, ValidationError):
+            return None
+        if isinstance(value, int) and not BIGINT_MIN <= value <= BIGINT_MAX:
+            return None
+        if isinstance(value, datetime.datetime) and settings.USE_TZ and timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        cleaned.append(value)
+    return cleaned
+
+
+def after(ordering, values):
+    """Q для строк строго после values в порядке ordering."""
+    conditions = []
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        equal = {f.lstrip('-'): v for f, v in zip(ordering[:i], values)}
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        conditions.append(Q(**equal, **{f'{name}__{lookup}': values[i]}))
+    return reduce(or_, conditions)
+
+
+@dataclass
+class Page:
+    items: list
+    next_cursor: str  # None на последней странице
+    start: int = 0  # сколько строк показано до этой страницы — для нумерации
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _start(request):
+    try:
+        return max(int(request.GET.get('start', 0)), 0)
+    except ValueError:
+        return 0
+
+
+def request_cursor(request, length):
+    """Значения курсора из ``?cursor=`` или None, если его нет или он не той длины."""
+    values = decode_cursor(request.GET.get('cursor'))
+    return values if values is not None and len(values) == length else None
+
+
+def make_page(request, items, page_size, key, continued):
+    """
+    Page из уже выбранных page_size + 1 строк: лишняя строка только
+    говорит, что дальше что-то есть. key(obj) — значения курсора строки.
+    """
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(key(items[-1]))
+    return Page(items, next_cursor, _start(request) if continued else 0)
+
+
+def paginate(request, queryset, ordering, page_size=PAGE_SIZE):
+    """Страница queryset после курсора из ``?cursor=``; испорченный курсор — первая страница."""
+    values = request_cursor(request, len(ordering))
+    if values is not None:
+        values = clean_cursor(queryset.model, ordering, values)
+    continued = values is not None
+    if continued:
+        queryset = queryset.filter(after(ordering, values))
+    items = list(queryset.order_by(*ordering)[:page_size + 1])
+    return make_page(
+        request, items, page_size, lambda obj: [_value(obj, field.lstrip('-')) for field in ordering], continued,
+    )
+
+
+def next_page_url(request, page):
+    """Адрес следующей страницы с теми же параметрами запроса (q и т. п.)."""
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    for key in ('partial', 'format'):
+        params.pop(key, None)
+    params['cursor'] = page.next_cursor
+    params['start'] = page.start + len(page.items)
+    return f'{request.path}?{params.urlencode()}'
@@ -0,0 +1,146 @@
+"""
+Порядок треков в плейлистах.
+
+У PlaylistSong разреженные позиции: новые треки встают в конец с шагом
+``POSITION_STEP``, а перенос трека — это середина между позициями новых
+соседей, т. е. UPDATE одной строки. Когда между соседями не остаётся
+места, плейлист перенумеровывается одним ``bulk_update`` (``renumber``);
+при шаге 1024 это случается после десятка переносов в одну и ту же щель.
+
+Массовые операции (``add_songs``, ``remove_songs``, ``reorder``, ``move``)
+выполняются в одной транзакции и стоят несколько запросов независимо от
+числа треков.
+"""
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .models import PlaylistSong, Song
+
+POSITION_STEP = 1024
+BULK_LIMIT = 5000
+
+
+def _spread(entries):
+    """Позиции с шагом POSITION_STEP в порядке entries; пишутся только изменившиеся строки."""
+    changed = []
+    for index, entry in enumerate(entries, start=1):
+        if entry.position != index * POSITION_STEP:
+            entry.position = index * POSITION_STEP
+            changed.append(entry)
+    PlaylistSong.objects.bulk_update(changed, ['position'], batch_size=1000)
+    return len(changed)
+
+
+def renumber(playlist):
+    """Раздаёт позиции заново, сохраняя текущий порядок."""
+    return _spread(PlaylistSong.objects.filter(playlist=playlist).order_by('position', 'id').only('pk', 'position'))
+
+
+@transaction.atomic
+def add_songs(playlist, song_ids):
+    """Добавляет треки в конец в переданном порядке, пропуская уже добавленные. Возвращает число новых."""
+    song_ids = list(dict.fromkeys(song_ids))
+    existing = set(
+        PlaylistSong.objects.filter(playlist=playlist, song_id__in=song_ids).values_list('song_id', flat=True)
+    )
+    known = set(Song.objects.filter(pk__in=song_ids).values_list('pk', flat=True))
+    new_ids = [pk for pk in song_ids if pk in known and pk not in existing]
+    if not new_ids:
+        return 0
+    last = PlaylistSong.objects.filter(playlist=playlist).aggregate(last=Max('position'))['last'] or 0
+    PlaylistSong.objects.bulk_create(
+        [
+            PlaylistSong(playlist=playlist, song_id=pk, position=last + index * POSITION_STEP)
+            for index, pk in enumerate(new_ids, start=1)
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,  # параллельный запрос мог добавить тот же трек
+    )
+    return len(new_ids)
+
+
+@transaction.atomic
+def remove_songs(playlist, song_ids):
+    """Убирает треки из плейлиста. Оставшиеся позиции не трогаются. Возвращает число удалённых."""
+    deleted, _ = PlaylistSong.objects.filter(playlist=playlist, song_id__in=list(song_ids)).delete()
+    return deleted
+
+
+def _gap(entries, anchor, after):
+    """Позиция соседа anchor с нужной стороны (0 или None, если соседа нет)."""
+    if after:
+        return entries.filter(position__gt=anchor.position).aggregate(next=Min('position'))['next']
+    return entries.filter(position__lt=anchor.position).aggregate(prev=Max('position'))['prev'] or 0
+
+
+def _move(playlist, entry, anchor, after=False):
+    """
+    Ставит entry перед anchor (или после него при after=True; anchor=None —
+    в конец), меняя позицию только у entry. Возвращает True, если пришлось
+    перенумеровать плейлист.
+    """
+    entries = PlaylistSong.objects.filter(playlist=playlist).exclude(pk=entry.pk)
+    if anchor is None:
+        last = entries.aggregate(last=Max('position'))['last'] or 0
+        position = last + POSITION_STEP
+        renumbered = False
+    else:
+        neighbour = _gap(entries, anchor, after)
+        renumbered = neighbour is not None and abs(anchor.position - neighbour) < 2
+        if renumbered:
+            # Щель кончилась: раздаём позиции заново и считаем ещё раз
+            renumber(playlist)
+            anchor.refresh_from_db(fields=['position'])
+            neighbour = _gap(entries, anchor, after)
+        if neighbour is None:
+            position = anchor.position + POSITION_STEP
+        else:
+            position = (anchor.position + neighbour) // 2
+    PlaylistSong.objects.filter(pk=entry.pk).update(position=position)
+    entry.position = position
+    return renumbered
+
+
+@transaction.atomic
+def move(playlist, moves):
+    """
+    moves — тройки (song_id, anchor_song_id, after): трек встаёт перед
+    anchor (после него при after), anchor=None — в конец. Применяются по
+    порядку. Возвращает число перенесённых треков.
+    """
+    moves = list(moves)
+    ids = {pk for song_id, anchor_id, _ in moves for pk in (song_id, anchor_id) if pk is not None}
+    entries = {
+        entry.song_id: entry
+        for entry in PlaylistSong.objects.select_for_update().filter(playlist=playlist, song_id__in=ids)
+    }
+    moved = 0
+    for song_id, anchor_id, after in moves:
+        entry = entries.get(song_id)
+        anchor = entries.get(anchor_id) if anchor_id is not None else None
+        if entry is None or (anchor_id is not None and anchor is None) or entry is anchor:
+            continue
+        if _move(playlist, entry, anchor, after):
+            positions = dict(
+                PlaylistSong.objects.filter(pk__in=[e.pk for e in entries.values()]).values_list('pk', 'position')
+            )
+            for other in entries.values():
+                other.position = positions[other.pk]
+        moved += 1
+    return moved
+
+
+@transaction.atomic
+def reorder(playlist, song_ids):
+    """
+    Новый порядок целиком: перечисленные треки идут первыми в этом порядке,
+    остальные — следом в прежнем. Пишутся только строки, чья позиция
+    изменилась. Возвращает их число.
+    """
+    order = {pk: index for index, pk in enumerate(dict.fromkeys(song_ids))}
+    entries = list(
+        PlaylistSong.objects.select_for_update().filter(playlist=playlist)
+        .order_by('position', 'id').only('pk', 'song_id', 'position')
+    )
+    entries.sort(key=lambda entry: order.get(entry.song_id, len(order)))  # sort устойчивый
+    return _spread(entries)
@@ -0,0 +1,153 @@
+"""
+Учёт прослушиваний.
+
+Счётчик ``Song.plays`` увеличивается атомарно через ``F()``, без
+read-modify-write. Если ``PLAY_BUFFER_SIZE`` > 0, события копятся в памяти
+воркера и сбрасываются пачкой: один ``bulk_create`` для PlayHistory и по
+одному ``UPDATE`` на каждую группу треков с одинаковым приростом.
+Вместе с треком растут и ``total_plays`` его артиста и альбома: при сбросе
+буфера — пачкой, без буфера (разработка) — в той же транзакции, что и
+трек. Во втором случае каждое прослушивание обновляет строку артиста, и
+под нагрузкой популярные артисты становятся горячими строками; от этого
+спасает буфер.
+Сброс происходит при заполнении буфера, по таймеру раз в
+``PLAY_BUFFER_INTERVAL`` секунд и при остановке воркера
+(``worker_exit`` в gunicorn_config.py, ``atexit`` для остальных случаев).
+Если запись не удалась, события возвращаются в буфер и сброс повторяется
+по таймеру.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import counters
+from .models import Album, Artist, PlayHistory, Song
+
+logger = logging.getLogger(__name__)
+
+PENDING_LIMIT = 100_000
+
+
+def buffer_size():
+    return getattr(settings, 'PLAY_BUFFER_SIZE', 0)
+
+
+def record_play_now(song_id, user_id=None):
+    """Записывает прослушивание сразу. Возвращает False, если трека нет."""
+    with transaction.atomic():
+        row = Song.objects.filter(pk=song_id).values_list('artist_id', 'album_id').first()
+        if row is None:
+            return False
+        artist_id, album_id = row
+        Song.objects.filter(pk=song_id).update(plays=F('plays') + 1)
+        counters._add(Artist, artist_id, total_plays=1)
+        counters._add(Album, album_id, total_plays=1)
+        if user_id is not None:
+            PlayHistory.objects.create(user_id=user_id, song_id=song_id)
+    return True
+
+
+class PlayBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._timer = None
+
+    def add(self, song_id, user_id=None):
+        with self._lock:
+            self._events.append((song_id, user_id, timezone.now()))
+            full = len(self._events) >= buffer_size()
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def _schedule(self):
+        # Вызывается под self._lock
+        if self._timer is None:
+            interval = getattr(settings, 'PLAY_BUFFER_INTERVAL', 5)
+            self._timer = threading.Timer(interval, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # У потока таймера своё соединение с БД, не оставляем его висеть
+            connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = self._events, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not events:
+            return 0
+        try:
+            write_plays(events)
+        except Exception:
+            # Возвращаем события в начало буфера и повторяем по таймеру; при долгой
+            # недоступности БД храним не больше PENDING_LIMIT, самые старые теряем
+            logger.exception('Не удалось записать %d прослушиваний, повторим позже', len(events))
+            with self._lock:
+                self._events[:0] = events
+                overflow = len(self._events) - PENDING_LIMIT
+                if overflow > 0:
+                    del self._events[:overflow]
+                    logger.error('Буфер прослушиваний переполнен, отброшено %d событий', overflow)
+                self._schedule()
+            return 0
+        return len(events)
+
+
+def write_plays(events):
+    """events — кортежи (song_id, user_id, played_at)."""
+    counts = Counter(song_id for song_id, _, _ in events)
+    rows = list(Song.objects.filter(pk__in=counts).values_list('pk', 'artist_id', 'album_id'))
+    existing = {row[0] for row in rows}
+
+    # Группируем треки по приросту: один UPDATE на каждое значение
+    by_increment = defaultdict(list)
+    for song_id, n in counts.items():
+        if song_id in existing:
+            by_increment[n].append(song_id)
+
+    history = [
+        PlayHistory(user_id=user_id, song_id=song_id, played_at=played_at)
+        for song_id, user_id, played_at in events
+        if user_id is not None and song_id in existing
+    ]
+    with transaction.atomic():
+        for n, song_ids in by_increment.items():
+            Song.objects.filter(pk__in=song_ids).update(plays=F('plays') + n)
+        counters.add_plays(rows, counts)
+        PlayHistory.objects.bulk_create(history, batch_size=500)
+
+
+_buffer = PlayBuffer()
+
+
+def record_play(song_id, user_id=None):
+    """
+    Учитывает прослушивание. В буферном режиме существование трека не
+    проверяется — несуществующие id отбрасываются при сбросе.
+    """
+    if buffer_size() > 0:
+        _buffer.add(song_id, user_id)
+        return True
+    return record_play_now(song_id, user_id)
+
+
+def flush_plays():
+    return _buffer.flush()
+
+
+atexit.register(flush_plays)
@@ -0,0 +1,91 @@
+"""
+Радио для джем-режима: очередь следующих треков пачкой.
+
+Раньше плеер в конце каждого трека спрашивал ``/api/similar-songs/`` про
+один следующий трек и исключал только текущий: каждый переход ждал
+запроса, а недавние треки повторялись. ``/api/radio/<id>/?n=20`` отдаёт
+сразу пачку — цепочку, в которой каждый трек похож на предыдущий по модели
+соседей (music/similarity.py). Где соседей нет, берутся треки того же
+альбома и исполнителя, затем случайные из пула (music/shuffle.py).
+
+Выданные треки запоминаются в сессии (``HISTORY_SIZE`` последних) и не
+повторяются. Ответ несёт подписанный токен продолжения: с ним следующая
+пачка продолжает цепочку с последнего трека, и плеер подгружает её в
+фоне, пока играет текущая.
+"""
+import random
+
+from django.core import signing
+from django.db.models import Q
+
+from . import shuffle, similarity
+from .models import Song
+
+HISTORY_KEY = 'radio_history'
+HISTORY_SIZE = 200
+MAX_BATCH = 50
+CATALOG_CANDIDATES = 100
+TOKEN_SALT = 'music.radio'
+TOKEN_MAX_AGE = 6 * 60 * 60
+
+
+def make_token(seed_id, last_id):
+    return signing.dumps({'seed': seed_id, 'last': last_id}, salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token, seed_id):
+    """id последнего выданного трека или None, если токен испорчен, устарел или от другого радио."""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if not isinstance(data, dict) or data.get('seed') != seed_id or not isinstance(data.get('last'), int):
+        return None
+    return data['last']
+
+
+def remember(history, ids):
+    """История сессии с новыми id: последние HISTORY_SIZE, без повторов."""
+    ids = list(dict.fromkeys(ids))
+    new = set(ids)
+    return ([pk for pk in history if pk not in new] + ids)[-HISTORY_SIZE:]
+
+
+def next_batch(start_id, count, exclude=()):
+    """
+    До count треков (с artist и album) после start_id или None, если
+    такого трека нет. Запросов к БД обычно три, сколько бы треков ни просили.
+    """
+    start = Song.objects.only('pk', 'artist_id', 'album_id').filter(pk=start_id).first()
+    if start is None:
+        return None
+    exclude = set(exclude)
+    exclude.add(start_id)
+
+    # Запасные кандидаты на случай, когда у трека нет соседей в модели
+    catalog = list(
+        Song.objects.filter(Q(album_id=start.album_id) | Q(artist_id=start.artist_id))
+        .exclude(pk__in=exclude).order_by('-plays').values_list('pk', flat=True)[:CATALOG_CANDIDATES]
+    )
+    random.shuffle(catalog)
+    pool = shuffle.get_pool()
+
+    ids = []
+    current = start_id
+    while len(ids) < count:
+        picked = similarity.sample_neighbors(current, exclude=exclude, count=1)
+        if picked:
+            pk = picked[0]
+        else:
+            while catalog and catalog[-1] in exclude:
+                catalog.pop()
+            pk = catalog.pop() if catalog else pool.sample(exclude=exclude, weighted=True)
+        if pk is None:
+            break
+        ids.append(pk)
+        exclude.add(pk)
+        current = pk
+
+    songs = Song.objects.select_related('artist', 'album').in_bulk(ids)
+    # Модель соседей и пул могут помнить уже удалённые треки
+    return [songs[pk] for pk in ids if pk in songs]
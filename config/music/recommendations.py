@@ -0,0 +1,197 @@
+"""
+Персональные рекомендации для главной страницы.
+
+Расчёт (compute_recommendations) тяжёлый: вся PlayHistory пользователя
+и несколько запросов по каталогу. Поэтому его результат складывается в таблицу
+Recommendation командой ``build_recommendations``, а главная читает её
+одним запросом (load_recommendations). Новому пользователю, для которого
+строк ещё нет, рекомендации считаются на лету — его история короткая,
+и расчёт по ней дешёвый — и сразу сохраняются. Если строк нет, а история
+длиннее ``LIVE_HISTORY_LIMIT``, главная показывает пустые рекомендации до
+ближайшего запуска команды.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .favorite_cache import get_favorite_ids
+from .models import Album, Artist, Favorite, PlayHistory, Recommendation, Song
+
+
+def compute_recommendations(user, favorite_ids=None):
+    """Возвращает (songs, artists, albums) для пользователя по его истории и лайкам."""
+    if favorite_ids is None:
+        favorite_ids = get_favorite_ids(user)
+
+    recommended_songs = []
+    recommended_artists = []
+    recommended_albums = []
+
+    # История одним запросом: прослушанные треки, их артисты и топ-3 артистов
+    history = list(PlayHistory.objects.filter(user=user).values_list('song_id', 'song__artist_id'))
+
+    if history:
+        artist_plays = Counter(artist_id for _, artist_id in history)
+        artist_ids = [artist_id for artist_id, _ in artist_plays.most_common(3)]
+
+        # Получаем ID треков, которые пользователь уже слушал
+        listened_song_ids = {song_id for song_id, _ in history}
+        
+        # 1. Рекомендуем ТРЕКИ этих артистов, которые пользователь ещё не слушал
+        recommended_songs = Song.objects.select_related('artist', 'album').filter(
+            artist_id__in=artist_ids
+        ).exclude(
+            id__in=listened_song_ids
+        ).order_by('-plays')[:6]
+        
+        # Если рекомендаций мало, добавляем популярные треки
+        if len(recommended_songs) < 6:
+            additional = Song.objects.select_related('artist', 'album').filter(
+                artist_id__in=artist_ids
+            ).exclude(
+                id__in=list(listened_song_ids) + [s.id for s in recommended_songs]
+            ).order_by('-created_at')[:6 - len(recommended_songs)]
+            recommended_songs = list(recommended_songs) + list(additional)
+        
+        # 2. Рекомендуем ИСПОЛНИТЕЛЕЙ (похожих по жанру или популярных)
+        # Исключаем артистов, которых пользователь уже слушает
+        recommended_artists = Artist.objects.exclude(
+            id__in=list(artist_plays)
+        ).filter(
+            song_count__gte=2  # Только артисты с 2+ треками
+        ).order_by('-song_count')[:6]
+        
+        # 3. Рекомендуем АЛЬБОМЫ этих артистов или популярные альбомы
+        recommended_albums = Album.objects.select_related('artist').filter(
+            artist_id__in=artist_ids
+        ).exclude(
+            id__in=PlayHistory.objects.filter(user=user).values_list('song__album_id', flat=True)
+        ).order_by('-release_date')[:6]
+        
+        # Если альбомов мало, добавляем новые популярные альбомы
+        if len(recommended_albums) < 6:
+            additional_albums = Album.objects.select_related('artist').exclude(
+                id__in=[a.id for a in recommended_albums]
+            ).order_by('-release_date')[:6 - len(recommended_albums)]
+            recommended_albums = list(recommended_albums) + list(additional_albums)
+    
+    # Если нет истории прослушиваний, используем любимые треки
+    if not recommended_songs and favorite_ids:
+        # Получаем артистов из любимых треков
+        favorite_artists = Song.objects.filter(
+            id__in=favorite_ids
+        ).values_list('artist_id', flat=True).distinct()
+        
+        if favorite_artists:
+            # Рекомендуем другие треки этих артистов
+            recommended_songs = Song.objects.select_related('artist', 'album').filter(
+                artist_id__in=favorite_artists
+            ).exclude(
+                id__in=favorite_ids
+            ).order_by('-plays')[:6]
+            
+            # Рекомендуем других исполнителей
+            recommended_artists = Artist.objects.exclude(
+                id__in=favorite_artists
+            ).filter(song_count__gte=2).order_by('-song_count')[:6]
+            
+            # Рекомендуем альбомы
+            recommended_albums = Album.objects.select_related('artist').filter(
+                artist_id__in=favorite_artists
+            ).order_by('-release_date')[:6]
+
+    return list(recommended_songs), list(recommended_artists), list(recommended_albums)
+
+
+def load_recommendations(user):
+    """Читает посчитанные рекомендации одним запросом. None — если их нет."""
+    rows = Recommendation.objects.filter(user=user).select_related(
+        'song__artist', 'song__album', 'artist', 'album__artist',
+    )
+    songs, artists, albums = [], [], []
+    for row in rows:
+        if row.kind == Recommendation.SONG:
+            songs.append(row.song)
+        elif row.kind == Recommendation.ARTIST:
+            artists.append(row.artist)
+        else:
+            albums.append(row.album)
+    if not (songs or artists or albums):
+        return None
+    return songs, artists, albums
+
+
+def store_recommendations(user, songs, artists, albums):
+    now = timezone.now()
+    rows = [
+        Recommendation(user=user, kind=Recommendation.SONG, rank=rank, song=song, created_at=now)
+        for rank, song in enumerate(songs)
+    ] + [
+        Recommendation(user=user, kind=Recommendation.ARTIST, rank=rank, artist=artist, created_at=now)
+        for rank, artist in enumerate(artists)
+    ] + [
+        Recommendation(user=user, kind=Recommendation.ALBUM, rank=rank, album=album, created_at=now)
+        for rank, album in enumerate(albums)
+    ]
+    with transaction.atomic():
+        Recommendation.objects.filter(user=user).delete()
+        Recommendation.objects.bulk_create(rows)
+
+
+def refresh_recommendations(user):
+    result = compute_recommendations(user)
+    store_recommendations(user, *result)
+    return result
+
+
+# Больше прослушиваний — расчёт уже не для запроса главной, его сделает команда
+LIVE_HISTORY_LIMIT = 200
+
+
+def get_recommendations(user):
+    """
+    Посчитанные рекомендации; без них — расчёт на лету для короткой истории
+    (с сохранением, чтобы следующий запрос снова был одним SELECT).
+    """
+    stored = load_recommendations(user)
+    if stored is not None:
+        return stored
+    if PlayHistory.objects.filter(user=user)[LIVE_HISTORY_LIMIT:LIVE_HISTORY_LIMIT + 1].exists():
+        return [], [], []
+    return refresh_recommendations(user)
+
+
+LAST_BUILD_KEY = 'music:recommendations:last_build'
+
+
+def last_build():
+    """Время начала прошлого запуска build_recommendations или None."""
+    return cache.get(LAST_BUILD_KEY)
+
+
+def mark_built(started_at):
+    cache.set(LAST_BUILD_KEY, started_at, None)
+
+
+def stale_user_ids(since=None):
+    """
+    Пользователи, которые слушали или лайкали что-то после последнего расчёта.
+    since — нижняя граница по времени активности: с ней читаются только
+    новые строки по индексам на played_at/created_at, а не вся история.
+    """
+    active = {}
+    for model, field in ((PlayHistory, 'played_at'), (Favorite, 'created_at')):
+        rows = model.objects.all()
+        if since is not None:
+            rows = rows.filter(**{f'{field}__gt': since})
+        for user_id, at in rows.order_by().values('user').annotate(at=Max(field)).values_list('user', 'at'):
+            if at and (user_id not in active or at > active[user_id]):
+                active[user_id] = at
+    built = Recommendation.objects.all()
+    if since is not None:
+        built = built.filter(user__in=list(active))
+    built = dict(built.order_by().values('user').annotate(at=Max('created_at')).values_list('user', 'at'))
+    return [user_id for user_id, at in active.items() if user_id not in built or at > built[user_id]]
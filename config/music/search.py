@@ -0,0 +1,206 @@
+"""
+Поиск по каталогу.
+
+У Song, Artist и Album есть колонка ``search_text`` — заранее приведённый
+к нижнему регистру (casefold) текст, по которому ищем. Сам поиск делает
+бэкенд из настройки ``SEARCH_BACKEND``:
+
+* ``PostgresSearchBackend`` — ``LIKE`` по GIN-индексу pg_trgm,
+  ранжирование через ``word_similarity``;
+* ``SQLiteSearchBackend`` — FTS5-таблицы ``<db_table>_fts`` с токенизатором
+  trigram для разработки.
+
+Оба бэкенда ищут одинаково: каждое слово запроса — подстрока search_text
+(«олнце» находит «Солнце»), различается только ранжирование.
+
+Страницы листаются курсором (music/pagination.py): у каждого найденного
+объекта есть ``search_rank``, и ``after=[rank, pk]`` продолжает выдачу
+сразу после такого объекта без OFFSET.
+"""
+import math
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q, Value
+from django.utils.module_loading import import_string
+
+_WORD_RE = re.compile(r'\w+')
+# Короче трёх символов триграммный индекс не ищет — такие слова проверяются через LIKE
+TRIGRAM = 3
+BIGINT_MAX = 2 ** 63 - 1
+
+
+def normalize(text):
+    """Приводит строку к виду, в котором она хранится в search_text."""
+    if not text:
+        return ''
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+def build_search_text(*parts):
+    return normalize(' '.join(p for p in parts if p))
+
+
+def clean_cursor(values):
+    """[rank, pk] из курсора поиска как (float, int) или None, если его нельзя передать в запрос."""
+    if values is None or len(values) != 2:
+        return None
+    rank, pk = values
+    if isinstance(rank, bool) or not isinstance(rank, (int, float)) or not math.isfinite(rank):
+        return None
+    if isinstance(pk, bool) or not isinstance(pk, int) or not 0 < pk <= BIGINT_MAX:
+        return None
+    return float(rank), pk
+
+
+def _like(token):
+    return '%' + token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class WordSimilarity(Func):
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+
+class SearchBackend:
+    """Базовый бэкенд: подстрочный поиск по search_text без ранжирования."""
+
+    def search(self, queryset, query, limit=20, after=None):
+        tokens = _WORD_RE.findall(normalize(query))
+        if not tokens:
+            return []
+        qs = queryset
+        for token in tokens:
+            qs = qs.filter(search_text__contains=token)
+        qs = self.rank(qs, normalize(query))
+        if after is not None:
+            qs = qs.filter(self.after(*after))
+        return list(qs[:limit])
+
+    def rank(self, queryset, query):
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).order_by('-pk')
+
+    def after(self, rank, pk):
+        return Q(pk__lt=pk)
+
+    @staticmethod
+    def cursor(obj):
+        return [obj.search_rank, obj.pk]
+
+    def index(self, model, items):
+        """items — пары (pk, search_text) изменённых объектов."""
+
+    def unindex(self, model, pks):
+        pass
+
+    def rebuild(self, model):
+        pass
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Использует индекс ``gin (search_text gin_trgm_ops)`` из миграции 0006."""
+
+    def rank(self, queryset, query):
+        return queryset.annotate(
+            search_rank=WordSimilarity(Value(query), F('search_text')),
+        ).order_by('-search_rank', '-pk')
+
+    def after(self, rank, pk):
+        return Q(search_rank__lt=rank) | Q(search_rank=rank, pk__lt=pk)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 с токенизатором trigram: слово запроса от трёх символов ищется как
+    подстрока по индексу (MATCH), более короткие — через LIKE по той же
+    таблице. Без MATCH ранга bm25 нет, и все находки получают 0.
+    """
+
+    def _table(self, model):
+        return f'{model._meta.db_table}_fts'
+
+    def search(self, queryset, query, limit=20, after=None):
+        tokens = _WORD_RE.findall(normalize(query))
+        if not tokens:
+            return []
+        table = self._table(queryset.model)
+        indexed = [t for t in tokens if len(t) >= TRIGRAM]
+        conditions, params = [], []
+        if indexed:
+            conditions.append(f'{table} MATCH %s')
+            params.append(' '.join('"%s"' % t.replace('"', '""') for t in indexed))
+        for token in tokens:
+            if len(token) < TRIGRAM:
+                conditions.append("search_text LIKE %s ESCAPE '\\'")
+                params.append(_like(token))
+        # bm25() — то же, что rank, но его можно сравнивать в WHERE
+        score = f'bm25({table})' if indexed else '0.0'
+        if after is not None:
+            rank, pk = after
+            conditions.append(f'({score} > %s OR ({score} = %s AND rowid < %s))')
+            params += [rank, rank, pk]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, {score} AS score FROM {table} WHERE {" AND ".join(conditions)} '
+                f'ORDER BY score, rowid DESC LIMIT %s',
+                [*params, limit],
+            )
+            ranks = dict(cursor.fetchall())
+        objects = queryset.in_bulk(ranks)
+        found = []
+        for pk, rank in ranks.items():
+            if pk in objects:
+                objects[pk].search_rank = rank
+                found.append(objects[pk])
+        return found
+
+    def index(self, model, items):
+        items = list(items)
+        if not items:
+            return
+        table = self._table(model)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk, _ in items])
+            cursor.executemany(f'INSERT INTO {table} (rowid, search_text) VALUES (%s, %s)', items)
+
+    def unindex(self, model, pks):
+        table = self._table(model)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk in pks])
+
+    def rebuild(self, model):
+        table = self._table(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(
+                f'INSERT INTO {table} (rowid, search_text) '
+                f'SELECT id, search_text FROM {model._meta.db_table}'
+            )
+
+
+_DEFAULT_BACKENDS = {
+    'postgresql': 'music.search.PostgresSearchBackend',
+    'sqlite': 'music.search.SQLiteSearchBackend',
+}
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    path = getattr(settings, 'SEARCH_BACKEND', None) or _DEFAULT_BACKENDS.get(
+        connection.vendor, 'music.search.SearchBackend'
+    )
+    return import_string(path)()
+
+
+def reindex_artist(artist):
+    """После переименования артиста пересчитывает search_text его треков и альбомов."""
+    from .models import Album, Song
+
+    for model, related in ((Song, artist.songs), (Album, artist.albums)):
+        objects = list(related.only('id', 'title'))
+        for obj in objects:
+            obj.search_text = build_search_text(obj.title, artist.name)
+        model.objects.bulk_update(objects, ['search_text'], batch_size=500)
+        get_backend().index(model, [(obj.pk, obj.search_text) for obj in objects])
@@ -0,0 +1,118 @@
+"""
+Случайный выбор трека без ``order_by('?')``.
+
+В памяти процесса лежит массив id всех треков (``array('q')``) и, для
+режима «с учётом популярности», массив накопленных весов. Выбор — это
+``random.choice`` или ``bisect`` по накопленным весам, цена не зависит от
+размера каталога. Сигналы при добавлении/удалении треков помечают массив
+устаревшим, кроме того он перестраивается раз в ``SHUFFLE_POOL_TTL``
+секунд, чтобы подхватывать изменения из других воркеров и свежие счётчики
+прослушиваний. Синхронно строится только первый массив: устаревший
+перестраивается в фоновом потоке, а запросы тем временем выбирают из старого.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз пробуем случайный id, прежде чем честно отфильтровать исключения
+_MAX_ATTEMPTS = 8
+
+
+class SongPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ids = array('q')
+        self.cum_weights = array('d')
+        self.built_at = None
+        self.stale = False
+
+    def build(self):
+        from .models import Song
+
+        # Сбрасываем до чтения: invalidate() во время построения вызовет ещё одно
+        self.stale = False
+        ids = array('q')
+        weights = []
+        for pk, plays in Song.objects.order_by('pk').values_list('pk', 'plays').iterator():
+            ids.append(pk)
+            # Логарифм, чтобы хиты не вытесняли остальной каталог
+            weights.append(1.0 + math.log1p(max(plays, 0)))
+        with self._lock:
+            self.ids = ids
+            self.cum_weights = array('d', accumulate(weights))
+            self.built_at = time.monotonic()
+
+    def invalidate(self):
+        self.stale = True
+
+    def _pick(self, weighted):
+        ids, cum = self.ids, self.cum_weights
+        if not weighted:
+            return ids[random.randrange(len(ids))]
+        i = bisect_right(cum, random.random() * cum[-1])
+        return ids[min(i, len(ids) - 1)]
+
+    def sample(self, exclude=(), weighted=False):
+        """Случайный id трека не из exclude или None, если выбирать не из чего."""
+        with self._lock:
+            if not self.ids:
+                return None
+            for _ in range(_MAX_ATTEMPTS):
+                pk = self._pick(weighted)
+                if pk not in exclude:
+                    return pk
+            # Исключено почти всё — выбираем из оставшегося явно
+            rest = [pk for pk in self.ids if pk not in exclude]
+        return random.choice(rest) if rest else None
+
+
+_pool = SongPool()
+_build_lock = threading.Lock()
+
+
+def get_pool():
+    ttl = getattr(settings, 'SHUFFLE_POOL_TTL', 300)
+    built_at = _pool.built_at
+    if built_at is None:
+        with _build_lock:
+            if _pool.built_at is None:
+                _pool.build()
+    elif _pool.stale or (ttl and time.monotonic() - built_at > ttl):
+        _rebuild_in_background()
+    return _pool
+
+
+def _rebuild_in_background():
+    # Занятый замок — перестройка уже идёт
+    if not _build_lock.acquire(blocking=False):
+        return
+
+    def rebuild():
+        try:
+            _pool.build()
+        except Exception:
+            logger.exception('Не удалось перестроить пул случайных треков')
+        finally:
+            _build_lock.release()
+            # У фонового потока своё соединение с БД, не оставляем его висеть
+            connections.close_all()
+
+    try:
+        threading.Thread(target=rebuild, daemon=True).start()
+    except Exception:
+        _build_lock.release()
+        raise
+
+
+def invalidate():
+    _pool.invalidate()
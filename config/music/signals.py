@@ -0,0 +1,153 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import auth_cache, counters, favorite_cache, images, page_cache, shuffle, suggest
+from .models import Album, Artist, Favorite, Playlist, Song
+from .search import get_backend, reindex_artist
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Album)
+def index_search_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'search_text' not in update_fields:
+        return
+    get_backend().index(sender, [(instance.pk, instance.search_text)])
+
+
+@receiver(pre_save, sender=Artist)
+def remember_artist_name(sender, instance, update_fields=None, **kwargs):
+    """Имя до сохранения: треки и альбомы переиндексируются, только если оно изменилось."""
+    instance._previous_name = None
+    if instance.pk is not None and (not update_fields or 'name' in update_fields):
+        instance._previous_name = Artist.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Artist)
+def index_artist(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and 'name' not in update_fields and 'search_text' not in update_fields:
+        return
+    get_backend().index(Artist, [(instance.pk, instance.search_text)])
+    previous = getattr(instance, '_previous_name', None)
+    if not created and previous is not None and previous != instance.name:
+        reindex_artist(instance)
+
+
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+def unindex_search_text(sender, instance, **kwargs):
+    get_backend().unindex(sender, [instance.pk])
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+def update_suggest_index(sender, instance, **kwargs):
+    if not suggest.is_built():
+        return
+    index = suggest.get_index()
+    if sender is Song:
+        index.update(suggest.SONG, instance.pk, instance.title,
+                     (instance.title, instance.artist_id, instance.album_id))
+    elif sender is Album:
+        index.update(suggest.ALBUM, instance.pk, instance.title,
+                     (instance.title, instance.artist_id))
+    else:
+        index.update(suggest.ARTIST, instance.pk, instance.name, instance.name)
+
+
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+def remove_from_suggest_index(sender, instance, **kwargs):
+    if not suggest.is_built():
+        return
+    kind = {Song: suggest.SONG, Album: suggest.ALBUM, Artist: suggest.ARTIST}[sender]
+    suggest.get_index().remove(kind, instance.pk)
+
+
+@receiver(post_save, sender=Song)
+def add_to_shuffle_pool(sender, instance, created, **kwargs):
+    if created:
+        shuffle.invalidate()
+
+
+@receiver(post_delete, sender=Song)
+def remove_from_shuffle_pool(sender, instance, **kwargs):
+    shuffle.invalidate()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_favorites(sender, instance, **kwargs):
+    # После коммита: иначе параллельный запрос успеет положить в кэш ещё старый набор
+    transaction.on_commit(partial(favorite_cache.invalidate, instance.user_id))
+
+
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Artist)
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Album)
+@receiver(post_delete, sender=Artist)
+def bump_catalog_version(sender, instance, **kwargs):
+    # До коммита гость мог бы закэшировать страницу со старыми данными уже под новой версией
+    transaction.on_commit(page_cache.bump_catalog_version)
+
+
+@receiver(pre_save, sender=Song)
+@receiver(pre_save, sender=Album)
+def remember_previous_state(sender, instance, update_fields=None, **kwargs):
+    """Запоминает артиста/альбом/прослушивания до сохранения, чтобы перенести счётчики."""
+    instance._counter_state = None
+    if instance.pk is None or (update_fields and not {'artist', 'album', 'plays'} & set(update_fields)):
+        return
+    if sender is Song:
+        instance._counter_state = Song.objects.filter(pk=instance.pk) \
+            .values_list('artist_id', 'album_id', 'plays').first()
+    else:
+        instance._counter_state = Album.objects.filter(pk=instance.pk) \
+            .values_list('artist_id', flat=True).first()
+
+
+@receiver(post_save, sender=Song)
+def update_song_counters(sender, instance, created, **kwargs):
+    counters.song_saved(instance, created, getattr(instance, '_counter_state', None))
+
+
+@receiver(post_delete, sender=Song)
+def decrement_song_counters(sender, instance, **kwargs):
+    counters.song_deleted(instance)
+
+
+@receiver(post_save, sender=Album)
+def update_album_counters(sender, instance, created, **kwargs):
+    counters.album_saved(instance, created, getattr(instance, '_counter_state', None))
+
+
+@receiver(post_delete, sender=Album)
+def decrement_album_counters(sender, instance, **kwargs):
+    counters.album_deleted(instance)
+
+
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Album)
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Playlist)
+def build_cover_derivatives(sender, instance, update_fields=None, **kwargs):
+    field = 'image' if sender is Artist else 'cover'
+    if update_fields and field not in update_fields:
+        return
+    images.ensure_derivatives(getattr(instance, field))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Пароль, is_active и флаги прав лежат в строке пользователя. После коммита:
+    # иначе параллельный запрос успеет положить в кэш старую строку
+    transaction.on_commit(partial(auth_cache.invalidate, instance.pk))
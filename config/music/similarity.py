@@ -0,0 +1,155 @@
+"""
+Модель похожих треков для джем-режима.
+
+``build_similarity`` строит разреженную матрицу совместной встречаемости
+треков по PlayHistory, Favorite и плейлистам, нормирует её по косинусу и
+оставляет для каждого трека top-K соседей. Результат — один .npy-файл
+со структурированным массивом (id, neighbors, weights), отсортированным
+по id. Воркеры открывают его через ``mmap_mode='r'``, так что в памяти
+он один на все процессы, а поиск соседей — это ``searchsorted`` по id.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+# Веса сигналов при построении матрицы
+PLAY_WEIGHT = 1.0
+FAVORITE_WEIGHT = 2.0
+PLAYLIST_WEIGHT = 1.0
+
+_RELOAD_CHECK_INTERVAL = 30
+
+
+def model_path():
+    return Path(getattr(settings, 'SIMILARITY_MODEL_PATH', settings.BASE_DIR / 'similarity' / 'songs.npy'))
+
+
+def _row_dtype(k):
+    return np.dtype([('id', '<i8'), ('neighbors', '<i8', (k,)), ('weights', '<f4', (k,))])
+
+
+def build_model(k=50):
+    """Считает таблицу соседей и атомарно записывает её в model_path()."""
+    from scipy import sparse
+
+    from .models import Favorite, Playlist, PlayHistory, Song
+
+    song_ids = np.fromiter(Song.objects.order_by('pk').values_list('pk', flat=True).iterator(), dtype=np.int64)
+    n = len(song_ids)
+    if n == 0:
+        return 0
+
+    def basket_matrix(pairs, weight):
+        """pairs — (корзина, song_id); корзина — id пользователя или плейлиста."""
+        pairs = np.fromiter((v for pair in pairs for v in pair), dtype=np.int64).reshape(-1, 2)
+        cols = np.minimum(np.searchsorted(song_ids, pairs[:, 1]), n - 1)
+        # Треки, удалённые во время построения, пропускаем
+        known = song_ids[cols] == pairs[:, 1]
+        rows, cols = pairs[known, 0], cols[known]
+        data = np.full(len(rows), weight, dtype=np.float32)
+        # Повторы (несколько прослушиваний) суммируются при переводе COO в CSR
+        return sparse.coo_matrix((data, (rows, cols)), shape=(rows.max() + 1 if len(rows) else 0, n)).tocsr()
+
+    def same_rows(*matrices):
+        height = max(m.shape[0] for m in matrices)
+        return [sparse.vstack([m, sparse.csr_matrix((height - m.shape[0], n), dtype=np.float32)])
+                for m in matrices]
+
+    plays = basket_matrix(PlayHistory.objects.values_list('user_id', 'song_id').iterator(), PLAY_WEIGHT)
+    favorites = basket_matrix(Favorite.objects.values_list('user_id', 'song_id').iterator(), FAVORITE_WEIGHT)
+    playlists = basket_matrix(
+        Playlist.songs.through.objects.values_list('playlist_id', 'song_id').iterator(), PLAYLIST_WEIGHT,
+    )
+
+    # Прослушивания и лайки одного пользователя — одна корзина
+    plays, favorites = same_rows(plays, favorites)
+    users = (plays + favorites).tocsr()
+    users.data = np.log1p(users.data)
+    baskets = sparse.vstack([users, playlists]).tocsr()
+    co = (baskets.T @ baskets).tocsr()
+
+    # Косинусная нормировка: популярные треки не должны быть соседями всех подряд
+    norms = np.sqrt(co.diagonal())
+    norms[norms == 0] = 1.0
+    inv = sparse.diags(1.0 / norms)
+    co = (inv @ co @ inv).tocsr()
+    co.setdiag(0)
+    co.eliminate_zeros()
+
+    # top-K всех строк разом: элементы CSR сортируются по (строка, -вес),
+    # место элемента в своей строке — смещение от indptr
+    table = np.zeros(n, dtype=_row_dtype(k))
+    table['id'] = song_ids
+    rows = np.repeat(np.arange(n), np.diff(co.indptr))
+    order = np.lexsort((-co.data, rows))
+    rows = rows[order]
+    rank = np.arange(len(order)) - co.indptr[rows]
+    top = rank < k
+    rows, rank, order = rows[top], rank[top], order[top]
+    table['neighbors'][rows, rank] = song_ids[co.indices[order]]
+    table['weights'][rows, rank] = co.data[order]
+
+    path = model_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp, path)
+    return n
+
+
+class _ModelCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.table = None
+        self.mtime = None
+        self.checked_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if now - self.checked_at < _RELOAD_CHECK_INTERVAL:
+            return self.table
+        with self._lock:
+            self.checked_at = now
+            try:
+                mtime = os.stat(model_path()).st_mtime
+            except OSError:
+                self.table, self.mtime = None, None
+                return None
+            if mtime != self.mtime:
+                self.table = np.load(model_path(), mmap_mode='r')
+                self.mtime = mtime
+        return self.table
+
+
+_cache = _ModelCache()
+
+
+def neighbors(song_id):
+    """Список (song_id, вес) соседей трека, пустой если модели или трека в ней нет."""
+    table = _cache.get()
+    if table is None or not len(table):
+        return []
+    i = int(np.searchsorted(table['id'], song_id))
+    if i >= len(table) or table['id'][i] != song_id:
+        return []
+    row = table[i]
+    return [(int(pk), float(w)) for pk, w in zip(row['neighbors'], row['weights']) if w > 0]
+
+
+def sample_neighbors(song_id, exclude=(), count=1):
+    """Случайные соседи с вероятностью, пропорциональной весу, без повторов."""
+    exclude = set(exclude)
+    candidates = [(pk, w) for pk, w in neighbors(song_id) if pk not in exclude]
+    picked = []
+    while candidates and len(picked) < count:
+        (pk, _), = random.choices(candidates, weights=[w for _, w in candidates])
+        picked.append(pk)
+        candidates = [c for c in candidates if c[0] != pk]
+    return picked
@@ -0,0 +1,217 @@
+"""
+Отдача аудиофайлов из Python, когда X-Accel-Redirect не настроен.
+
+Файл читается кусками по ``AUDIO_STREAM_CHUNK_SIZE`` байт, поэтому память на
+поток постоянна при любой длине трека. Поддерживаются суффиксные диапазоны
+(``bytes=-500``), несколько диапазонов (multipart/byteranges), 416 для
+невыполнимых диапазонов, ETag/Last-Modified, If-None-Match/If-Modified-Since
+и If-Range.
+
+Под ASGI (``asynchronous=True``) те же ответы отдаются асинхронными
+итераторами, а чтение файла уходит в пул потоков через
+``asyncio.to_thread`` и не блокирует event loop.
+
+Для перемотки по ``?t=`` (music/seektable.py) отдаётся не весь файл, а
+виртуальный ресурс: короткий заголовок ``prefix`` и кусок файла
+``[start, end)``. Range-запросы считаются от начала этого ресурса.
+"""
+import asyncio
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+_RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+# Больше диапазонов в одном запросе плееру не нужно, а разбирать их дорого
+MAX_RANGES = 16
+
+
+def chunk_size():
+    return getattr(settings, 'AUDIO_STREAM_CHUNK_SIZE', 64 * 1024)
+
+
+def parse_range(header, size):
+    """
+    Разбирает заголовок Range.
+
+    Возвращает список (start, end) включительно, пустой список, если ни один
+    диапазон не попадает в файл (-> 416), или None, если заголовок нужно
+    проигнорировать и отдать файл целиком.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = _RANGE_SPEC_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            # bytes=-N: последние N байт
+            length = int(last)
+            if length == 0 or size == 0:
+                # У пустого файла нет ни одного байта, который можно отдать
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+    return ranges
+
+
+def file_iterator(path, start, length, block=None):
+    block = block or chunk_size()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(block, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+async def afile_iterator(path, start, length, block=None):
+    block = block or chunk_size()
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            data = await asyncio.to_thread(f.read, min(block, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _segments_iterator(path, segments, block):
+    """segments — куски ответа: bytes как есть или (start, end) из файла."""
+    for segment in segments:
+        if isinstance(segment, bytes):
+            yield segment
+        else:
+            start, end = segment
+            yield from file_iterator(path, start, end - start + 1, block)
+
+
+async def _asegments_iterator(path, segments, block):
+    for segment in segments:
+        if isinstance(segment, bytes):
+            yield segment
+        else:
+            start, end = segment
+            async for data in afile_iterator(path, start, end - start + 1, block):
+                yield data
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # Слабый ETag в If-Range не годится (RFC 9110, 13.1.5)
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(last_modified) == date
+
+
+def _virtual_segments(prefix, start, first, last):
+    """Куски для байтов [first, last] виртуального ресурса prefix + файл[start:]."""
+    segments = []
+    if first < len(prefix):
+        segments.append(prefix[first:last + 1])
+    if last >= len(prefix):
+        begin = max(first, len(prefix)) - len(prefix) + start
+        segments.append((begin, last - len(prefix) + start))
+    return segments
+
+
+def serve_file(request, path, content_type, asynchronous=False, start=0, end=None, prefix=b''):
+    stat = os.stat(path)
+    end = stat.st_size if end is None else min(end, stat.st_size)
+    size = len(prefix) + max(end - start, 0)
+    last_modified = stat.st_mtime
+    etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+    if start or end != stat.st_size or prefix:
+        etag = '"%x-%x-%x-%x"' % (stat.st_mtime_ns, stat.st_size, start, end)
+    whole_file = size == stat.st_size and not prefix
+    block = chunk_size()
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def stream(segments, **kwargs):
+        if asynchronous:
+            content = _asegments_iterator(path, segments, block)
+        else:
+            content = _segments_iterator(path, segments, block)
+        return StreamingHttpResponse(content, **kwargs)
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if conditional is not None:
+        return finish(conditional)
+
+    ranges = parse_range(request.META.get('HTTP_RANGE', ''), size)
+    if ranges is not None and not _if_range_matches(request, etag, last_modified):
+        ranges = None
+
+    if ranges is None:
+        if asynchronous or not whole_file:
+            # FileResponse под ASGI вычитал бы файл в память целиком
+            response = stream(_virtual_segments(prefix, start, 0, size - 1) if size else [], content_type=content_type)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+        return finish(response)
+
+    if not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        response = stream(_virtual_segments(prefix, start, first, last), status=206, content_type=content_type)
+        response['Content-Length'] = str(last - first + 1)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        return finish(response)
+
+    boundary = uuid.uuid4().hex
+    segments = []
+    for first, last in ranges:
+        segments.append((
+            f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Range: bytes {first}-{last}/{size}\r\n\r\n'
+        ).encode())
+        segments.extend(_virtual_segments(prefix, start, first, last))
+        segments.append(b'\r\n')
+    segments.append(f'--{boundary}--\r\n'.encode())
+    length = sum(len(seg) if isinstance(seg, bytes) else seg[1] - seg[0] + 1 for seg in segments)
+
+    response = stream(segments, status=206, content_type=f'multipart/byteranges; boundary={boundary}')
+    response['Content-Length'] = str(length)
+    return finish(response)
@@ -0,0 +1,142 @@
+"""
+Префиксный индекс для подсказок в строке поиска.
+
+Индекс живёт в памяти процесса: отсортированный список кортежей
+``(ключ, вид, id)``, где ключ — нормализованное название, начиная с каждого
+его слова (так «солнце» находит «Звезда по имени Солнце»). Поиск — это
+``bisect`` по префиксу, база данных при этом не трогается.
+
+Строится лениво при первом обращении и обновляется сигналами из
+``music.signals``. Сигналы видит только тот воркер, где произошло
+сохранение, поэтому раз в ``SUGGEST_INDEX_TTL`` секунд индекс
+перестраивается целиком; ``invalidate()`` вызывает перестройку при
+следующем обращении.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .search import normalize
+
+SONG = 'song'
+ARTIST = 'artist'
+ALBUM = 'album'
+
+# Порядок видов в выдаче при равных прочих
+_KIND_ORDER = {ARTIST: 0, SONG: 1, ALBUM: 2}
+_SCAN_LIMIT = 200
+
+
+def _keys(text):
+    words = normalize(text).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._keys = {}
+        self.artists = {}   # id -> name
+        self.songs = {}     # id -> (title, artist_id, album_id)
+        self.albums = {}    # id -> (title, artist_id)
+        self.built_at = None
+
+    def build(self):
+        from .models import Album, Artist, Song
+
+        artists = dict(Artist.objects.values_list('id', 'name'))
+        songs = {
+            pk: (title, artist_id, album_id)
+            for pk, title, artist_id, album_id
+            in Song.objects.values_list('id', 'title', 'artist_id', 'album_id').iterator()
+        }
+        albums = {
+            pk: (title, artist_id)
+            for pk, title, artist_id in Album.objects.values_list('id', 'title', 'artist_id')
+        }
+        entries = []
+        keys = {}
+        for kind, items in ((ARTIST, ((pk, name) for pk, name in artists.items())),
+                            (SONG, ((pk, v[0]) for pk, v in songs.items())),
+                            (ALBUM, ((pk, v[0]) for pk, v in albums.items()))):
+            for pk, text in items:
+                item_keys = _keys(text)
+                keys[kind, pk] = item_keys
+                entries.extend((key, kind, pk) for key in item_keys)
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._keys = keys
+            self.artists, self.songs, self.albums = artists, songs, albums
+            self.built_at = time.monotonic()
+
+    def invalidate(self):
+        self.built_at = None
+
+    def _remove_locked(self, kind, pk):
+        for key in self._keys.pop((kind, pk), ()):
+            i = bisect_left(self._entries, (key, kind, pk))
+            if i < len(self._entries) and self._entries[i] == (key, kind, pk):
+                del self._entries[i]
+
+    def update(self, kind, pk, text, data):
+        with self._lock:
+            self._remove_locked(kind, pk)
+            item_keys = _keys(text)
+            self._keys[kind, pk] = item_keys
+            for key in item_keys:
+                insort(self._entries, (key, kind, pk))
+            self._store(kind)[pk] = data
+
+    def remove(self, kind, pk):
+        with self._lock:
+            self._remove_locked(kind, pk)
+            self._store(kind).pop(pk, None)
+
+    def _store(self, kind):
+        return {ARTIST: self.artists, SONG: self.songs, ALBUM: self.albums}[kind]
+
+    def lookup(self, query, limit=8):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = {}
+        with self._lock:
+            entries = self._entries
+            i = bisect_left(entries, (prefix,))
+            end = min(len(entries), i + _SCAN_LIMIT)
+            while i < end and entries[i][0].startswith(prefix):
+                key, kind, pk = entries[i]
+                # Совпадение с начала названия важнее совпадения со слова в середине
+                is_start = self._keys[kind, pk][0] == key
+                if found.get((kind, pk)) is not True:
+                    found[kind, pk] = is_start
+                i += 1
+        ranked = sorted(found.items(), key=lambda item: (not item[1], _KIND_ORDER[item[0][0]]))
+        return [kind_pk for kind_pk, _ in ranked[:limit]]
+
+
+_index = PrefixIndex()
+_build_lock = threading.Lock()
+
+
+def get_index():
+    ttl = getattr(settings, 'SUGGEST_INDEX_TTL', 600)
+    built_at = _index.built_at
+    if built_at is None or (ttl and time.monotonic() - built_at > ttl):
+        with _build_lock:
+            if _index.built_at is built_at:
+                _index.build()
+    return _index
+
+
+def is_built():
+    return _index.built_at is not None
+
+
+def invalidate():
+    _index.invalidate()
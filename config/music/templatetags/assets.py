@@ -0,0 +1,20 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from music.assets import BUNDLES, bundle_path
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    {% bundle 'app.js' %} — <script> или <link> на собранный бандл; при DEBUG —
+    на каждый исходник, чтобы не пересобирать после каждой правки.
+    """
+    paths = BUNDLES[name] if settings.DEBUG else [bundle_path(name)]
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((static(p),) for p in paths))
+    return format_html_join('\n', '<script src="{}"></script>', ((static(p),) for p in paths))
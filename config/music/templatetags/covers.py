@@ -0,0 +1,31 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from music.images import retina_size
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover_url(obj, size=None, fmt='jpeg'):
+    """{% cover_url song 640 %} — URL обложки нужного размера (для data-cover и JS)."""
+    return obj.get_cover(size, fmt)
+
+
+@register.simple_tag
+def cover(obj, size, **attrs):
+    """
+    {% cover album 200 alt=album.title class="card-image" %} — <picture> с WebP
+    и JPEG-запасным вариантом, 1x/2x в srcset и ленивой загрузкой.
+    """
+    retina = retina_size(size)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    return format_html(
+        '<picture class="cover"><source type="image/webp" srcset="{} 1x, {} 2x">'
+        '<img src="{}" srcset="{} 1x, {} 2x"{}></picture>',
+        obj.get_cover(size, 'webp'), obj.get_cover(retina, 'webp'),
+        obj.get_cover(size), obj.get_cover(size), obj.get_cover(retina),
+        flatatt(attrs),
+    )
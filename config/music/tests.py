@@ -1,3 +1,1718 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import wave
+from concurrent.futures.process import BrokenProcessPool
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import (
+    assets, async_views, auth_cache, images, ingest, page_cache, playlists as playlist_ops, plays, radio,
+    recommendations, search, seektable, shuffle, similarity, suggest, views,
+)
+from .favorite_cache import get_favorite_ids
+from .auth_cache import CachedAuthenticationMiddleware
+from .models import Album, Artist, Favorite, IngestJob, LibraryFile, PlayHistory, Playlist, PlaylistSong, Recommendation, Song
+from .pagination import decode_cursor, encode_cursor
+from .recommendations import compute_recommendations
+from .streaming import _virtual_segments, parse_range, serve_file
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN для запросов, которые на самом деле выполняют вьюхи music.views
+    и расчёт рекомендаций: запросы перехватываются CaptureQueriesContext.
+
+    Каталог достаточно большой, чтобы планировщику было из чего выбирать;
+    тест падает, если какой-то запрос снова читает таблицу целиком.
+    """
+    ARTISTS = 50
+    ALBUMS_PER_ARTIST = 4
+    SONGS_PER_ALBUM = 10
+    USERS = 20
+    PLAYS_PER_USER = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        artists = Artist.objects.bulk_create(
+            Artist(name=f'Artist {i}', song_count=i) for i in range(cls.ARTISTS)
+        )
+        albums = Album.objects.bulk_create(
+            Album(title=f'Album {a.pk}-{j}', artist=a, song_count=cls.SONGS_PER_ALBUM,
+                  release_date=datetime.date(2000, 1, 1) + datetime.timedelta(days=a.pk * 10 + j))
+            for a in artists for j in range(cls.ALBUMS_PER_ARTIST)
+        )
+        songs = Song.objects.bulk_create(
+            Song(title=f'Song {album.pk}-{k}', artist=album.artist, album=album,
+                 audio_file='songs/test.mp3', plays=(album.pk * 7 + k) % 97)
+            for album in albums for k in range(cls.SONGS_PER_ALBUM)
+        )
+        users = User.objects.bulk_create(User(username=f'user{i}') for i in range(cls.USERS))
+        now = timezone.now()
+        PlayHistory.objects.bulk_create(
+            PlayHistory(user=user, song=songs[(u * 31 + n * 17) % len(songs)],
+                        played_at=now - datetime.timedelta(minutes=n))
+            for u, user in enumerate(users) for n in range(cls.PLAYS_PER_USER)
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=user, song=songs[(u * 13 + n * 29) % len(songs)])
+            for u, user in enumerate(users) for n in range(60)
+        )
+        playlists = Playlist.objects.bulk_create(Playlist(user=user, name='Mix') for user in users)
+        PlaylistSong.objects.bulk_create(
+            PlaylistSong(playlist=playlist, song=songs[(p * 11 + n * 7) % len(songs)], position=(n + 1) * 1024)
+            for p, playlist in enumerate(playlists) for n in range(60)
+        )
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = users[0]
+        cls.playlist = playlists[0]
+        cls.artist = artists[len(artists) // 2]
+        cls.album = albums[len(albums) // 2]
+        cls.song = songs[len(songs) // 2]
+
+    def setUp(self):
+        # Иначе страницы, лайки и пользователь придут из кэша и запросов не будет
+        caches['default'].clear()
+        page_cache._pages().clear()
+        self.client.force_login(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # На маленьких таблицах Postgres честно выберет Seq Scan; проверяем, что индексный путь есть
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                return plan, re.findall(r'Seq Scan on (\w+)', plan)
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            return plan, re.findall(r'\bSCAN (\w+)\s*$', plan, re.MULTILINE)
+
+    def assertIndexedQueries(self, run):
+        """Выполняет run() и проверяет план каждого SELECT по таблицам каталога. Возвращает результат run()."""
+        with CaptureQueriesContext(connection) as queries:
+            result = run()
+        selects = [q['sql'] for q in queries if q['sql'].lstrip().upper().startswith('SELECT') and '"music_' in q['sql']]
+        self.assertTrue(selects, 'Не выполнено ни одного запроса к каталогу')
+        for sql in selects:
+            plan, scans = self.explain(sql)
+            self.assertFalse(scans, f'Полный проход по {", ".join(scans)}:\n{sql}\n{plan}')
+        return result
+
+    def get(self, name, *args, **params):
+        response = self.assertIndexedQueries(lambda: self.client.get(reverse(name, args=args), params))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def next_page(self, name, *args, **params):
+        """Первая страница в JSON, затем EXPLAIN для запросов страницы после её курсора."""
+        cursor = self.client.get(reverse(name, args=args), {'format': 'json', **params}).json()['next_cursor']
+        self.assertIsNotNone(cursor)
+        return self.get(name, *args, cursor=cursor, partial=1, **params)
+
+    def test_home(self):
+        self.get('home')
+
+    def test_search(self):
+        self.get('search', q='song')
+        self.next_page('search', q='song')
+
+    def test_artist_detail(self):
+        self.get('artist_detail', self.artist.pk)
+        self.next_page('artist_detail', self.artist.pk)
+
+    def test_album_detail(self):
+        self.get('album_detail', self.album.pk)
+
+    def test_favorites(self):
+        self.get('favorites')
+        self.next_page('favorites')
+
+    def test_playlist_detail(self):
+        self.get('playlist_detail', self.playlist.pk)
+        self.next_page('playlist_detail', self.playlist.pk)
+
+    def test_similar_songs(self):
+        self.get('similar_songs', self.song.pk)
+
+    def test_songs_batch(self):
+        self.get('songs_batch', ids=f'{self.song.pk},{self.song.pk + 1}')
+
+    def test_recommendations(self):
+        self.assertIndexedQueries(lambda: compute_recommendations(self.user))
+
+
+def _content(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+class TempFileMixin:
+    """Временный файл с заданными байтами, удаляется после теста."""
+
+    def make_file(self, data, suffix='.bin'):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self.addCleanup(os.remove, path)
+        return path
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_single_and_open_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse_range('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse_range('bytes=900-5000', 1000), [(900, 999)])
+
+    def test_suffix_ranges(self):
+        self.assertEqual(parse_range('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_range('bytes=-5000', 1000), [(0, 999)])
+        self.assertEqual(parse_range('bytes=-0', 1000), [])
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range('bytes=1000-', 1000), [])
+        self.assertEqual(parse_range('bytes=0-', 0), [])
+        self.assertEqual(parse_range('bytes=-10', 0), [])
+
+    def test_ignored_headers(self):
+        for header in ('', 'items=0-1', 'bytes=', 'bytes=-', 'bytes=5-1', 'bytes=a-b',
+                       'bytes=' + ','.join(['0-1'] * 17)):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+    def test_multiple_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9, 20-29,-5', 100), [(0, 9), (20, 29), (95, 99)])
+        self.assertEqual(parse_range('bytes=0-9,500-', 100), [(0, 9)])
+
+
+class ServeFileTests(TempFileMixin, SimpleTestCase):
+    DATA = bytes(range(256)) * 40
+
+    def setUp(self):
+        self.path = self.make_file(self.DATA)
+        self.factory = RequestFactory()
+
+    def serve(self, **headers):
+        return serve_file(self.factory.get('/', **headers), self.path, 'audio/mpeg')
+
+    def test_whole_file(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.DATA)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(_content(response), self.DATA)
+
+    def test_single_range(self):
+        response = self.serve(HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.DATA)}')
+        self.assertEqual(_content(response), self.DATA[100:200])
+
+    def test_unsatisfiable_range(self):
+        response = self.serve(HTTP_RANGE=f'bytes={len(self.DATA)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.DATA)}')
+
+    def test_empty_file_suffix_range(self):
+        path = self.make_file(b'')
+        response = serve_file(self.factory.get('/', HTTP_RANGE='bytes=-500'), path, 'audio/mpeg')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_multiple_ranges(self):
+        response = self.serve(HTTP_RANGE='bytes=0-9,-10')
+        self.assertEqual(response.status_code, 206)
+        boundary = response['Content-Type'].split('boundary=')[1]
+        body = _content(response)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[-1], b'--\r\n')
+        self.assertIn(f'Content-Range: bytes 0-9/{len(self.DATA)}'.encode(), parts[1])
+        self.assertTrue(parts[1].endswith(b'\r\n\r\n' + self.DATA[:10] + b'\r\n'))
+        self.assertTrue(parts[2].endswith(self.DATA[-10:] + b'\r\n'))
+
+    def test_if_none_match(self):
+        etag = self.serve()['ETag']
+        response = self.serve(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.serve(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.serve()['Last-Modified']
+        self.assertEqual(self.serve(HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.assertEqual(self.serve(HTTP_IF_MODIFIED_SINCE=http_date(0)).status_code, 200)
+
+    def test_if_range(self):
+        etag = self.serve()['ETag']
+        self.assertEqual(self.serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+        # Файл изменился: вместо куска отдаётся он весь
+        response = self.serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(_content(response), self.DATA)
+
+
+def _mp3_file(frames, id3_size=20):
+    """MPEG-1 Layer III, 128 кбит/с, 44100 Гц: кадры по 417 байт с нулевыми данными."""
+    tag = b'ID3\x04\x00\x00' + bytes([0, 0, 0, id3_size]) + b'\0' * id3_size
+    return tag + (b'\xff\xfb\x90\x00' + b'\0' * 413) * frames
+
+
+def _flac_frame_header(number):
+    """Заголовок кадра: блок 4096 сэмплов, 44100 Гц, стерео, 16 бит, CRC-8."""
+    header = b'\xff\xf8\xc9\x18' + bytes([number])
+    return header + bytes([seektable._crc8(header)])
+
+
+def _flac_file(frames, padding=0):
+    streaminfo = bytearray(34)
+    streaminfo[0:2] = streaminfo[2:4] = (4096).to_bytes(2, 'big')
+    streaminfo[10:18] = ((44100 << 44) | (1 << 41) | (15 << 36) | frames * 4096).to_bytes(8, 'big')
+    streaminfo[18:34] = b'\x5a' * 16
+    blocks = bytes([0x80 if not padding else 0x00]) + (34).to_bytes(3, 'big') + bytes(streaminfo)
+    if padding:
+        blocks += b'\x01' + padding.to_bytes(3, 'big') + b'\0' * padding + b'\x81\0\0\x04' + b'\0' * 4
+    # Ложный синхрокод внутри данных первого кадра таблица пропускает
+    body = b''.join(_flac_frame_header(n) + (b'\xff\xf8\x00\x00\x00\x00' if n == 0 else b'') + b'\0' * 1000
+                    for n in range(frames))
+    return b'fLaC' + blocks + body
+
+
+def _wav_file(data_size, list_size=0):
+    """PCM 8000 Гц, стерео, 16 бит (byte rate 32000); LIST-чанк перед данными."""
+    fmt = b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 2, 8000, 32000, 4, 16)
+    listing = b'LIST' + struct.pack('<I', list_size) + b'\0' * list_size if list_size else b''
+    data = b'data' + struct.pack('<I', data_size) + bytes(i % 251 for i in range(data_size))
+    chunks = fmt + listing + data
+    return b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE' + chunks
+
+
+class SeekTableTests(TempFileMixin, SimpleTestCase):
+    def offsets(self, data, kind, suffix):
+        built = seektable.build_seek_table(self.make_file(data, suffix))
+        self.assertEqual(built[0], kind)
+        table = built[1]
+        return [seektable.offset_at(table, second)[0] for second in range(len(table) // 4)]
+
+    def test_mp3_table(self):
+        # 100 кадров по 1152 сэмпла = 2,6 секунды; точка i — кадр с сэмплом i * 44100
+        offsets = self.offsets(_mp3_file(100), seektable.MP3, '.mp3')
+        self.assertEqual(offsets, [30 + (i * 44100 // 1152) * 417 for i in range(3)])
+
+    def test_flac_table(self):
+        data = _flac_file(30)
+        audio = data.index(_flac_frame_header(0))
+        frame = len(_flac_frame_header(0)) + 1000
+        offsets = self.offsets(data, seektable.FLAC, '.flac')
+        self.assertEqual(offsets, [audio, audio + 10 * frame + 6, audio + 21 * frame + 6])
+
+    def test_wav_table(self):
+        data = _wav_file(80000, list_size=70000)
+        start = data.index(b'data') + 8
+        offsets = self.offsets(data, seektable.WAV, '.wav')
+        self.assertEqual(offsets, [start, start + 32000, start + 64000])
+
+    def test_unsupported_and_empty_files(self):
+        self.assertIsNone(seektable.build_seek_table(self.make_file(b'not audio at all')))
+        self.assertIsNone(seektable.build_seek_table(self.make_file(b'')))
+
+    def test_offset_at_clamps(self):
+        table = seektable.pack([10, 20, 30])
+        self.assertEqual(seektable.offset_at(table, 1.5), (20, 1))
+        self.assertEqual(seektable.offset_at(table, 99), (30, 2))
+
+    def test_mp3_region_has_no_prefix(self):
+        path = self.make_file(_mp3_file(10), '.mp3')
+        self.assertEqual(seektable.stream_region(seektable.MP3, path, 447), (b'', 447, None))
+
+    def test_flac_region_header(self):
+        # STREAMINFO берётся из файла даже за 64 КБ метаданных
+        data = _flac_file(30, padding=70000)
+        offset = data.index(_flac_frame_header(10))
+        prefix, start, end = seektable.stream_region(seektable.FLAC, self.make_file(data, '.flac'), offset)
+        self.assertEqual((start, end), (offset, None))
+        self.assertEqual(prefix[:8], b'fLaC\x80\x00\x00\x22')
+        self.assertEqual(prefix[8:21], data[8:21])  # размеры блоков и кадров, частота
+        self.assertEqual(prefix[21] & 0xF0, data[21] & 0xF0)  # каналы и битность
+        self.assertEqual(prefix[22:42], b'\0' * 20)  # длина и MD5 неизвестны
+        self.assertEqual(len(prefix), 42)
+
+    def test_wav_region_is_valid_file(self):
+        data = _wav_file(80000, list_size=70000)
+        path = self.make_file(data, '.wav')
+        offset = data.index(b'data') + 8 + 32000
+        prefix, start, end = seektable.stream_region(seektable.WAV, path, offset)
+        self.assertEqual((start, end), (offset, len(data)))
+        with wave.open(io.BytesIO(prefix + data[start:end])) as sliced:
+            self.assertEqual(sliced.getframerate(), 8000)
+            self.assertEqual(sliced.getnframes(), 48000 // 4)
+            self.assertEqual(sliced.readframes(2), data[offset:offset + 8])
+
+    def test_virtual_segments(self):
+        self.assertEqual(_virtual_segments(b'HEAD', 100, 0, 1), [b'HE'])
+        self.assertEqual(_virtual_segments(b'HEAD', 100, 2, 6), [b'AD', (100, 102)])
+        self.assertEqual(_virtual_segments(b'HEAD', 100, 5, 9), [(101, 105)])
+        self.assertEqual(_virtual_segments(b'', 100, 0, 9), [(100, 109)])
+
+    def test_serve_sliced_resource(self):
+        data = _wav_file(80000)
+        path = self.make_file(data, '.wav')
+        offset = data.index(b'data') + 8 + 32000
+        prefix, start, end = seektable.stream_region(seektable.WAV, path, offset)
+        resource = prefix + data[start:end]
+        factory = RequestFactory()
+
+        def serve(**headers):
+            return serve_file(factory.get('/', **headers), path, 'audio/wav', start=start, end=end, prefix=prefix)
+
+        response = serve()
+        self.assertEqual(response['Content-Length'], str(len(resource)))
+        self.assertEqual(_content(response), resource)
+        # Range считается от начала виртуального ресурса и захватывает стык заголовка и данных
+        first, last = len(prefix) - 4, len(prefix) + 9
+        response = serve(HTTP_RANGE=f'bytes={first}-{last}')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes {first}-{last}/{len(resource)}')
+        self.assertEqual(_content(response), resource[first:last + 1])
+
+        etag = response['ETag']
+        whole = serve_file(factory.get('/'), path, 'audio/wav')['ETag']
+        self.assertNotEqual(etag, whole)
+        self.assertNotEqual(etag, serve_file(factory.get('/'), path, 'audio/wav', start=offset + 4, end=end,
+                                             prefix=prefix)['ETag'])
+        self.assertEqual(serve(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=whole).status_code, 200)
+
+
+class ArtistPageTests(TestCase):
+    SONGS = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=cls.artist, release_date=datetime.date(2020, 1, 1))
+        cls.songs = Song.objects.bulk_create(
+            Song(title=f'Song {i}', artist=cls.artist, album=album, audio_file=f'songs/{i}.mp3', plays=i)
+            for i in range(cls.SONGS)
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        page_cache._pages().clear()
+        self.url = reverse('artist_detail', args=[self.artist.pk])
+
+    def json_page(self, **params):
+        response = self.client.get(self.url, {'format': 'json', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_full_page(self):
+        response = self.client.get(self.url)
+        self.assertEqual([s.pk for s in response.context['popular']], [s.pk for s in self.songs[::-1][:10]])
+        self.assertEqual(len(response.context['songs']), 10)
+        self.assertContains(response, f'id="artist-{self.artist.pk}-popular"')
+        self.assertIsNotNone(response.context['next_url'])
+
+    def test_json_pages_survive_play_count_changes(self):
+        seen = []
+        data = self.json_page()
+        self.assertNotIn('popular', data)
+        while True:
+            seen += [song['id'] for song in data['songs']]
+            # Прослушивания между запросами не сдвигают границу страницы
+            Song.objects.filter(pk__in=[s.pk for s in self.songs[:5]]).update(plays=1000)
+            if not data['next_cursor']:
+                break
+            data = self.json_page(cursor=data['next_cursor'])
+        self.assertEqual(sorted(seen), sorted(s.pk for s in self.songs))
+
+    def test_partial_page(self):
+        cursor = self.json_page()['next_cursor']
+        response = self.client.get(self.url, {'cursor': cursor, 'start': 10, 'partial': 1})
+        body = response.content.decode()
+        self.assertNotIn('<html', body)
+        self.assertNotIn('popular', response.context)
+        self.assertEqual(body.count('class="song-item"'), 10)
+        self.assertIn('<span class="song-number">11</span>', body)
+        self.assertIn('Показать ещё', body)
+        self.assertNotIn('partial=', response.context['next_url'])
+
+    def test_invalid_cursor_gives_first_page(self):
+        first = self.json_page()
+        cursors = ['garbage!', 'WzFd', 'WyJ4IiwieSJd']  # не base64, [1], ["x","y"]
+        # Разбираются, но не годятся для запроса: id вне bigint, бесконечность, кривая дата, не те типы
+        cursors += [encode_cursor(values) for values in (
+            ['2020-01-01T00:00:00', 10 ** 30], ['2020-01-01T00:00:00', float('inf')],
+            ['2020-13-45T00:00:00', 1], [True, 1], [None, 1], [['2020-01-01'], 1],
+        )]
+        for cursor in cursors:
+            self.assertEqual(self.json_page(cursor=cursor), first, decode_cursor(cursor))
+
+    def test_naive_cursor_date_is_accepted(self):
+        page = self.json_page(cursor=encode_cursor(['2999-01-01T00:00:00', 10 ** 9]))
+        self.assertIsNotNone(page['next_cursor'])
+        self.assertEqual(len(page['songs']), views.ARTIST_SONGS_PER_PAGE)
+
+
+class SongsBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        cls.first, cls.second = Song.objects.bulk_create(
+            Song(title=f'Song {i}', artist=artist, album=album, audio_file=f'songs/{i}.mp3') for i in range(2)
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        self.url = reverse('songs_batch')
+        # Неизвестный id, повтор, «²» (isdigit() == True) и слишком длинное число
+        self.ids = f'{self.second.pk},{self.first.pk}, {self.second.pk},999999,²,abc,{"9" * 30}'
+
+    def check_body(self, response):
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual([song['id'] for song in data['songs']], [self.second.pk, self.first.pk])
+        self.assertEqual(data['missing'], [999999])
+
+    def test_order_and_missing(self):
+        self.check_body(self.client.get(self.url, {'ids': self.ids}))
+
+    def test_async_view(self):
+        request = RequestFactory().get(self.url, {'ids': self.ids})
+        self.check_body(async_to_sync(async_views.songs_batch)(request))
+
+    def test_limit(self):
+        ids = ','.join(str(pk) for pk in range(1, views.SONGS_BATCH_LIMIT + 1))
+        self.assertEqual(self.client.get(self.url, {'ids': ids}).status_code, 200)
+        response = self.client.get(self.url, {'ids': f'{ids},{views.SONGS_BATCH_LIMIT + 1}'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag(self):
+        params = {'ids': f'{self.first.pk},{self.second.pk}'}
+        etag = self.client.get(self.url, params)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('max-age', response['Cache-Control'])
+        # Другой порядок — другой ответ, как и изменение каталога
+        self.assertNotEqual(self.client.get(self.url, {'ids': f'{self.second.pk},{self.first.pk}'})['ETag'], etag)
+        page_cache.bump_catalog_version()
+        self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_exclude_lists_skip_non_ascii_digits(self):
+        exclude = f'{self.first.pk},²,{"9" * 30}'
+        response = self.client.get(reverse('random_song'), {'exclude': exclude})
+        self.assertEqual(response.json()['id'], self.second.pk)
+        response = self.client.get(reverse('similar_songs', args=[self.first.pk]), {'exclude': exclude})
+        self.assertEqual(response.status_code, 200)
+
+
+class PlaylistOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='pw')
+        artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        cls.songs = Song.objects.bulk_create(
+            Song(title=f'Song {i}', artist=artist, album=album, audio_file=f'songs/{i}.mp3') for i in range(6)
+        )
+        cls.ids = [song.pk for song in cls.songs]
+
+    def setUp(self):
+        self.playlist = Playlist.objects.create(user=self.user, name='Mix')
+        playlist_ops.add_songs(self.playlist, self.ids[:4])
+
+    def order(self):
+        return list(PlaylistSong.objects.filter(playlist=self.playlist).values_list('song_id', flat=True))
+
+    def positions(self):
+        return list(PlaylistSong.objects.filter(playlist=self.playlist).values_list('position', flat=True))
+
+    def test_add_songs_appends(self):
+        a, b, c, d, e, f = self.ids
+        self.assertEqual(playlist_ops.add_songs(self.playlist, [e, a, e, 999999]), 1)
+        self.assertEqual(self.order(), [a, b, c, d, e])
+        self.assertEqual(self.positions(), [n * playlist_ops.POSITION_STEP for n in range(1, 6)])
+
+    def test_move_takes_midpoint(self):
+        a, b, c, d = self.ids[:4]
+        step = playlist_ops.POSITION_STEP
+        self.assertEqual(playlist_ops.move(self.playlist, [(d, b, False), (a, None, False), (c, d, True)]), 3)
+        self.assertEqual(self.order(), [d, c, b, a])
+        self.assertEqual(self.positions(), [step + step // 2, step + step * 3 // 4, 2 * step, 4 * step])
+
+    def test_move_renumbers_when_gap_runs_out(self):
+        a, b, c, d = self.ids[:4]
+        PlaylistSong.objects.filter(playlist=self.playlist, song_id=b).update(position=playlist_ops.POSITION_STEP + 1)
+        self.assertEqual(playlist_ops.move(self.playlist, [(d, b, False)]), 1)
+        self.assertEqual(self.order(), [a, d, b, c])
+        self.assertEqual(len(set(self.positions())), 4)
+        self.assertEqual(playlist_ops.renumber(self.playlist), 3)
+        self.assertEqual(self.positions(), [n * playlist_ops.POSITION_STEP for n in range(1, 5)])
+
+    def test_move_skips_unknown_and_self(self):
+        a, b = self.ids[:2]
+        self.assertEqual(playlist_ops.move(self.playlist, [(a, a, False), (999999, a, False), (a, 999999, True)]), 0)
+        self.assertEqual(self.order(), self.ids[:4])
+
+    def test_reorder(self):
+        a, b, c, d = self.ids[:4]
+        # Повторы и чужие id не мешают; неперечисленные идут следом в прежнем порядке
+        self.assertEqual(playlist_ops.reorder(self.playlist, [c, 999999, c, a]), 3)
+        self.assertEqual(self.order(), [c, a, b, d])
+        self.assertEqual(playlist_ops.reorder(self.playlist, [c, a]), 0)
+
+    def post(self, name, data, playlist=None):
+        url = reverse(name, args=[(playlist or self.playlist).pk])
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_endpoints(self):
+        a, b, c, d, e, f = self.ids
+        self.client.force_login(self.user)
+        self.assertEqual(self.post('playlist_add_songs', {'song_ids': [f, e]}).json()['added'], 2)
+        self.assertEqual(self.post('playlist_remove_songs', {'song_ids': [a, e]}).json()['removed'], 2)
+        self.assertEqual(self.post('playlist_reorder', {'moves': [{'song': f, 'before': b}, {'song': b}]}).json(),
+                         {'status': 'success', 'moved': 2})
+        self.assertEqual(self.order(), [f, c, d, b])
+        self.assertEqual(self.post('playlist_reorder', {'song_ids': [d, c]}).json()['updated'], 4)
+        self.assertEqual(self.order(), [d, c, f, b])
+
+    def test_endpoints_check_owner(self):
+        other = User.objects.create_user('other')
+        self.client.force_login(other)
+        for name in ('playlist_add_songs', 'playlist_remove_songs', 'playlist_reorder'):
+            self.assertEqual(self.post(name, {'song_ids': [self.ids[5]]}).status_code, 403)
+        self.assertEqual(self.order(), self.ids[:4])
+
+    def test_endpoints_reject_bad_input(self):
+        self.client.force_login(self.user)
+        too_many = list(range(1, playlist_ops.BULK_LIMIT + 2))
+        for name in ('playlist_add_songs', 'playlist_remove_songs', 'playlist_reorder'):
+            self.assertEqual(self.post(name, {'song_ids': too_many}).status_code, 400)
+            self.assertEqual(self.post(name, {'song_ids': [1, True]}).status_code, 400)
+            self.assertEqual(self.post(name, ['not', 'an', 'object']).status_code, 400)
+        for moves in ([{'song': 'x'}], [{'song': self.ids[0], 'after': '1'}], ['oops'], {'song': 1},
+                      [{'song': self.ids[0]}] * (playlist_ops.BULK_LIMIT + 1)):
+            self.assertEqual(self.post('playlist_reorder', {'moves': moves}).status_code, 400, moves)
+        self.assertEqual(self.order(), self.ids[:4])
+
+    def test_admin_inline_appends_new_rows(self):
+        admin_user = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin_user)
+        entries = list(PlaylistSong.objects.filter(playlist=self.playlist))
+        data = {
+            'name': 'Mix', 'user': self.user.pk,
+            'entries-TOTAL_FORMS': len(entries) + 2, 'entries-INITIAL_FORMS': len(entries),
+            'entries-MIN_NUM_FORMS': 0, 'entries-MAX_NUM_FORMS': 1000,
+        }
+        for i, entry in enumerate(entries):
+            data.update({f'entries-{i}-id': entry.pk, f'entries-{i}-playlist': self.playlist.pk,
+                         f'entries-{i}-song': entry.song_id, f'entries-{i}-position': entry.position})
+        for i, song_id in enumerate(self.ids[4:], start=len(entries)):
+            data.update({f'entries-{i}-playlist': self.playlist.pk, f'entries-{i}-song': song_id,
+                         f'entries-{i}-position': 0})
+        response = self.client.post(reverse('admin:music_playlist_change', args=[self.playlist.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.order(), self.ids)
+        self.assertEqual(self.positions(), [n * playlist_ops.POSITION_STEP for n in range(1, 7)])
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('listener', password='old-password')
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+
+    def request(self):
+        request = RequestFactory().get('/')
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore(self.session_key)
+        CachedAuthenticationMiddleware(lambda request: HttpResponse())(request)
+        return request
+
+    def current_user(self):
+        user = self.request().user
+        return user if user.is_authenticated else None
+
+    def test_cache_hit_makes_no_queries(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.current_user(), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.current_user(), self.user)
+
+    def test_password_change_logs_out(self):
+        self.current_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-password')
+            self.user.save()
+        self.assertIsNone(self.current_user())
+
+    def test_deactivation_logs_out(self):
+        self.current_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        self.assertIsNone(self.current_user())
+
+    def test_session_hash_mismatch_goes_to_database(self):
+        self.current_user()
+        session = import_module(settings.SESSION_ENGINE).SessionStore(self.session_key)
+        session[HASH_SESSION_KEY] = 'forged'
+        session.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(self.current_user())
+        self.assertTrue(any('"auth_user"' in query['sql'] for query in queries))
+        # Чужая сессия сброшена, как и при обычном auth.get_user
+        self.assertFalse(import_module(settings.SESSION_ENGINE).SessionStore().exists(self.session_key))
+
+    def test_stale_cached_user_is_not_trusted(self):
+        # Строка поменялась мимо сигналов: в кэше старый хэш, сессия — от нового пароля
+        stale = User.objects.get(pk=self.user.pk)
+        stale.set_password('stale-password')
+        caches[settings.USER_CACHE_ALIAS].set(f'music:user:{self.user.pk}', stale)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.current_user().password, self.user.password)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        page_cache._pages().clear()
+
+    def test_cached_hit_keeps_view_headers(self):
+        calls = []
+
+        @page_cache.cache_anonymous_page
+        def view(request):
+            calls.append(request)
+            response = HttpResponse('<p>page</p>', content_type='text/html; charset=utf-8')
+            response['Cache-Control'] = 'max-age=60'
+            response['Vary'] = 'Accept-Language'
+            return response
+
+        request = RequestFactory().get('/catalog/')
+        request.user = AnonymousUser()
+        view(request)
+        cached = view(request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cached.content, b'<p>page</p>')
+        self.assertEqual(cached['Content-Type'], 'text/html; charset=utf-8')
+        self.assertEqual(cached['Cache-Control'], 'max-age=60')
+        self.assertEqual(cached['Vary'], 'Accept-Language')
+
+    def test_version_bumped_after_commit(self):
+        version = page_cache.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Artist.objects.create(name='New artist')
+            self.assertEqual(page_cache.catalog_version(), version)
+        self.assertGreater(page_cache.catalog_version(), version)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name='Artist')
+        self.album = Album.objects.create(title='Album', artist=self.artist, release_date=datetime.date(2020, 1, 1))
+
+    def test_delete_with_drifted_counters(self):
+        # bulk_create обходит сигналы: у альбома song_count остаётся 0
+        song, = Song.objects.bulk_create([Song(title='Song', artist=self.artist, album=self.album, plays=5)])
+        song.delete()
+        self.album.refresh_from_db()
+        self.artist.refresh_from_db()
+        self.assertEqual((self.album.song_count, self.album.total_plays), (0, 0))
+        self.assertEqual((self.artist.song_count, self.artist.total_plays), (0, 0))
+
+    @override_settings(PLAY_BUFFER_SIZE=0)
+    def test_play_song_within_budget(self):
+        song = Song.objects.create(title='Song', artist=self.artist, album=self.album, audio_file='songs/a.mp3')
+        self.client.force_login(User.objects.create_user('listener'))
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        auth_cache.get_user(request)  # пользователь попадает в кэш
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('play_song', args=[song.pk]))
+        self.assertEqual(response.status_code, 200)
+        # SAVEPOINT — от обёртки TestCase: в бою transaction.atomic() верхнего уровня их не делает
+        statements = [q for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+        self.assertLessEqual(len(statements), settings.QUERY_BUDGETS['play_song'])
+        for obj in (song, self.artist, self.album):
+            obj.refresh_from_db()
+        self.assertEqual(song.plays, 1)
+        # Без буфера итоги артиста и альбома растут сразу, без reconcile_counters
+        self.assertEqual((self.artist.total_plays, self.album.total_plays), (1, 1))
+
+
+class FakeExecutor:
+    """
+    ProcessPoolExecutor без процессов: файл из crash_on «роняет» пул, после
+    чего незабранные результаты и новые submit дают BrokenProcessPool.
+    """
+    crash_on = set()
+
+    def __init__(self, max_workers=None):
+        self.broken = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, path):
+        if self.broken:
+            raise BrokenProcessPool('pool is broken')
+        if path.endswith(tuple(self.crash_on)):
+            self.broken = True
+        executor = self
+
+        class Future:
+            def result(self):
+                if executor.broken:
+                    raise BrokenProcessPool('child process terminated abruptly')
+                return fn(path)
+        return Future()
+
+
+class IngestTests(TestCase):
+    METADATA = {'duration': 60, 'bitrate': 128000, 'codec': 'mp3', 'sample_rate': 44100,
+                'cover': None, 'seek_table': None}
+
+    def setUp(self):
+        artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        self.songs = Song.objects.bulk_create(
+            Song(title=f'Song {i}', artist=artist, album=album, audio_file=f'songs/{i}.mp3') for i in range(4)
+        )
+        self.jobs = IngestJob.objects.bulk_create(IngestJob(song=song) for song in self.songs)
+        patcher = mock.patch.object(ingest, 'extract_metadata', return_value=self.METADATA)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stale_jobs_spend_attempts(self):
+        long_ago = timezone.now() - datetime.timedelta(hours=1)
+        IngestJob.objects.filter(pk=self.jobs[0].pk).update(status=IngestJob.RUNNING, started_at=long_ago, attempts=0)
+        IngestJob.objects.filter(pk=self.jobs[1].pk).update(
+            status=IngestJob.RUNNING, started_at=long_ago, attempts=ingest.MAX_ATTEMPTS - 1,
+        )
+        with self.assertLogs('music.ingest', 'WARNING'):
+            claimed = {job.pk: job for job in ingest.claim_jobs(10, stale_after=60)}
+
+        self.assertEqual(claimed[self.jobs[0].pk].attempts, 1)
+        self.assertNotIn(self.jobs[1].pk, claimed)
+        exhausted = IngestJob.objects.get(pk=self.jobs[1].pk)
+        self.assertEqual((exhausted.status, exhausted.attempts), (IngestJob.FAILED, ingest.MAX_ATTEMPTS))
+        self.assertEqual(IngestJob.objects.get(pk=self.jobs[0].pk).attempts, 1)
+
+    @mock.patch.object(ingest, 'ProcessPoolExecutor', FakeExecutor)
+    def test_broken_pool_charges_only_the_crashing_file(self):
+        FakeExecutor.crash_on = {'/1.mp3'}
+        jobs = ingest.claim_jobs(10, stale_after=600)
+        with self.assertLogs('music.ingest', 'WARNING'):
+            done, broken = ingest.process_jobs(jobs, FakeExecutor())
+
+        self.assertTrue(broken)
+        self.assertEqual(done, 3)
+        statuses = dict(IngestJob.objects.values_list('song_id', 'status'))
+        crashed = IngestJob.objects.get(song=self.songs[1])
+        self.assertEqual((crashed.status, crashed.attempts), (IngestJob.PENDING, 1))
+        self.assertEqual(
+            [statuses[song.pk] for song in self.songs],
+            [IngestJob.DONE, IngestJob.PENDING, IngestJob.DONE, IngestJob.DONE],
+        )
+        self.assertFalse(IngestJob.objects.exclude(song=self.songs[1]).exclude(attempts=0).exists())
+
+    def test_embedded_cover_gets_derivatives(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        buffer = io.BytesIO()
+        images.Image.new('RGB', (400, 400), 'blue').save(buffer, 'PNG')
+        metadata = {**self.METADATA, 'cover': (buffer.getvalue(), 'image/png')}
+        with override_settings(MEDIA_ROOT=media):
+            ingest.apply_metadata(self.songs[0], metadata)
+            song = Song.objects.get(pk=self.songs[0].pk)
+            self.assertTrue(song.cover)
+            for size in images.COVER_SIZES:
+                for fmt in images.FORMATS:
+                    self.assertTrue(song.cover.storage.exists(images.derivative_name(song.cover.name, size, fmt)))
+
+
+class ImageUrlTests(TempFileMixin, SimpleTestCase):
+    def setUp(self):
+        self.storage = FileSystemStorage(location=tempfile.mkdtemp(), base_url='/media/')
+        self.addCleanup(shutil.rmtree, self.storage.location)
+        buffer = io.BytesIO()
+        images.Image.new('RGB', (300, 300), 'red').save(buffer, 'PNG')
+        name = self.storage.save('covers/a.png', ContentFile(buffer.getvalue()))
+        self.fieldfile = mock.Mock(storage=self.storage, url=self.storage.url(name))
+        self.fieldfile.name = name
+        images._existing.clear()
+        images._missing.clear()
+
+    def test_missing_derivative_serves_original_without_building(self):
+        self.assertEqual(images.image_url(self.fieldfile, 200), '/media/covers/a.png')
+        self.assertFalse(self.storage.exists(images.derivative_name(self.fieldfile.name, 200, 'jpeg')))
+        with mock.patch.object(self.storage, 'exists') as exists:
+            self.assertEqual(images.image_url(self.fieldfile, 200), '/media/covers/a.png')
+        exists.assert_not_called()
+
+    def test_built_derivative_is_remembered(self):
+        images.image_url(self.fieldfile, 200)
+        self.assertEqual(images.ensure_derivatives(self.fieldfile, sizes=[200]), 2)
+        with mock.patch.object(self.storage, 'exists') as exists:
+            self.assertEqual(images.image_url(self.fieldfile, 200, 'webp'), '/media/derived/covers/a.png/200.webp')
+            self.assertEqual(images.image_url(self.fieldfile, 200, 'webp'), '/media/derived/covers/a.png/200.webp')
+        exists.assert_not_called()
+
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        artists = Artist.objects.bulk_create(Artist(name=f'Artist {i}', song_count=3) for i in range(3))
+        cls.songs = []
+        for artist in artists:
+            album = Album.objects.create(title=f'Album {artist.pk}', artist=artist,
+                                         release_date=datetime.date(2020, 1, 1))
+            cls.songs += Song.objects.bulk_create(
+                Song(title=f'Song {artist.pk}-{i}', artist=artist, album=album, plays=i) for i in range(3)
+            )
+        cls.user = User.objects.create_user('listener')
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_new_user_is_computed_and_stored(self):
+        PlayHistory.objects.create(user=self.user, song=self.songs[0])
+        songs, artists, albums = recommendations.get_recommendations(self.user)
+        self.assertEqual({song.artist_id for song in songs}, {self.songs[0].artist_id})
+        self.assertNotIn(self.songs[0], songs)
+        self.assertNotIn(self.songs[0].artist, artists)
+        self.assertTrue(Recommendation.objects.filter(user=self.user).exists())
+        # Второй запрос читает сохранённое
+        with mock.patch.object(recommendations, 'compute_recommendations') as compute, self.assertNumQueries(1):
+            self.assertEqual(recommendations.get_recommendations(self.user)[0], songs)
+        compute.assert_not_called()
+
+    def test_precomputed_rows_are_served_as_stored(self):
+        PlayHistory.objects.create(user=self.user, song=self.songs[0])
+        recommendations.store_recommendations(self.user, [self.songs[8], self.songs[7]], [], [])
+        with mock.patch.object(recommendations, 'compute_recommendations') as compute:
+            self.assertEqual(recommendations.get_recommendations(self.user), ([self.songs[8], self.songs[7]], [], []))
+        compute.assert_not_called()
+
+    def test_long_history_without_rows_waits_for_the_command(self):
+        PlayHistory.objects.bulk_create(
+            PlayHistory(user=self.user, song=self.songs[0]) for _ in range(recommendations.LIVE_HISTORY_LIMIT + 1)
+        )
+        self.assertEqual(recommendations.get_recommendations(self.user), ([], [], []))
+        self.assertFalse(Recommendation.objects.filter(user=self.user).exists())
+
+    def test_home_shows_recommendations_for_new_user(self):
+        PlayHistory.objects.create(user=self.user, song=self.songs[0])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home'))
+        self.assertTrue(response.context['recommended_songs'])
+
+
+class SearchTests(TestCase):
+    TITLES = ['Солнце', 'Ёлка', 'Кино', 'Группа крови', 'Sun_rise', 'Moonlight']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artist = Artist.objects.create(name='Кино')
+        album = Album.objects.create(title='Звезда', artist=cls.artist, release_date=datetime.date(1988, 1, 1))
+        cls.songs = {title: Song.objects.create(title=title, artist=cls.artist, album=album) for title in cls.TITLES}
+        other = Artist.objects.create(name='Other')
+        other_album = Album.objects.create(title='Filler', artist=other, release_date=datetime.date(2000, 1, 1))
+        Song.objects.bulk_create(
+            Song(title=f'Track {i}', artist=other, album=other_album, search_text=f'track {i} other')
+            for i in range(45)
+        )
+        call_command('rebuild_search_index', stdout=io.StringIO())
+
+    def setUp(self):
+        caches['default'].clear()
+        page_cache._pages().clear()
+
+    def titles(self, backend, query):
+        return {song.title for song in backend.search(Song.objects.all(), query, limit=100)}
+
+    def test_backends_match_substrings_alike(self):
+        queries = {
+            'олнце': {'Солнце'},
+            'СОЛН': {'Солнце'},
+            'елка': {'Ёлка'},
+            'кров': {'Группа крови'},
+            'уп кро': {'Группа крови'},  # короткое слово — через LIKE
+            'n_r': {'Sun_rise'},
+            '_r': {'Sun_rise'},  # _ в LIKE экранирован
+            'light moon': {'Moonlight'},
+        }
+        for backend in (search.SQLiteSearchBackend(), search.SearchBackend()):
+            for query, expected in queries.items():
+                self.assertEqual(self.titles(backend, query), expected, (type(backend).__name__, query))
+            # Название артиста входит в текст трека
+            self.assertEqual(len(self.titles(backend, 'кино')), len(self.TITLES))
+
+    def test_clean_cursor(self):
+        self.assertEqual(search.clean_cursor([-1.5, 7]), (-1.5, 7))
+        for values in (None, [1], [0.5, 10 ** 30], [float('nan'), 1], [True, 1], [0.5, 1.5], ['0.5', 1], [0.5, -1]):
+            self.assertIsNone(search.clean_cursor(values), values)
+
+    def json_page(self, **params):
+        response = self.client.get(reverse('search'), {'q': 'track', 'format': 'json', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_view_pages_through_results(self):
+        seen = []
+        data = self.json_page()
+        self.assertEqual(len(data['songs']), views.SEARCH_SONGS_PER_PAGE)
+        while True:
+            seen += [song['id'] for song in data['songs']]
+            if not data['next_cursor']:
+                break
+            data = self.json_page(cursor=data['next_cursor'])
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+    def test_view_first_page_has_cards(self):
+        response = self.client.get(reverse('search'), {'q': 'кино'})
+        self.assertEqual([artist.pk for artist in response.context['artists']], [self.artist.pk])
+        self.assertEqual(len(response.context['songs']), len(self.TITLES))
+        partial = self.client.get(reverse('search'), {'q': 'track', 'partial': 1,
+                                                      'cursor': self.json_page()['next_cursor']})
+        self.assertEqual(partial.context['artists'], [])
+
+    def test_view_rejects_bad_cursor(self):
+        first = self.json_page()
+        for values in ([0.5, 10 ** 30], [float('inf'), 1], ['x', 1]):
+            self.assertEqual(self.json_page(cursor=encode_cursor(values)), first, values)
+
+
+class AssetTests(SimpleTestCase):
+    def test_minify_css_keeps_strings(self):
+        source = 'a::after {\n  /* комментарий */\n  content: "a  /* b */  ;}" ;\n  font: 12px  \'My  Font\';\n}\n'
+        self.assertEqual(assets.minify_css(source), 'a::after{content:"a  /* b */  ;}";font:12px \'My  Font\'}')
+
+    def test_minify_js_keeps_strings(self):
+        source = (
+            'function f() {\n'
+            '    // комментарий с `обратной кавычкой\n'
+            "    const url = 'http://example.com/'; /* блок */\n"
+            '    const re = /a\\/\\//g;\n'
+            '    return `строка\n'
+            '        // не комментарий\n'
+            '\n'
+            '    ${url}`;  // хвост\n'
+            '}\n'
+        )
+        self.assertEqual(assets.minify_js(source), (
+            'function f() {\n'
+            "const url = 'http://example.com/';\n"
+            'const re = /a\\/\\//g;\n'
+            'return `строка\n'
+            '        // не комментарий\n'
+            '\n'
+            '    ${url}`;\n'
+            '}'
+        ))
+
+    def test_bundles_are_valid(self):
+        for name in assets.BUNDLES:
+            self.assertTrue(assets.build_bundle(name).strip(), name)
+
+    def test_collectstatic_hashes_and_compresses_bundles(self):
+        base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, base)
+        storages = {**settings.STORAGES, 'staticfiles': {
+            'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+        }}
+        with override_settings(BASE_DIR=Path(base), STATIC_ROOT=os.path.join(base, 'root'), STORAGES=storages,
+                               STATICFILES_DIRS=[*settings.STATICFILES_DIRS, os.path.join(base, 'static')],
+                               DEBUG=False):
+            call_command('collectstatic', interactive=False, verbosity=0, stdout=io.StringIO())
+            html = Template("{% load assets %}{% bundle 'app.js' %}{% bundle 'app.css' %}").render(Context())
+            for name in assets.BUNDLES:
+                hashed = re.search(r'/static/(bundles/%s\.[0-9a-f]{12}\.%s)"' % tuple(name.split('.')), html)
+                self.assertIsNotNone(hashed, html)
+                path = os.path.join(base, 'root', hashed.group(1))
+                with open(path, encoding='utf-8') as f:
+                    self.assertEqual(f.read(), assets.build_bundle(name))
+                self.assertTrue(os.path.exists(path + '.gz'))
+                self.assertTrue(os.path.exists(path + '.br'))
+
+    def test_debug_lists_sources(self):
+        with override_settings(DEBUG=True):
+            html = Template("{% load assets %}{% bundle 'app.js' %}").render(Context())
+        self.assertEqual(html.count('<script'), len(assets.BUNDLES['app.js']))
+
+
+class ImportLibraryTests(TestCase):
+    def setUp(self):
+        self.library = tempfile.mkdtemp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.library)
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1
+        from PIL import Image
+
+        cover = io.BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(cover, 'PNG')
+        for number in range(2):
+            path = os.path.join(self.library, f'{number}.mp3')
+            with open(path, 'wb') as f:
+                f.write(_mp3_file(40 + number))
+            tags = ID3()
+            tags.add(TIT2(text=f'Song {number}'))
+            tags.add(TPE1(text='Artist'))
+            tags.add(TALB(text='Album'))
+            tags.add(APIC(mime='image/png', type=3, data=cover.getvalue()))
+            tags.save(path)
+        os.makedirs(os.path.join(self.library, 'copy'))
+        shutil.copyfile(os.path.join(self.library, '0.mp3'), os.path.join(self.library, 'copy', '0.mp3'))
+        with open(os.path.join(self.library, 'broken.mp3'), 'wb') as f:
+            f.write(b'not audio' * 100)
+
+    def run_import(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_library', self.library, processes=1, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_second_run_is_idempotent(self):
+        stdout, stderr = self.run_import()
+        self.assertIn('Файлов: 4, без изменений: 0, разобрано: 4', stdout)
+        self.assertIn('Треков создано: 2, обновлено: 0, дубликатов: 1, ошибок: 1', stdout)
+        self.assertIn('broken.mp3', stderr)
+        self.assertEqual(Song.objects.count(), 2)
+        self.assertEqual(LibraryFile.objects.count(), 3)
+        copy = LibraryFile.objects.get(path=os.path.join(self.library, 'copy', '0.mp3'))
+        self.assertEqual(copy.song_id, LibraryFile.objects.get(path=os.path.join(self.library, '0.mp3')).song_id)
+
+        album = Album.objects.get()
+        self.assertTrue(album.cover)
+        for size in images.COVER_SIZES:
+            for fmt in images.FORMATS:
+                self.assertTrue(album.cover.storage.exists(images.derivative_name(album.cover.name, size, fmt)))
+
+        stdout, stderr = self.run_import()
+        # Битый файл не попал в LibraryFile и разбирается снова, остальные пропускаются
+        self.assertIn('Файлов: 4, без изменений: 3, разобрано: 1', stdout)
+        self.assertIn('Треков создано: 0, обновлено: 0, дубликатов: 0, ошибок: 1', stdout)
+        self.assertIn('broken.mp3', stderr)
+        self.assertEqual(Song.objects.count(), 2)
+        self.assertEqual((Artist.objects.count(), Album.objects.count()), (1, 1))
+
+
+class FakeTimer:
+    """threading.Timer, который срабатывает только по команде теста."""
+    started = []
+
+    def __init__(self, interval, function):
+        self.interval, self.function = interval, function
+        self.cancelled = False
+
+    def start(self):
+        FakeTimer.started.append(self)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+@override_settings(PLAY_BUFFER_SIZE=3, PLAY_BUFFER_INTERVAL=7)
+class PlayBufferTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name='Artist')
+        self.album = Album.objects.create(title='Album', artist=self.artist, release_date=datetime.date(2020, 1, 1))
+        self.songs = [
+            Song.objects.create(title=f'Song {i}', artist=self.artist, album=self.album, audio_file=f'songs/{i}.mp3')
+            for i in range(2)
+        ]
+        self.user = User.objects.create_user('listener')
+        FakeTimer.started = []
+        for patcher in (mock.patch.object(plays, '_buffer', plays.PlayBuffer()),
+                        mock.patch.object(plays.threading, 'Timer', FakeTimer)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertPlays(self, song_plays, total):
+        self.assertEqual([Song.objects.get(pk=song.pk).plays for song in self.songs], song_plays)
+        self.artist.refresh_from_db()
+        self.album.refresh_from_db()
+        self.assertEqual((self.artist.total_plays, self.album.total_plays), (total, total))
+
+    def test_flush_when_full(self):
+        plays.record_play(self.songs[0].pk, self.user.pk)
+        plays.record_play(self.songs[1].pk)
+        self.assertPlays([0, 0], 0)
+
+        plays.record_play(self.songs[0].pk, self.user.pk)
+        self.assertPlays([2, 1], 3)
+        self.assertEqual(PlayHistory.objects.filter(user=self.user, song=self.songs[0]).count(), 2)
+        self.assertEqual(FakeTimer.started[0].interval, 7)
+        self.assertTrue(FakeTimer.started[0].cancelled)
+
+    def test_flush_by_timer(self):
+        plays.record_play(self.songs[0].pk)
+        plays.record_play(self.songs[0].pk)
+        self.assertEqual(len(FakeTimer.started), 1)
+        FakeTimer.started[0].function()
+        self.assertPlays([2, 0], 2)
+        self.assertEqual(plays.flush_plays(), 0)
+
+    def test_failed_write_is_requeued(self):
+        plays.record_play(self.songs[0].pk)
+        with mock.patch.object(plays, 'write_plays', side_effect=DatabaseError('locked')), \
+                self.assertLogs('music.plays', 'ERROR'):
+            self.assertEqual(plays.flush_plays(), 0)
+        self.assertPlays([0, 0], 0)
+        # Повтор назначен по таймеру
+        self.assertEqual(len(FakeTimer.started), 2)
+        plays.record_play(self.songs[1].pk)
+        FakeTimer.started[-1].function()
+        self.assertPlays([1, 1], 2)
+
+    def test_worker_exit_flushes(self):
+        spec = importlib.util.spec_from_file_location(
+            'gunicorn_asgi_config', Path(settings.BASE_DIR).parent / 'gunicorn_asgi_config.py',
+        )
+        config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(config)
+        plays.record_play(self.songs[0].pk)
+        plays.record_play(self.songs[1].pk)
+        server = mock.Mock()
+        config.worker_exit(server, mock.Mock(pid=1))
+        self.assertPlays([1, 1], 2)
+        server.log.info.assert_called_once()
+
+
+@override_settings(SUGGEST_INDEX_TTL=600)
+class SuggestIndexTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(suggest, '_index', suggest.PrefixIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.artist = Artist.objects.create(name='Кино')
+        self.album = Album.objects.create(title='Группа крови', artist=self.artist, release_date=datetime.date(1988, 1, 1))
+        self.star = Song.objects.create(title='Звезда по имени Солнце', artist=self.artist, album=self.album)
+        self.sun = Song.objects.create(title='Солнце', artist=self.artist, album=self.album)
+
+    def lookup(self, query):
+        return suggest.get_index().lookup(query)
+
+    def test_prefix_lookup(self):
+        self.assertEqual(self.lookup('зве'), [(suggest.SONG, self.star.pk)])
+        self.assertEqual(self.lookup('груп'), [(suggest.ALBUM, self.album.pk)])
+        # Совпадение с начала названия выше совпадения со слова в середине
+        self.assertEqual(self.lookup('солн'), [(suggest.SONG, self.sun.pk), (suggest.SONG, self.star.pk)])
+        self.assertEqual(self.lookup('по имени'), [(suggest.SONG, self.star.pk)])
+        self.assertEqual(self.lookup('звезды'), [])
+        self.assertEqual(self.lookup('  '), [])
+
+    def test_cyrillic_case_folding(self):
+        Artist.objects.create(name='Ёлка')
+        for query in ('КИНО', 'кИн', ' Кино '):
+            self.assertEqual(self.lookup(query), [(suggest.ARTIST, self.artist.pk)])
+        self.assertEqual(len(self.lookup('ЕЛК')), 1)
+        self.assertEqual(self.lookup('ЗВЕЗДА ПО'), [(suggest.SONG, self.star.pk)])
+
+    def test_signals_update_built_index(self):
+        self.lookup('кино')
+        song = Song.objects.create(title='Кукушка', artist=self.artist, album=self.album)
+        self.assertEqual(self.lookup('кук'), [(suggest.SONG, song.pk)])
+        song.delete()
+        self.assertEqual(self.lookup('кук'), [])
+
+    def test_rebuild_after_ttl(self):
+        built_at = suggest.get_index().built_at
+        # bulk_create обходит сигналы, как изменения в другом воркере
+        Song.objects.bulk_create([Song(title='Кукушка', artist=self.artist, album=self.album)])
+        self.assertEqual(self.lookup('кук'), [])
+        with mock.patch.object(suggest.time, 'monotonic', return_value=built_at + 599):
+            self.assertEqual(self.lookup('кук'), [])
+        with mock.patch.object(suggest.time, 'monotonic', return_value=built_at + 601):
+            self.assertEqual(len(self.lookup('кук')), 1)
+
+    def test_rebuild_after_invalidate(self):
+        self.lookup('кино')
+        Song.objects.bulk_create([Song(title='Кукушка', artist=self.artist, album=self.album)])
+        self.assertEqual(self.lookup('кук'), [])
+        suggest.invalidate()
+        self.assertFalse(suggest.is_built())
+        self.assertEqual(len(self.lookup('кук')), 1)
+
+
+class SimilarityTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'songs.npy')
+        settings_override = override_settings(SIMILARITY_MODEL_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(similarity, '_cache', similarity._ModelCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        self.songs = [Song.objects.create(title=f'Song {i}', artist=artist, album=album) for i in range(6)]
+        a, b, c, d, e, _ = self.songs
+        users = [User.objects.create_user(f'user{i}') for i in range(3)]
+        # a и b слушают вместе двое, c рядом с ними у одного; d и e связывает только плейлист
+        PlayHistory.objects.bulk_create([
+            PlayHistory(user=users[0], song=a), PlayHistory(user=users[0], song=b),
+            PlayHistory(user=users[1], song=a), PlayHistory(user=users[1], song=b),
+            PlayHistory(user=users[1], song=b), PlayHistory(user=users[1], song=c),
+        ])
+        Favorite.objects.create(user=users[2], song=c)
+        Favorite.objects.create(user=users[2], song=d)
+        playlist = Playlist.objects.create(name='Mix', user=users[2])
+        PlaylistSong.objects.bulk_create([PlaylistSong(playlist=playlist, song=d), PlaylistSong(playlist=playlist, song=e)])
+
+    def neighbor_ids(self, song):
+        return [pk for pk, _ in similarity.neighbors(song.pk)]
+
+    def test_build_and_lookup(self):
+        self.assertEqual(similarity.build_model(k=5), 6)
+        a, b, c, d, e, lonely = self.songs
+        self.assertEqual(self.neighbor_ids(a), [b.pk, c.pk])
+        self.assertEqual(self.neighbor_ids(b), [a.pk, c.pk])
+        self.assertEqual(set(self.neighbor_ids(d)), {c.pk, e.pk})
+        self.assertEqual(self.neighbor_ids(e), [d.pk])
+        self.assertEqual(self.neighbor_ids(lonely), [])
+        self.assertEqual(similarity.neighbors(10 ** 9), [])
+        weights = [w for _, w in similarity.neighbors(a.pk)]
+        self.assertEqual(weights, sorted(weights, reverse=True))
+        self.assertTrue(all(0 < w <= 1 for w in weights))
+
+    def test_keeps_top_k(self):
+        similarity.build_model(k=1)
+        a, b = self.songs[:2]
+        self.assertEqual(self.neighbor_ids(a), [b.pk])
+        self.assertEqual(similarity._cache.get().dtype['neighbors'].shape, (1,))
+
+    def test_missing_model(self):
+        self.assertEqual(similarity.neighbors(self.songs[0].pk), [])
+        self.assertEqual(similarity.sample_neighbors(self.songs[0].pk), [])
+
+    def test_reload_on_mtime_change(self):
+        a, b, c, d = self.songs[:4]
+        similarity.build_model(k=5)
+        self.assertEqual(self.neighbor_ids(c), [d.pk, b.pk, a.pk])
+
+        PlayHistory.objects.filter(song=c).delete()
+        similarity.build_model(k=5)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        # До следующей проверки воркер отдаёт загруженную таблицу
+        self.assertEqual(self.neighbor_ids(c), [d.pk, b.pk, a.pk])
+        similarity._cache.checked_at = 0.0
+        self.assertEqual(self.neighbor_ids(c), [d.pk])
+
+    def test_similar_songs(self):
+        similarity.build_model(k=5)
+        a, b, c = self.songs[:3]
+        response = self.client.get(reverse('similar_songs', args=[a.pk]), {'exclude': str(b.pk)})
+        self.assertEqual(json.loads(_content(response))['id'], c.pk)
+        for _ in range(5):
+            response = self.client.get(reverse('similar_songs', args=[a.pk]))
+            self.assertIn(json.loads(_content(response))['id'], {b.pk, c.pk})
+        # Трека нет в модели — запасной вариант по исполнителю и альбому
+        with mock.patch.object(similarity, 'neighbors', return_value=[]):
+            response = self.client.get(reverse('similar_songs', args=[self.songs[5].pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(json.loads(_content(response))['id'], self.songs[5].pk)
+
+
+class FakeThread:
+    """threading.Thread, который запускается только по команде теста."""
+    started = []
+
+    def __init__(self, target, daemon=None):
+        self.target = target
+
+    def start(self):
+        FakeThread.started.append(self)
+
+
+@override_settings(SHUFFLE_POOL_TTL=300)
+class ShufflePoolTests(TestCase):
+    def setUp(self):
+        FakeThread.started = []
+        for patcher in (mock.patch.object(shuffle, '_pool', shuffle.SongPool()),
+                        mock.patch.object(shuffle, '_build_lock', threading.Lock()),
+                        mock.patch.object(shuffle.threading, 'Thread', FakeThread)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.artist = Artist.objects.create(name='Artist')
+        self.album = Album.objects.create(title='Album', artist=self.artist, release_date=datetime.date(2020, 1, 1))
+
+    def make_songs(self, *plays):
+        return [
+            Song.objects.create(title=f'Song {i}', artist=self.artist, album=self.album, plays=n)
+            for i, n in enumerate(plays)
+        ]
+
+    def test_empty_catalog(self):
+        pool = shuffle.get_pool()
+        self.assertIsNone(pool.sample())
+        self.assertIsNone(pool.sample(weighted=True))
+        response = self.client.get(reverse('random_song'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_weighting(self):
+        quiet, hit = self.make_songs(0, 1000)
+        pool = shuffle.get_pool()
+        with mock.patch.object(shuffle, 'random', random.Random(1)):
+            weighted = [pool.sample(weighted=True) for _ in range(2000)]
+            uniform = [pool.sample() for _ in range(2000)]
+        # Вес 1 + ln(1 + plays): хит выпадает примерно в 8 раз чаще, но не вытесняет остальных
+        self.assertGreater(weighted.count(hit.pk), 0.8 * len(weighted))
+        self.assertGreater(weighted.count(quiet.pk), 0)
+        self.assertLess(abs(uniform.count(hit.pk) - uniform.count(quiet.pk)), 0.1 * len(uniform))
+
+    def test_exclude_current_song(self):
+        songs = self.make_songs(0, 5, 10)
+        pool = shuffle.get_pool()
+        current = songs[0].pk
+        for weighted in (False, True):
+            picked = {pool.sample(exclude={current}, weighted=weighted) for _ in range(50)}
+            self.assertNotIn(current, picked)
+        self.assertEqual(pool.sample(exclude={songs[0].pk, songs[1].pk}), songs[2].pk)
+        self.assertIsNone(pool.sample(exclude={song.pk for song in songs}))
+
+        response = self.client.get(reverse('random_song'), {'exclude': f'{songs[0].pk},{songs[1].pk}'})
+        self.assertEqual(json.loads(_content(response))['id'], songs[2].pk)
+
+    def test_stale_pool_is_served_during_rebuild(self):
+        first, = self.make_songs(0)
+        pool = shuffle.get_pool()
+        second, = self.make_songs(0)  # сигнал помечает пул устаревшим
+
+        self.assertIs(shuffle.get_pool(), pool)
+        self.assertEqual(list(pool.ids), [first.pk])
+        shuffle.get_pool()
+        self.assertEqual(len(FakeThread.started), 1)  # вторая перестройка не запускается
+
+        FakeThread.started[0].target()
+        self.assertEqual(list(pool.ids), [first.pk, second.pk])
+        self.assertFalse(pool.stale)
+        shuffle.get_pool()
+        self.assertEqual(len(FakeThread.started), 1)
+
+    def test_rebuild_after_ttl(self):
+        self.make_songs(0)
+        built_at = shuffle.get_pool().built_at
+        with mock.patch.object(shuffle.time, 'monotonic', return_value=built_at + 299):
+            shuffle.get_pool()
+        self.assertEqual(FakeThread.started, [])
+        with mock.patch.object(shuffle.time, 'monotonic', return_value=built_at + 301):
+            shuffle.get_pool()
+        self.assertEqual(len(FakeThread.started), 1)
+        FakeThread.started[0].target()
+
+    def test_deleted_song_is_skipped(self):
+        gone, alive = self.make_songs(0, 0)
+        shuffle.get_pool()
+        Song.objects.filter(pk=gone.pk).delete()  # как удаление в другом воркере, без сигнала в этом пуле
+        shuffle._pool.stale = False
+        with mock.patch.object(shuffle.SongPool, '_pick', side_effect=[gone.pk, alive.pk, alive.pk]):
+            response = self.client.get(reverse('random_song'))
+        self.assertEqual(json.loads(_content(response))['id'], alive.pk)
+        self.assertTrue(shuffle._pool.stale)
+        FakeThread.started[0].target()
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        page_cache._pages().clear()
+        artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        self.songs = [
+            Song.objects.create(title=f'Song {i}', artist=artist, album=album, audio_file=f'songs/{i}.mp3')
+            for i in range(4)
+        ]
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('home'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=\d+\.\d;desc="\d+ queries", tpl;dur=\d+\.\d, total;dur=\d+\.\d$',
+        )
+        with override_settings(SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+    def test_budget_overrun_is_logged(self):
+        with override_settings(QUERY_BUDGETS={'similar_songs': 0}), self.assertLogs('music.perf', 'WARNING') as logs:
+            self.client.get(reverse('similar_songs', args=[self.songs[0].pk]))
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('similar_songs made', logs.output[0])
+        self.assertIn('(budget 0)', logs.output[0])
+
+    def test_new_user_home_within_budget(self):
+        # Худший путь главной: пользователя нет в кэше, рекомендации считаются на лету
+        user = User.objects.create_user('listener')
+        PlayHistory.objects.create(user=user, song=self.songs[0])
+        Favorite.objects.create(user=user, song=self.songs[1])
+        self.client.force_login(user)
+        with self.assertNoLogs('music.perf', 'WARNING'):
+            response = self.client.get(reverse('home'))
+        self.assertTrue(response.context['recommended_songs'])
+        with self.assertNoLogs('music.perf', 'WARNING'):
+            self.client.get(reverse('similar_songs', args=[self.songs[0].pk]), {'exclude': str(self.songs[1].pk)})
+
+
+class CacheInvalidationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        page_cache._pages().clear()
+        self.artist = Artist.objects.create(name='Кино')
+        self.album = Album.objects.create(title='Группа крови', artist=self.artist, release_date=datetime.date(1988, 1, 1))
+        self.song = Song.objects.create(title='Кукушка', artist=self.artist, album=self.album, audio_file='songs/a.mp3')
+        self.user = User.objects.create_user('listener')
+
+    def test_toggle_favorite_invalidates_cached_ids(self):
+        self.client.force_login(self.user)
+        self.assertEqual(get_favorite_ids(self.user), frozenset())  # пустое множество попадает в кэш
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('toggle_favorite', args=[self.song.pk]))
+        self.assertEqual(json.loads(response.content)['status'], 'added')
+        self.assertEqual(get_favorite_ids(self.user), {self.song.pk})
+        self.assertContains(self.client.get(reverse('favorites')), 'Кукушка')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('toggle_favorite', args=[self.song.pk]))
+        self.assertEqual(json.loads(response.content)['status'], 'removed')
+        self.assertEqual(get_favorite_ids(self.user), frozenset())
+
+    def test_invalidation_waits_for_commit(self):
+        get_favorite_ids(self.user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Favorite.objects.create(user=self.user, song=self.song)
+        # До коммита в кэше прежнее множество: его и увидит параллельный запрос
+        self.assertEqual(get_favorite_ids(self.user), frozenset())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_favorite_ids(self.user), {self.song.pk})
+
+    def test_catalog_version_expires_anonymous_pages(self):
+        for url in (reverse('home'), reverse('artist_detail', args=[self.artist.pk])):
+            self.assertContains(self.client.get(url), 'Кино')
+        # update() обходит сигналы: страницы остаются в кэше
+        Artist.objects.filter(pk=self.artist.pk).update(name='Аквариум')
+        for url in (reverse('home'), reverse('artist_detail', args=[self.artist.pk])):
+            self.assertNotContains(self.client.get(url), 'Аквариум')
+
+        page_cache.bump_catalog_version()
+        for url in (reverse('home'), reverse('artist_detail', args=[self.artist.pk])):
+            response = self.client.get(url)
+            self.assertContains(response, 'Аквариум')
+            self.assertNotContains(response, 'Кино')
+
+    def test_catalog_version_expires_fragments(self):
+        # Авторизованным страница не кэшируется целиком, но фрагменты {% cache %} общие
+        self.client.force_login(self.user)
+        home, artist_page = reverse('home'), reverse('artist_detail', args=[self.artist.pk])
+        self.assertContains(self.client.get(home), 'Кино')
+        self.assertContains(self.client.get(artist_page), 'Группа крови')
+        Artist.objects.filter(pk=self.artist.pk).update(name='Аквариум')
+        Album.objects.filter(pk=self.album.pk).update(title='Радио Африка')
+        self.assertRegex(_content(self.client.get(home)).decode(), self.artist_card('Кино'))
+        self.assertNotContains(self.client.get(artist_page), 'Радио Африка')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # Сохранение через ORM увеличивает версию каталога сигналом после коммита
+            Song.objects.get(pk=self.song.pk).save()
+        self.assertRegex(_content(self.client.get(home)).decode(), self.artist_card('Аквариум'))
+        self.assertContains(self.client.get(artist_page), 'Радио Африка')
+
+    @staticmethod
+    def artist_card(name):
+        # Карточка исполнителя из фрагмента home_artists
+        return rf'card-title">{name}</div>\s*<div class="card-subtitle">Исполнитель<'
+
+
+class RadioQueueTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(SIMILARITY_MODEL_PATH=os.path.join(directory, 'songs.npy'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for patcher in (mock.patch.object(similarity, '_cache', similarity._ModelCache()),
+                        mock.patch.object(shuffle, '_pool', shuffle.SongPool()),
+                        mock.patch.object(shuffle, '_build_lock', threading.Lock()),
+                        mock.patch.object(shuffle.threading, 'Thread', FakeThread)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        artist = Artist.objects.create(name='Artist')
+        other = Artist.objects.create(name='Other')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        other_album = Album.objects.create(title='Other album', artist=other, release_date=datetime.date(2021, 1, 1))
+        self.songs = [
+            Song.objects.create(title=f'Song {i}', artist=artist if i < 10 else other,
+                                album=album if i < 10 else other_album, audio_file=f'songs/{i}.mp3')
+            for i in range(25)
+        ]
+        self.seed = self.songs[0]
+
+    def queue(self, n=None, token=None, seed=None):
+        params = {}
+        if n is not None:
+            params['n'] = n
+        if token is not None:
+            params['continue'] = token
+        return self.client.get(reverse('radio_queue', args=[(seed or self.seed).pk]), params)
+
+    def ids(self, response):
+        return [song['id'] for song in json.loads(response.content)['songs']]
+
+    def test_queue_length(self):
+        self.assertEqual(len(self.ids(self.queue(n=5))), 5)
+        # По умолчанию RADIO_BATCH, но из 24 треков 5 уже звучали в этой сессии
+        self.assertEqual(views.RADIO_BATCH, 20)
+        self.assertEqual(len(self.ids(self.queue(n='abc'))), 19)
+        self.client.cookies.clear()
+        with mock.patch.object(radio, 'MAX_BATCH', 3):
+            self.assertEqual(len(self.ids(self.queue(n=1000))), 3)
+        self.assertEqual(len(self.ids(self.queue(n=0))), 1)
+
+    def test_no_repeats_and_seed_excluded(self):
+        seen, token = [], None
+        while True:
+            response = self.queue(n=7, token=token)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            if not data['songs']:
+                self.assertIsNone(data['continue'])
+                break
+            seen += self.ids(response)
+            token = data['continue']
+        self.assertNotIn(self.seed.pk, seen)
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), {song.pk for song in self.songs[1:]})
+        # Сначала треки того же альбома и исполнителя, потом остальной каталог
+        self.assertEqual(set(seen[:9]), {song.pk for song in self.songs[1:10]})
+
+    def test_chain_follows_neighbors(self):
+        # Сосед каждого трека — следующий по id, у seed — ещё и он сам и уже выданный трек
+        def neighbors(song_id):
+            return [(self.seed.pk, 1.0), (song_id + 1, 0.5)] if song_id < self.songs[-1].pk else []
+
+        with mock.patch.object(similarity, 'neighbors', side_effect=neighbors):
+            first = json.loads(self.queue(n=3).content)
+            self.assertEqual([song['id'] for song in first['songs']], [song.pk for song in self.songs[1:4]])
+            # Продолжение идёт от последнего выданного трека; n=0 — один трек
+            second = self.ids(self.queue(n=0, token=first['continue']))
+        self.assertEqual(second, [self.songs[4].pk])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.queue(token='broken').status_code, 400)
+        token = json.loads(self.queue(n=2, seed=self.songs[5]).content)['continue']
+        # Токен другого радио не подходит
+        self.assertEqual(self.queue(token=token).status_code, 400)
+        self.assertEqual(self.client.get(reverse('radio_queue', args=[10 ** 9])).status_code, 404)
+
+    def test_continues_from_seed_when_last_song_deleted(self):
+        data = json.loads(self.queue(n=2).content)
+        Song.objects.filter(pk=data['songs'][-1]['id']).delete()
+        response = self.queue(n=2, token=data['continue'])
+        self.assertEqual(response.status_code, 200)
+        ids = self.ids(response)
+        self.assertEqual(len(ids), 2)
+        self.assertNotIn(data['songs'][0]['id'], ids)
+        self.assertNotIn(self.seed.pk, ids)
+
+
+def _off_event_loop(function, calls):
+    """Обёртка, которая запоминает, был ли вызов внутри работающего event loop."""
+    def wrapper(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            calls.append('event loop')
+        except RuntimeError:
+            calls.append('thread')
+        return function(*args, **kwargs)
+    return wrapper
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(media_root, 'songs'))
+        with open(os.path.join(media_root, 'songs', 'a.mp3'), 'wb') as f:
+            f.write(_mp3_file(4))
+
+        artist = Artist.objects.create(name='Artist')
+        album = Album.objects.create(title='Album', artist=artist, release_date=datetime.date(2020, 1, 1))
+        self.song = Song.objects.create(title='Song', artist=artist, album=album, audio_file='songs/a.mp3')
+        self.other = Song.objects.create(title='Other', artist=artist, album=album, audio_file='songs/missing.mp3')
+        self.factory = RequestFactory()
+
+    def test_similar_songs_samples_model_in_thread(self):
+        calls = []
+        sample = _off_event_loop(lambda *args, **kwargs: [self.other.pk], calls)
+        with mock.patch.object(similarity, 'sample_neighbors', side_effect=sample):
+            response = async_to_sync(async_views.similar_songs)(self.factory.get('/'), self.song.pk)
+        self.assertEqual(json.loads(response.content)['id'], self.other.pk)
+        self.assertEqual(calls, ['thread'])
+
+    def test_stream_audio_touches_files_in_thread(self):
+        calls = []
+        exists = _off_event_loop(os.path.exists, calls)
+        serve = _off_event_loop(serve_file, calls)
+        with mock.patch.object(async_views.os.path, 'exists', side_effect=exists), \
+                mock.patch.object(async_views, 'serve_file', side_effect=serve):
+            response = async_to_sync(async_views.stream_audio)(self.factory.get('/'), self.song.pk)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(_content(response), _mp3_file(4))
+            self.assertEqual(calls, ['thread', 'thread'])
+
+            missing = async_to_sync(async_views.stream_audio)(self.factory.get('/'), self.other.pk)
+        self.assertEqual(missing.status_code, 404)
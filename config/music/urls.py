@@ -1,7 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth.views import LogoutView
 from . import views
 
+# Стриминг и лёгкие API-эндпоинты: async-версии для ASGI-воркеров
+if getattr(settings, 'ASYNC_API_VIEWS', False):
+    from . import async_views as api_views
+else:
+    api_views = views
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('search/', views.search, name='search'),
@@ -12,15 +19,21 @@ urlpatterns = [
     path('playlist/create/', views.create_playlist, name='create_playlist'),
     path('song/<int:song_pk>/add-to-playlist/', views.add_to_playlist, name='add_to_playlist'),
     path('song/<int:song_pk>/favorite/', views.toggle_favorite, name='toggle_favorite'),
-    path('song/<int:song_pk>/play/', views.play_song, name='play_song'),
-    path('song/<int:song_pk>/stream/', views.stream_audio, name='stream_audio'),
+    path('song/<int:song_pk>/play/', api_views.play_song, name='play_song'),
+    path('song/<int:song_pk>/stream/', api_views.stream_audio, name='stream_audio'),
     path('playlist/<int:playlist_pk>/remove-song/<int:song_pk>/', views.remove_song_from_playlist, name='remove_song_from_playlist'),
     path('playlist/<int:pk>/upload-cover/', views.upload_playlist_cover, name='upload_playlist_cover'),
+    path('playlist/<int:pk>/songs/add/', views.playlist_add_songs, name='playlist_add_songs'),
+    path('playlist/<int:pk>/songs/remove/', views.playlist_remove_songs, name='playlist_remove_songs'),
+    path('playlist/<int:pk>/songs/reorder/', views.playlist_reorder, name='playlist_reorder'),
     path('favorites/', views.favorites, name='favorites'),
     path('register/', views.register, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', LogoutView.as_view(next_page='home'), name='logout'),
     path('playlist/<int:pk>/edit/', views.edit_playlist, name='edit_playlist'),
-    path('api/random-song/', views.random_song, name='random_song'),
-    path('api/similar-songs/<int:song_id>/', views.similar_songs, name='similar_songs'),
+    path('api/random-song/', api_views.random_song, name='random_song'),
+    path('api/similar-songs/<int:song_id>/', api_views.similar_songs, name='similar_songs'),
+    path('api/songs/', api_views.songs_batch, name='songs_batch'),
+    path('api/radio/<int:song_id>/', api_views.radio_queue, name='radio_queue'),
+    path('api/suggest/', views.suggest, name='suggest'),
 ]
\ No newline at end of file
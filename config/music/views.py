@@ -1,214 +1,185 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.db.models.functions import Lower
-from django.http import JsonResponse, StreamingHttpResponse, HttpResponse, FileResponse
-from .models import Song, Artist, Album, Playlist, Favorite, PlayHistory
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse, FileResponse, Http404
+from .models import Song, Artist, Album, Playlist, PlaylistSong, Favorite, PlayHistory, SeekIndex
+from .search import clean_cursor as clean_search_cursor, get_backend as get_search_backend
+from . import suggest as suggest_index
+from .plays import record_play
+from .recommendations import get_recommendations
+from . import playlists as playlist_ops, radio, shuffle, similarity
+from .streaming import serve_file
+from . import seektable
+from .page_cache import cache_anonymous_page, catalog_version
+from .pagination import make_page, next_page_url, paginate, request_cursor
 from django.views.decorators.http import require_POST
 from django.http import HttpResponseForbidden
+from django.utils.cache import get_conditional_response, patch_cache_control
+import hashlib
+import json
 import os
 import mimetypes
 import re
+from urllib.parse import quote
 
+@cache_anonymous_page
 def home(request):
-    # Новинки по дате релиза альбома (самые свежие релизы)
-    recent_songs = Song.objects.select_related('album', 'artist').order_by('-album__release_date')[:3]
-    popular_songs = Song.objects.order_by('-plays')[:3]  # 3 самых популярных
-    artists = Artist.objects.annotate(song_count=Count('songs')).order_by('-song_count')[:8]  # Популярные артисты
-    albums = Album.objects.order_by('-release_date')[:8]  # Новые альбомы
+    # Новинки по дате релиза альбома (самые свежие релизы). Сначала три свежих
+    # непустых альбома по индексу, иначе сортировка по JOIN читает все треки
+    newest_albums = Album.objects.filter(song_count__gt=0).order_by('-release_date').values('pk')[:3]
+    recent_songs = Song.objects.select_related('album', 'artist') \
+        .filter(album__in=newest_albums).order_by('-album__release_date')[:3]
+    popular_songs = Song.objects.select_related('artist', 'album').order_by('-plays')[:3]  # 3 самых популярных
+    artists = Artist.objects.order_by('-song_count')[:8]  # Популярные артисты (индекс по счётчику)
+    albums = Album.objects.select_related('artist').order_by('-release_date')[:8]  # Новые альбомы
     
     # Рекомендации для авторизованных пользователей
     recommended_songs = []
     recommended_artists = []
     recommended_albums = []
-    
+
     if request.user.is_authenticated:
-        favorite_ids = list(Favorite.objects.filter(user=request.user).values_list('song_id', flat=True))
-        
-        # Получаем топ-3 артистов из истории прослушиваний пользователя
-        top_artists = PlayHistory.objects.filter(user=request.user) \
-            .values('song__artist') \
-            .annotate(play_count=Count('id')) \
-            .order_by('-play_count')[:3]
-        
-        if top_artists:
-            artist_ids = [a['song__artist'] for a in top_artists]
-            
-            # Получаем ID треков, которые пользователь уже слушал
-            listened_song_ids = set(PlayHistory.objects.filter(user=request.user).values_list('song_id', flat=True))
-            
-            # 1. Рекомендуем ТРЕКИ этих артистов, которые пользователь ещё не слушал
-            recommended_songs = Song.objects.filter(
-                artist_id__in=artist_ids
-            ).exclude(
-                id__in=listened_song_ids
-            ).order_by('-plays')[:6]
-            
-            # Если рекомендаций мало, добавляем популярные треки
-            if len(recommended_songs) < 6:
-                additional = Song.objects.filter(
-                    artist_id__in=artist_ids
-                ).exclude(
-                    id__in=list(listened_song_ids) + [s.id for s in recommended_songs]
-                ).order_by('-created_at')[:6 - len(recommended_songs)]
-                recommended_songs = list(recommended_songs) + list(additional)
-            
-            # 2. Рекомендуем ИСПОЛНИТЕЛЕЙ (похожих по жанру или популярных)
-            # Исключаем артистов, которых пользователь уже слушает
-            listened_artist_ids = set(PlayHistory.objects.filter(user=request.user).values_list('song__artist_id', flat=True))
-            recommended_artists = Artist.objects.exclude(
-                id__in=listened_artist_ids
-            ).annotate(
-                song_count=Count('songs')
-            ).filter(
-                song_count__gte=2  # Только артисты с 2+ треками
-            ).order_by('-song_count')[:6]
-            
-            # 3. Рекомендуем АЛЬБОМЫ этих артистов или популярные альбомы
-            recommended_albums = Album.objects.filter(
-                artist_id__in=artist_ids
-            ).exclude(
-                id__in=PlayHistory.objects.filter(user=request.user).values_list('song__album_id', flat=True)
-            ).order_by('-release_date')[:6]
-            
-            # Если альбомов мало, добавляем новые популярные альбомы
-            if len(recommended_albums) < 6:
-                additional_albums = Album.objects.exclude(
-                    id__in=[a.id for a in recommended_albums]
-                ).order_by('-release_date')[:6 - len(recommended_albums)]
-                recommended_albums = list(recommended_albums) + list(additional_albums)
-        
-        # Если нет истории прослушиваний, используем любимые треки
-        if not recommended_songs and favorite_ids:
-            # Получаем артистов из любимых треков
-            favorite_artists = Song.objects.filter(
-                id__in=favorite_ids
-            ).values_list('artist_id', flat=True).distinct()
-            
-            if favorite_artists:
-                # Рекомендуем другие треки этих артистов
-                recommended_songs = Song.objects.filter(
-                    artist_id__in=favorite_artists
-                ).exclude(
-                    id__in=favorite_ids
-                ).order_by('-plays')[:6]
-                
-                # Рекомендуем других исполнителей
-                recommended_artists = Artist.objects.exclude(
-                    id__in=favorite_artists
-                ).annotate(
-                    song_count=Count('songs')
-                ).filter(song_count__gte=2).order_by('-song_count')[:6]
-                
-                # Рекомендуем альбомы
-                recommended_albums = Album.objects.filter(
-                    artist_id__in=favorite_artists
-                ).order_by('-release_date')[:6]
-    else:
-        favorite_ids = []
+        # Один запрос к заранее посчитанной таблице (build_recommendations);
+        # новому пользователю — расчёт по его короткой истории
+        recommended_songs, recommended_artists, recommended_albums = get_recommendations(request.user)
 
     context = {
         'recent_songs': recent_songs,
         'popular_songs': popular_songs,
         'artists': artists,
         'albums': albums,
-        'favorite_ids': favorite_ids,
         'recommended_songs': recommended_songs,
         'recommended_artists': recommended_artists,
         'recommended_albums': recommended_albums,
     }
     return render(request, 'music/home.html', context)
 
+SEARCH_SONGS_PER_PAGE = 20
+SEARCH_CARDS_LIMIT = 10
+ARTIST_SONGS_PER_PAGE = 10
+ARTIST_TOP_SONGS = 10
+
+
+def _song_page(request, template, context, page, songs, song_template, list_id):
+    """
+    Страница списка треков по курсору (music/pagination.py) в трёх видах:
+    вся страница, только строки и новая кнопка «Показать ещё»
+    (``?partial=1``) или JSON (``?format=json``).
+    """
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'songs': [_song_json(song) for song in songs], 'next_cursor': page.next_cursor})
+    context.update({
+        'songs': songs,
+        'song_offset': page.start,
+        'next_url': next_page_url(request, page),
+        'song_template': song_template,
+        'list_id': list_id,
+    })
+    if request.GET.get('partial'):
+        template = 'music/partials/song_page.html'
+    return render(request, template, context)
+
+
 def search(request):
     query = request.GET.get('q', '').strip()
-    
-    # Debug: проверим что приходит
-    print(f"DEBUG Search: query='{query}', repr={repr(query)}, len={len(query)}")
-    
+    # Курсор поиска — [rank, pk] последнего трека (music/search.py)
+    cursor = clean_search_cursor(request_cursor(request, 2))
+
+    songs = []
+    artists = []
+    albums = []
+
     if query:
-        # Нормализуем query для регистро-независимого поиска кириллицы
-        query_lower = query.lower()
-        print(f"DEBUG query_lower='{query_lower}'")
-        
-        # Альтернативный подход: получаем все и фильтруем в Python
-        # Это работает лучше для кириллицы в SQLite
-        all_songs = Song.objects.select_related('artist', 'album').all()
-        songs = [
-            s for s in all_songs 
-            if query_lower in s.title.lower() or query_lower in s.artist.name.lower()
-        ][:20]
-        
-        all_artists = Artist.objects.all()
-        artists = [
-            a for a in all_artists
-            if query_lower in a.name.lower()
-        ][:10]
-        
-        all_albums = Album.objects.select_related('artist').all()
-        albums = [
-            a for a in all_albums
-            if query_lower in a.title.lower() or query_lower in a.artist.name.lower()
-        ][:10]
-        
-        # Debug results
-        print(f"DEBUG Results: songs={len(songs)}, artists={len(artists)}, albums={len(albums)}")
-        if albums:
-            print(f"DEBUG Albums found: {[a.title for a in albums]}")
-    else:
-        songs = []
-        artists = []
-        albums = []
-    
-    if request.user.is_authenticated:
-        favorite_ids = list(Favorite.objects.filter(user=request.user).values_list('song_id', flat=True))
-    else:
-        favorite_ids = []
+        backend = get_search_backend()
+        # Берём на один трек больше, чтобы узнать, есть ли следующая страница
+        songs = backend.search(
+            Song.objects.select_related('artist', 'album'), query,
+            limit=SEARCH_SONGS_PER_PAGE + 1, after=cursor,
+        )
+
+        # Исполнители и альбомы показываем только на первой полной странице
+        if cursor is None and not request.GET.get('partial') and request.GET.get('format') != 'json':
+            artists = backend.search(Artist.objects.all(), query, limit=SEARCH_CARDS_LIMIT)
+            albums = backend.search(Album.objects.select_related('artist'), query, limit=SEARCH_CARDS_LIMIT)
 
+    page = make_page(request, songs, SEARCH_SONGS_PER_PAGE, backend.cursor if query else None, cursor is not None)
     context = {
         'query': query,
-        'songs': songs,
         'artists': artists,
         'albums': albums,
-        'favorite_ids': favorite_ids,
     }
-    return render(request, 'music/search.html', context)
+    return _song_page(request, 'music/search.html', context, page, page.items,
+                      'music/partials/search_song.html', 'search-songs')
 
+def suggest(request):
+    """Подсказки для строки поиска из префиксного индекса в памяти."""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+
+    index = suggest_index.get_index()
+    results = []
+    for kind, pk in index.lookup(query, limit=limit):
+        if kind == suggest_index.ARTIST:
+            name = index.artists.get(pk)
+            if name is None:
+                continue
+            results.append({'type': kind, 'id': pk, 'title': name, 'subtitle': '',
+                            'url': reverse('artist_detail', args=[pk])})
+        elif kind == suggest_index.ALBUM:
+            album = index.albums.get(pk)
+            if album is None:
+                continue
+            title, artist_id = album
+            results.append({'type': kind, 'id': pk, 'title': title,
+                            'subtitle': index.artists.get(artist_id, ''),
+                            'url': reverse('album_detail', args=[pk])})
+        else:
+            song = index.songs.get(pk)
+            if song is None:
+                continue
+            title, artist_id, album_id = song
+            results.append({'type': kind, 'id': pk, 'title': title,
+                            'subtitle': index.artists.get(artist_id, ''),
+                            'url': reverse('album_detail', args=[album_id])})
+    return JsonResponse({'query': query, 'results': results})
+
+@cache_anonymous_page
 def artist_detail(request, pk):
     artist = get_object_or_404(Artist, pk=pk)
-    # Показываем только 10 самых популярных треков артиста
-    songs = artist.songs.order_by('-plays')[:10]
+    songs = artist.songs.select_related('artist', 'album')
+    # Все треки листаются по дате добавления: plays растут между запросами,
+    # и курсор по ним терял бы треки, обогнавшие границу страницы
+    page = paginate(request, songs, ['-created_at', '-id'], page_size=ARTIST_SONGS_PER_PAGE)
     albums = artist.albums.all()
     
-    if request.user.is_authenticated:
-        favorite_ids = list(Favorite.objects.filter(user=request.user).values_list('song_id', flat=True))
-    else:
-        favorite_ids = []
-
     context = {
         'artist': artist,
-        'songs': songs,
         'albums': albums,
-        'favorite_ids': favorite_ids,
     }
-    return render(request, 'music/artist_detail.html', context)
+    # 10 самых популярных — отдельным списком только на первой полной странице
+    if request_cursor(request, 2) is None and not request.GET.get('partial') and request.GET.get('format') != 'json':
+        context['popular'] = list(songs.order_by('-plays', '-id')[:ARTIST_TOP_SONGS])
+    return _song_page(request, 'music/artist_detail.html', context, page, page.items,
+                      'music/partials/artist_song.html', f'artist-{artist.pk}')
 
+@cache_anonymous_page
 def album_detail(request, pk):
-    album = get_object_or_404(Album, pk=pk)
-    songs = album.songs.all()
+    album = get_object_or_404(Album.objects.select_related('artist'), pk=pk)
+    page = paginate(request, album.songs.select_related('artist', 'album'), ['-created_at', '-id'])
     
-    if request.user.is_authenticated:
-        favorite_ids = list(Favorite.objects.filter(user=request.user).values_list('song_id', flat=True))
-    else:
-        favorite_ids = []
-
     context = {
         'album': album,
-        'songs': songs,
-        'favorite_ids': favorite_ids,
     }
-    return render(request, 'music/album_detail.html', context)
+    return _song_page(request, 'music/album_detail.html', context, page, page.items,
+                      'music/partials/album_song.html', f'album-{album.pk}')
 
 @login_required
 def my_playlists(request):
@@ -217,15 +188,15 @@ def my_playlists(request):
 
 @login_required
 def playlist_detail(request, pk):
-    playlist = get_object_or_404(Playlist, pk=pk)
+    playlist = get_object_or_404(Playlist.objects.select_related('user'), pk=pk)
     if playlist.user != request.user:
         return redirect('home')
-    if request.user.is_authenticated:
-        favorite_ids = list(Favorite.objects.filter(user=request.user).values_list('song_id', flat=True))
-    else:
-        favorite_ids = []
 
-    return render(request, 'music/playlist_detail.html', {'playlist': playlist, 'favorite_ids': favorite_ids})
+    entries = PlaylistSong.objects.filter(playlist=playlist).select_related('song__artist', 'song__album')
+    page = paginate(request, entries, ['position', 'id'])
+    songs = [entry.song for entry in page.items]
+    return _song_page(request, 'music/playlist_detail.html', {'playlist': playlist}, page, songs,
+                      'music/partials/playlist_song.html', f'playlist-{playlist.pk}')
 
 
 @login_required
@@ -235,10 +206,97 @@ def remove_song_from_playlist(request, playlist_pk, song_pk):
     if playlist.user != request.user:
         return JsonResponse({'status': 'forbidden'}, status=403)
     song = get_object_or_404(Song, pk=song_pk)
-    playlist.songs.remove(song)
+    playlist_ops.remove_songs(playlist, [song.pk])
     return JsonResponse({'status': 'removed'})
 
 
+def _owned_playlist_json(request, pk):
+    """(плейлист пользователя, тело JSON) или (None, ответ с ошибкой)."""
+    playlist = get_object_or_404(Playlist, pk=pk)
+    if playlist.user_id != request.user.pk:
+        return None, JsonResponse({'status': 'forbidden'}, status=403)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return None, JsonResponse({'status': 'error', 'error': 'Expected a JSON object'}, status=400)
+    return playlist, data
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _id_list(value):
+    """Список id из JSON или None, если это не список целых или он слишком длинный."""
+    if not isinstance(value, list) or len(value) > playlist_ops.BULK_LIMIT or not all(map(_is_id, value)):
+        return None
+    return value
+
+
+def _bad_ids():
+    return JsonResponse(
+        {'status': 'error', 'error': f'song_ids must be a list of at most {playlist_ops.BULK_LIMIT} ids'},
+        status=400,
+    )
+
+
+@login_required
+@require_POST
+def playlist_add_songs(request, pk):
+    """``{"song_ids": [...]}``: добавить треки в конец одной транзакцией."""
+    playlist, data = _owned_playlist_json(request, pk)
+    if playlist is None:
+        return data
+    song_ids = _id_list(data.get('song_ids'))
+    if song_ids is None:
+        return _bad_ids()
+    return JsonResponse({'status': 'success', 'added': playlist_ops.add_songs(playlist, song_ids)})
+
+
+@login_required
+@require_POST
+def playlist_remove_songs(request, pk):
+    """``{"song_ids": [...]}``: убрать треки одной транзакцией."""
+    playlist, data = _owned_playlist_json(request, pk)
+    if playlist is None:
+        return data
+    song_ids = _id_list(data.get('song_ids'))
+    if song_ids is None:
+        return _bad_ids()
+    return JsonResponse({'status': 'success', 'removed': playlist_ops.remove_songs(playlist, song_ids)})
+
+
+@login_required
+@require_POST
+def playlist_reorder(request, pk):
+    """
+    ``{"moves": [{"song": id, "before": id}, {"song": id, "after": id}, ...]}`` —
+    перенос отдельных треков (каждый меняет одну строку; без before/after —
+    в конец) или ``{"song_ids": [...]}`` — новый порядок целиком.
+    """
+    playlist, data = _owned_playlist_json(request, pk)
+    if playlist is None:
+        return data
+    if 'song_ids' in data:
+        song_ids = _id_list(data['song_ids'])
+        if song_ids is None:
+            return _bad_ids()
+        return JsonResponse({'status': 'success', 'updated': playlist_ops.reorder(playlist, song_ids)})
+
+    moves = data.get('moves')
+    if not isinstance(moves, list) or len(moves) > playlist_ops.BULK_LIMIT:
+        return JsonResponse({'status': 'error', 'error': 'Expected "moves" or "song_ids"'}, status=400)
+    parsed = []
+    for item in moves:
+        anchor = item.get('after', item.get('before')) if isinstance(item, dict) else None
+        if not isinstance(item, dict) or not _is_id(item.get('song')) or not (anchor is None or _is_id(anchor)):
+            return JsonResponse({'status': 'error', 'error': 'Invalid move'}, status=400)
+        parsed.append((item['song'], anchor, 'after' in item))
+    return JsonResponse({'status': 'success', 'moved': playlist_ops.move(playlist, parsed)})
+
+
 @login_required
 @require_POST
 def upload_playlist_cover(request, pk):
@@ -291,7 +349,7 @@ def add_to_playlist(request, song_pk):
     if request.method == 'POST':
         playlist_pk = request.POST.get('playlist_id')
         playlist = get_object_or_404(Playlist, pk=playlist_pk, user=request.user)
-        playlist.songs.add(song)
+        playlist_ops.add_songs(playlist, [song.pk])
         return JsonResponse({'status': 'success'})
 
     playlists = request.user.playlists.all()
@@ -310,108 +368,180 @@ def toggle_favorite(request, song_pk):
 
 @login_required
 def favorites(request):
-    favorite_songs = Song.objects.filter(favorited_by__user=request.user)
-    # favorites page shows only the user's favorites, so favorite_ids is simply the list of those ids
-    favorite_ids = list(favorite_songs.values_list('pk', flat=True))
-    return render(request, 'music/favorites.html', {'songs': favorite_songs, 'favorite_ids': favorite_ids})
+    # Новые лайки сверху; курсор по индексу (user, -created_at)
+    entries = Favorite.objects.filter(user=request.user).select_related('song__artist', 'song__album')
+    page = paginate(request, entries, ['-created_at', '-id'])
+    songs = [favorite.song for favorite in page.items]
+    # favorite_ids приходит из music.context_processors.favorites
+    return _song_page(request, 'music/favorites.html', {}, page, songs,
+                      'music/partials/favorite_song.html', 'favorites')
 
 def play_song(request, song_pk):
-    song = get_object_or_404(Song, pk=song_pk)
-    song.plays += 1
-    song.save()
-    
-    if request.user.is_authenticated:
-        PlayHistory.objects.create(user=request.user, song=song)
+    user_id = request.user.pk if request.user.is_authenticated else None
+    if not record_play(song_pk, user_id):
+        raise Http404('Song not found')
     return JsonResponse({'status': 'success'})
 
 def random_song(request):
-    """Return a random song from the database as JSON."""
-    exclude_id = request.GET.get('exclude', None)
-    qs = Song.objects.all()
-    if exclude_id:
-        qs = qs.exclude(pk=exclude_id)
-    song = qs.order_by('?').first()
+    """
+    Return a random song as JSON.
+
+    ``exclude`` is a comma-separated list of song ids to skip,
+    ``weighted=1`` favours popular songs.
+    """
+    exclude_param = request.GET.get('exclude', '')
+    exclude_ids = set(_query_ids(exclude_param))
+    weighted = request.GET.get('weighted') in ('1', 'true')
+
+    pool = shuffle.get_pool()
+    song = None
+    for _ in range(2):
+        pk = pool.sample(exclude=exclude_ids, weighted=weighted)
+        if pk is None:
+            break
+        song = Song.objects.select_related('artist', 'album').filter(pk=pk).first()
+        if song:
+            break
+        # Трек удалён в другом воркере — пул устарел; пока он перестраивается, выбираем из старого
+        exclude_ids.add(pk)
+        shuffle.invalidate()
+        pool = shuffle.get_pool()
+
     if song:
         return JsonResponse({
             'id': song.pk,
             'url': song.get_stream_url(),
             'title': song.title,
             'artist': song.artist.name if song.artist else '',
-            'cover': song.get_cover()
+            'cover': song.get_cover(640)
         })
     return JsonResponse({'error': 'No songs available'}, status=404)
 
 def stream_audio(request, song_pk):
-    """Stream audio file with support for HTTP Range requests (seeking)."""
-    song = get_object_or_404(Song, pk=song_pk)
+    """
+    Stream audio file with support for HTTP Range requests (seeking).
+
+    With ``AUDIO_ACCEL_REDIRECT`` set, Django only resolves the file and
+    nginx serves it (ranges included) via ``X-Accel-Redirect``.
+
+    ``?t=<seconds>`` starts the stream at the frame boundary from the
+    song's seek table (music/seektable.py); without a table it is a 404 and
+    the player falls back to the plain URL.
+    """
+    song = get_object_or_404(Song.objects.only('audio_file'), pk=song_pk)
     
     if not song.audio_file:
         return HttpResponse('Audio file not found', status=404)
+
+    seconds = seektable.parse_seconds(request.GET.get('t'))
+    accel_prefix = getattr(settings, 'AUDIO_ACCEL_REDIRECT', None)
+    if accel_prefix and seconds is None:
+        content_type, _ = mimetypes.guess_type(song.audio_file.name)
+        response = HttpResponse(content_type=content_type or 'audio/mpeg')
+        response['X-Accel-Redirect'] = accel_prefix + quote(song.audio_file.name)
+        return response
     
     # Get the file path
     file_path = song.audio_file.path
-    file_size = os.path.getsize(file_path)
+    if not os.path.exists(file_path):
+        return HttpResponse('Audio file not found', status=404)
     
     # Get content type
     content_type, _ = mimetypes.guess_type(file_path)
     if not content_type:
         content_type = 'audio/mpeg'
     
-    # Check if this is a range request
-    range_header = request.META.get('HTTP_RANGE', '').strip()
-    range_match = None
-    
-    if range_header:
-        # Parse range header (e.g., "bytes=0-1023")
-        import re
-        range_match = re.search(r'bytes=(\d+)-(\d*)', range_header)
-    
-    if range_match:
-        # Handle range request
-        start = int(range_match.group(1))
-        end = range_match.group(2)
-        end = int(end) if end else file_size - 1
-        end = min(end, file_size - 1)
-        length = end - start + 1
-        
-        # Open file and seek to start position
-        with open(file_path, 'rb') as f:
-            f.seek(start)
-            data = f.read(length)
-        
-        response = HttpResponse(data, status=206, content_type=content_type)
-        response['Content-Length'] = str(length)
-        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
-        response['Accept-Ranges'] = 'bytes'
-        return response
-    else:
-        # Regular request - return full file
-        response = FileResponse(open(file_path, 'rb'), content_type=content_type)
-        response['Content-Length'] = str(file_size)
-        response['Accept-Ranges'] = 'bytes'
+    if seconds is not None:
+        index = SeekIndex.objects.filter(song_id=song.pk).first()
+        if index is None:
+            return HttpResponse('Seek index not found', status=404)
+        prefix, start, end, start_seconds = seektable.seek(index, file_path, seconds)
+        response = serve_file(request, file_path, content_type, start=start, end=end, prefix=prefix)
+        response['X-Seek-Start'] = str(start_seconds)
         return response
 
+    # Range, multi-range and conditional requests, read in fixed-size chunks
+    return serve_file(request, file_path, content_type)
 
-def similar_songs(request, song_id):
+
+def _song_json(song):
+    return {
+        'id': song.id,
+        'title': song.title,
+        'artist': song.artist.name,
+        'cover': song.get_cover(640),
+        'stream_url': song.get_stream_url(),
+        'duration': song.duration,
+    }
+
+
+SONGS_BATCH_LIMIT = 100
+SONGS_BATCH_MAX_AGE = 300
+
+
+# Только ASCII-цифры: str.isdigit() пропускает «²» и прочие, на которых int() падает,
+# а длина ограничена, чтобы число влезало в bigint
+_QUERY_ID_RE = re.compile(r'[0-9]{1,18}')
+
+
+def _query_ids(value):
+    """id из строки вида '1,2,3' в исходном порядке, без повторов; мусор пропускается."""
+    parts = (part.strip() for part in value.split(','))
+    return list(dict.fromkeys(int(part) for part in parts if _QUERY_ID_RE.fullmatch(part)))
+
+
+def _batch_ids(request):
+    """id из ?ids=1,2,3 в порядке запроса, без повторов."""
+    return _query_ids(request.GET.get('ids', ''))
+
+
+def _batch_etag(ids):
+    """Ответ зависит только от каталога, поэтому ETag считается без запроса к БД."""
+    key = f'{catalog_version()}:{",".join(map(str, ids))}'
+    return '"%s"' % hashlib.md5(key.encode()).hexdigest()
+
+
+def _batch_headers(response, etag):
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=SONGS_BATCH_MAX_AGE)
+    return response
+
+
+def _batch_response(ids, etag, songs):
+    return _batch_headers(JsonResponse({
+        'songs': [_song_json(songs[pk]) for pk in ids if pk in songs],
+        'missing': [pk for pk in ids if pk not in songs],
+    }), etag)
+
+
+def songs_batch(request):
     """
-    Возвращает похожие треки на основе исполнителя и альбома текущего трека
+    Метаданные многих треков одним запросом: ``/api/songs/?ids=1,2,3``.
+    Плеер восстанавливает очередь по списку id, а повторный запрос того же
+    списка при неизменном каталоге получает 304 без обращения к БД.
     """
-    try:
-        current_song = Song.objects.get(pk=song_id)
-    except Song.DoesNotExist:
-        return JsonResponse({'error': 'Song not found'}, status=404)
-    
-    exclude_param = request.GET.get('exclude', '')
-    exclude_ids = [int(id_str) for id_str in exclude_param.split(',') if id_str.strip().isdigit()]
-    if song_id not in exclude_ids:
-        exclude_ids.append(song_id)
-    
+    ids = _batch_ids(request)
+    if len(ids) > SONGS_BATCH_LIMIT:
+        return JsonResponse({'error': f'Не больше {SONGS_BATCH_LIMIT} id за запрос'}, status=400)
+    etag = _batch_etag(ids)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return _batch_headers(not_modified, etag)
+    songs = Song.objects.select_related('artist', 'album').in_bulk(ids)
+    return _batch_response(ids, etag, songs)
+
+
+def _similar_by_catalog(current_song, exclude_ids):
+    """Эвристики по альбому и исполнителю — для треков, которых ещё нет в модели."""
+    # По *_id, без загрузки альбома и артиста текущего трека; select_related — для ответа
+    songs = Song.objects.select_related('artist', 'album').exclude(id__in=exclude_ids)
+
     # Приоритет 1: Треки из того же альбома
-    similar = list(Song.objects.filter(album=current_song.album).exclude(id__in=exclude_ids)[:10])
+    similar = list(songs.filter(album_id=current_song.album_id)[:10])
     
     # Приоритет 2: Треки от того же исполнителя
     if len(similar) < 5:
-        artist_songs = list(Song.objects.filter(artist=current_song.artist).exclude(id__in=exclude_ids).order_by('-plays')[:10])
+        artist_songs = list(songs.filter(artist_id=current_song.artist_id).order_by('-plays')[:10])
         for song in artist_songs:
             if song not in similar:
                 similar.append(song)
@@ -420,28 +550,82 @@ def similar_songs(request, song_id):
     
     # Приоритет 3: Популярные треки если похожих мало
     if len(similar) < 3:
-        popular = list(Song.objects.exclude(id__in=exclude_ids).order_by('-plays')[:5])
+        popular = list(songs.order_by('-plays')[:5])
         for song in popular:
             if song not in similar:
                 similar.append(song)
             if len(similar) >= 10:
                 break
-    
+    return similar
+
+
+def similar_songs(request, song_id):
+    """
+    Возвращает похожий трек: взвешенная выборка из таблицы соседей
+    (music/similarity.py), а для новых треков — по исполнителю и альбому
+    """
+    exclude_param = request.GET.get('exclude', '')
+    exclude_ids = _query_ids(exclude_param)
+    if song_id not in exclude_ids:
+        exclude_ids.append(song_id)
+
+    candidates = similarity.sample_neighbors(song_id, exclude=exclude_ids, count=3)
+    if candidates:
+        songs = Song.objects.select_related('artist', 'album').in_bulk(candidates)
+        for pk in candidates:
+            # Трек мог быть удалён после построения модели
+            if pk in songs:
+                return JsonResponse(_song_json(songs[pk]))
+
+    try:
+        current_song = Song.objects.get(pk=song_id)
+    except Song.DoesNotExist:
+        return JsonResponse({'error': 'Song not found'}, status=404)
+
+    similar = _similar_by_catalog(current_song, exclude_ids)
     if similar:
         import random
         song = random.choice(similar)
-        return JsonResponse({
-            'id': song.id,
-            'title': song.title,
-            'artist': song.artist.name,
-            'cover': song.get_cover(),
-            'stream_url': song.get_stream_url(),
-            'duration': song.duration,
-        })
+        return JsonResponse(_song_json(song))
     else:
         return JsonResponse({'error': 'No similar songs found'}, status=404)
 
 
+RADIO_BATCH = 20
+
+
+def radio_queue(request, song_id):
+    """
+    Следующие треки джем-режима пачкой (music/radio.py): ``?n=`` треков и
+    токен ``continue`` для следующей пачки. История сессии не даёт повторов.
+    """
+    try:
+        count = min(max(int(request.GET.get('n', RADIO_BATCH)), 1), radio.MAX_BATCH)
+    except ValueError:
+        count = RADIO_BATCH
+    start_id = song_id
+    token = request.GET.get('continue')
+    if token:
+        start_id = radio.read_token(token, song_id)
+        if start_id is None:
+            return JsonResponse({'error': 'Invalid continuation token'}, status=400)
+
+    history = request.session.get(radio.HISTORY_KEY, [])
+    songs = radio.next_batch(start_id, count, exclude=[song_id, *history])
+    if songs is None and token:
+        # Последний выданный трек успели удалить — продолжаем от исходного
+        songs = radio.next_batch(song_id, count, exclude=history)
+    if songs is None:
+        return JsonResponse({'error': 'Song not found'}, status=404)
+
+    if songs:
+        request.session[radio.HISTORY_KEY] = radio.remember(history, [song.pk for song in songs])
+    return JsonResponse({
+        'songs': [_song_json(song) for song in songs],
+        'continue': radio.make_token(song_id, songs[-1].pk) if songs else None,
+    })
+
+
 def register(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
@@ -0,0 +1,122 @@
+// «Показать ещё»: следующая страница списка по курсору (?partial=1 отдаёт только строки и новую кнопку).
+// Без JS ссылка просто открывает следующую страницу целиком
+function loadMore(link) {
+    const list = document.querySelector(link.dataset.list);
+    const wrapper = link.closest('.load-more');
+    if (!list || !wrapper) return true;
+    link.classList.add('loading');
+    const url = link.href + (link.href.includes('?') ? '&' : '?') + 'partial=1';
+    fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+        .then(res => {
+            if (!res.ok) throw new Error(res.status);
+            return res.text();
+        })
+        .then(html => {
+            const tpl = document.createElement('template');
+            tpl.innerHTML = html;
+            tpl.content.querySelectorAll('li.song-item').forEach(li => list.appendChild(li));
+            const next = tpl.content.querySelector('.load-more');
+            if (next) wrapper.replaceWith(next); else wrapper.remove();
+            // Очередь, собранная из этого списка, продолжается подгруженными треками
+            if (!isJamMode && playQueue.length && list.contains(playQueue[0].element)) {
+                playQueue = buildQueueFromList(list);
+            }
+        })
+        .catch(() => { window.location.href = link.href; });
+    return false;
+}
+
+// CSRF helper and global toggleFavorite exposed for all pages
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            // Does this cookie string begin with the name we want?
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+function toggleFavorite(songId) {
+    fetch(`/song/${songId}/favorite/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': getCookie('csrftoken'),
+            'X-Requested-With': 'XMLHttpRequest',
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({})
+    })
+    .then(response => {
+        if (response.status === 403) {
+            window.location.href = '/login/';
+            return null;
+        }
+        return response.json();
+    })
+    .then(data => {
+        if (!data) return;
+        const btn = document.querySelector(`button[onclick*="toggleFavorite('${songId}')"]`);
+        if (data.status === 'removed') {
+            if (window.location.pathname.startsWith('/favorites')) {
+                location.reload();
+                return;
+            }
+            if (btn) {
+                btn.classList.remove('favorited');
+                const icon = btn.querySelector('i');
+                if (icon) {
+                    icon.classList.remove('mdi-heart');
+                    icon.classList.add('mdi-heart-outline');
+                } else {
+                    btn.textContent = '♡';
+                }
+            }
+            // update player like button if it corresponds to this song
+            const playerLike = document.getElementById('player-like-btn');
+            if (playerLike && window.currentSongId == songId) {
+                playerLike.classList.remove('favorited');
+                const iconP = playerLike.querySelector('i');
+                if (iconP) { iconP.classList.remove('mdi-heart'); iconP.classList.add('mdi-heart-outline'); }
+            }
+            // update fullscreen like button
+            const fullscreenLike = document.getElementById('fullscreen-like-btn');
+            if (fullscreenLike && window.currentSongId == songId) {
+                fullscreenLike.classList.remove('favorited');
+                const iconF = fullscreenLike.querySelector('i');
+                if (iconF) { iconF.classList.remove('mdi-heart'); iconF.classList.add('mdi-heart-outline'); }
+            }
+        } else if (data.status === 'added') {
+            if (btn) {
+                btn.classList.add('favorited');
+                const icon = btn.querySelector('i');
+                if (icon) {
+                    icon.classList.remove('mdi-heart-outline');
+                    icon.classList.add('mdi-heart');
+                } else {
+                    btn.textContent = '♥';
+                }
+            }
+            const playerLike = document.getElementById('player-like-btn');
+            if (playerLike && window.currentSongId == songId) {
+                playerLike.classList.add('favorited');
+                const iconP = playerLike.querySelector('i');
+                if (iconP) { iconP.classList.remove('mdi-heart-outline'); iconP.classList.add('mdi-heart'); }
+            }
+            // update fullscreen like button
+            const fullscreenLike = document.getElementById('fullscreen-like-btn');
+            if (fullscreenLike && window.currentSongId == songId) {
+                fullscreenLike.classList.add('favorited');
+                const iconF = fullscreenLike.querySelector('i');
+                if (iconF) { iconF.classList.remove('mdi-heart-outline'); iconF.classList.add('mdi-heart'); }
+            }
+        }
+    })
+    .catch(err => console.error('Favorite toggle error:', err));
+}
@@ -0,0 +1,829 @@
+// Базовый плеер
+const audioPlayer = document.getElementById('audio-player');
+const cardImage = document.getElementById('card-image');
+const playPauseBtn = document.getElementById('play-pause-btn');
+const playPauseIcon = () => playPauseBtn.querySelector('i');
+const progressBar = document.getElementById('progress-bar');
+const progressFill = document.getElementById('progress-fill');
+const progressHandle = document.getElementById('progress-handle');
+const curTimeEl = document.getElementById('current-time');
+const totTimeEl = document.getElementById('total-time');
+const prevBtn = document.getElementById('prev-btn');
+const nextBtn = document.getElementById('next-btn');
+
+let currentSongId = null;
+let currentPlayingElement = null; // Track the actual DOM element that's playing
+// Queue state
+let playQueue = [];
+let queueIndex = -1;
+let queueMode = 'sequential'; // 'sequential' | 'shuffle' | 'radio'
+let isJamMode = false; // Jam mode for home page (fetch random songs but keep highlight)
+let jamSourceElement = null; // Element that started the jam
+
+// Fullscreen player elements
+const fullscreenPlayer = document.getElementById('fullscreen-player');
+const fullscreenCover = document.getElementById('fullscreen-cover');
+const fullscreenSongTitle = document.getElementById('fullscreen-song-title');
+const fullscreenSongArtist = document.getElementById('fullscreen-song-artist');
+const fullscreenPlayBtn = document.getElementById('fullscreen-play-btn');
+const fullscreenProgressBar = document.getElementById('fullscreen-progress-bar');
+const fullscreenProgressFill = document.getElementById('fullscreen-progress-fill');
+const fullscreenProgressHandle = document.getElementById('fullscreen-progress-handle');
+const fullscreenCurrentTime = document.getElementById('fullscreen-current-time');
+const fullscreenTotalTime = document.getElementById('fullscreen-total-time');
+const fullscreenLikeBtn = document.getElementById('fullscreen-like-btn');
+const fullscreenModeBtn = document.getElementById('fullscreen-mode-btn');
+
+// Open fullscreen player on mobile
+function openFullscreenPlayer() {
+    if (window.innerWidth <= 768) {
+        fullscreenPlayer.classList.add('active');
+        updateFullscreenPlayer();
+    }
+}
+
+// Close fullscreen player
+function closeFullscreenPlayer() {
+    fullscreenPlayer.classList.remove('active');
+}
+
+// Update fullscreen player data
+function updateFullscreenPlayer() {
+    const miniCover = cardImage.src;
+    const miniTitle = document.getElementById('current-song-title').textContent;
+    const miniArtist = document.getElementById('current-song-artist').textContent;
+
+    fullscreenCover.src = miniCover;
+    fullscreenSongTitle.textContent = miniTitle;
+    fullscreenSongArtist.textContent = miniArtist;
+
+    // Sync play/pause button
+    const isPlaying = !audioPlayer.paused;
+    const fsIcon = fullscreenPlayBtn.querySelector('i');
+    if (fsIcon) {
+        fsIcon.className = isPlaying ? 'mdi mdi-pause' : 'mdi mdi-play';
+    }
+
+    // Sync like button
+    const miniLikeBtn = document.getElementById('player-like-btn');
+    if (miniLikeBtn && fullscreenLikeBtn) {
+        const isFavorited = miniLikeBtn.classList.contains('favorited');
+        if (isFavorited) {
+            fullscreenLikeBtn.classList.add('favorited');
+            fullscreenLikeBtn.querySelector('i').className = 'mdi mdi-heart';
+        } else {
+            fullscreenLikeBtn.classList.remove('favorited');
+            fullscreenLikeBtn.querySelector('i').className = 'mdi mdi-heart-outline';
+        }
+    }
+
+    // Sync mode button
+    if (fullscreenModeBtn) {
+        const fsModeBtnIcon = fullscreenModeBtn.querySelector('i');
+        const miniModeBtn = document.getElementById('mode-btn');
+        if (miniModeBtn && fsModeBtnIcon) {
+            const miniModeBtnIcon = miniModeBtn.querySelector('i');
+            if (miniModeBtnIcon) {
+                fsModeBtnIcon.className = miniModeBtnIcon.className;
+                fullscreenModeBtn.title = miniModeBtn.title;
+            }
+        }
+    }
+
+    // Sync add to playlist link
+    const fsAddLink = document.getElementById('fullscreen-add-to-playlist');
+    const miniAddLink = document.getElementById('player-add-to-playlist');
+    if (fsAddLink && miniAddLink && currentSongId) {
+        fsAddLink.href = `/song/${currentSongId}/add-to-playlist/`;
+    }
+}
+
+// Make mini-player clickable on mobile
+document.querySelector('.player').addEventListener('click', function(e) {
+    // Don't open if clicking on buttons
+    if (e.target.closest('button') || e.target.closest('.icon-btn') || e.target.closest('.menu-dropdown')) {
+        return;
+    }
+    openFullscreenPlayer();
+});
+
+// Setup fullscreen progress bar
+let fullscreenProgressDragging = false;
+
+fullscreenProgressBar.addEventListener('mousedown', (e) => {
+    fullscreenProgressDragging = true;
+    seekFullscreenProgress(e);
+});
+
+fullscreenProgressBar.addEventListener('touchstart', (e) => {
+    fullscreenProgressDragging = true;
+    seekFullscreenProgress(e.touches[0]);
+});
+
+document.addEventListener('mousemove', (e) => {
+    if (fullscreenProgressDragging) seekFullscreenProgress(e);
+});
+
+document.addEventListener('touchmove', (e) => {
+    if (fullscreenProgressDragging) seekFullscreenProgress(e.touches[0]);
+});
+
+document.addEventListener('mouseup', () => {
+    fullscreenProgressDragging = false;
+});
+
+document.addEventListener('touchend', () => {
+    fullscreenProgressDragging = false;
+});
+
+function seekFullscreenProgress(e) {
+    const rect = fullscreenProgressBar.getBoundingClientRect();
+    const pos = (e.clientX - rect.left) / rect.width;
+    const clampedPos = Math.max(0, Math.min(1, pos));
+    const newTime = clampedPos * playerDuration();
+    if (!isNaN(newTime)) {
+        seekAudio(newTime);
+    }
+}
+
+function setMode(mode) {
+    queueMode = mode;
+    const modeBtn = document.getElementById('mode-btn');
+    const fullscreenModeBtn = document.getElementById('fullscreen-mode-btn');
+
+    // Update mini player mode button
+    if (modeBtn) {
+        const i = modeBtn.querySelector('i');
+        if (i) {
+            i.className = 'mdi';
+            if (mode === 'sequential') { i.classList.add('mdi-arrow-right'); modeBtn.title = 'Режим: по порядку'; }
+            if (mode === 'shuffle') { i.classList.add('mdi-shuffle'); modeBtn.title = 'Режим: случайный'; }
+            if (mode === 'radio') { i.classList.add('mdi-radio-tower'); modeBtn.title = 'Режим: рекомендации'; }
+        }
+    }
+
+    // Update fullscreen mode button
+    if (fullscreenModeBtn) {
+        const i = fullscreenModeBtn.querySelector('i');
+        if (i) {
+            i.className = 'mdi';
+            if (mode === 'sequential') { i.classList.add('mdi-arrow-right'); fullscreenModeBtn.title = 'Режим: по порядку'; }
+            if (mode === 'shuffle') { i.classList.add('mdi-shuffle'); fullscreenModeBtn.title = 'Режим: случайный'; }
+            if (mode === 'radio') { i.classList.add('mdi-radio-tower'); fullscreenModeBtn.title = 'Режим: рекомендации'; }
+        }
+    }
+}
+
+function cycleMode() {
+    if (queueMode === 'sequential') return setMode('shuffle');
+    if (queueMode === 'shuffle') return setMode('radio');
+    return setMode('sequential');
+}
+
+function buildQueueFromList(listEl) {
+    if (!listEl) return [];
+    const items = Array.from(listEl.querySelectorAll('li.song-item'));
+    const q = items.map(li => ({
+        id: li.dataset.songId,
+        url: li.dataset.audio,
+        title: li.dataset.title,
+        artist: li.dataset.artist,
+        cover: li.dataset.cover,
+        element: li // Store reference to the actual DOM element
+    })).filter(x => x.url);
+    return q;
+}
+
+function buildQueueFromCards(containerEl) {
+    if (!containerEl) return [];
+    const cards = Array.from(containerEl.querySelectorAll('.song-card'));
+    const q = cards.map(c => ({
+        id: c.dataset.songId,
+        url: c.dataset.audio,
+        title: c.dataset.title,
+        artist: c.dataset.artist,
+        cover: c.dataset.cover,
+        element: c // Store reference to the actual DOM element
+    })).filter(x => x.url);
+    return q;
+}
+
+function playFromItem(li) {
+    const list = li.closest('ul.song-list');
+    const q = buildQueueFromList(list);
+    if (!q.length) return;
+
+    // Check if we're on the home page or search page (jam mode enabled)
+    const isHomePage = window.location.pathname === '/' || window.location.pathname === '/home/';
+    const isSearchPage = window.location.pathname.startsWith('/search');
+
+    if (isHomePage || isSearchPage) {
+        // Jam mode: play this track, but next tracks will be random from DB
+        isJamMode = true;
+        jamSourceElement = li;
+        startRadio(li.dataset.songId);
+        playQueue = q; // Keep queue for reference, but we'll fetch random songs
+        queueIndex = q.findIndex(s => s.element === li);
+        if (queueIndex < 0) {
+            const id = li.dataset.songId;
+            queueIndex = q.findIndex(s => String(s.id) === String(id));
+        }
+        if (queueIndex < 0) queueIndex = 0;
+        const s = playQueue[queueIndex];
+        playSong(s.url, s.title, s.artist, s.cover, s.id, s.element);
+    } else {
+        // Normal mode: play from queue sequentially
+        isJamMode = false;
+        jamSourceElement = null;
+        playQueue = q;
+        queueIndex = q.findIndex(s => s.element === li);
+        if (queueIndex < 0) {
+            const id = li.dataset.songId;
+            queueIndex = q.findIndex(s => String(s.id) === String(id));
+        }
+        if (queueIndex < 0) queueIndex = 0;
+        const s = playQueue[queueIndex];
+        playSong(s.url, s.title, s.artist, s.cover, s.id, s.element);
+    }
+}
+
+function startCurrent() {
+    if (queueIndex < 0 || queueIndex >= playQueue.length) return;
+    const s = playQueue[queueIndex];
+    playSong(s.url, s.title, s.artist, s.cover, s.id, s.element || null);
+}
+
+function getNextIndex() {
+    if (!playQueue.length) return -1;
+    if (queueMode === 'shuffle') {
+        if (playQueue.length === 1) return queueIndex;
+        let next;
+        do { next = Math.floor(Math.random() * playQueue.length); } while (next === queueIndex);
+        return next;
+    }
+    if (queueMode === 'radio') {
+        // pick random with same artist, else random overall
+        const cur = playQueue[queueIndex];
+        const same = playQueue.map((s, i) => ({ s, i })).filter(x => x.i !== queueIndex && x.s.artist === cur.artist);
+        if (same.length) return same[Math.floor(Math.random() * same.length)].i;
+        if (playQueue.length === 1) return queueIndex;
+        let next;
+        do { next = Math.floor(Math.random() * playQueue.length); } while (next === queueIndex);
+        return next;
+    }
+    // sequential
+    return queueIndex + 1 < playQueue.length ? queueIndex + 1 : -1;
+}
+
+function getPrevIndex() {
+    if (!playQueue.length) return -1;
+    if (queueMode === 'shuffle' || queueMode === 'radio') {
+        // previous just picks another random (best-effort)
+        if (playQueue.length === 1) return queueIndex;
+        let prev;
+        do { prev = Math.floor(Math.random() * playQueue.length); } while (prev === queueIndex);
+        return prev;
+    }
+    return queueIndex - 1 >= 0 ? queueIndex - 1 : -1;
+}
+
+function nextTrack() {
+    // If in jam mode (home page), take the next track from the prefetched radio queue
+    if (isJamMode && currentSongId) {
+        nextRadioSong()
+            .then(data => {
+                if (data && data.stream_url) {
+                    radioPlayed.push(currentSongId);
+                    // Play similar song but keep highlight on jam source
+                    playSong(data.stream_url, data.title, data.artist, data.cover, data.id, jamSourceElement);
+                } else {
+                    audioPlayer.pause();
+                    const icon = playPauseIcon();
+                    if (icon) { icon.classList.remove('mdi-pause'); icon.classList.add('mdi-play'); }
+                }
+            })
+            .catch(err => {
+                console.error('Failed to fetch radio queue:', err);
+                audioPlayer.pause();
+                const icon = playPauseIcon();
+                if (icon) { icon.classList.remove('mdi-pause'); icon.classList.add('mdi-play'); }
+            });
+        return;
+    }
+
+    // Normal mode: play from queue
+    const ni = getNextIndex();
+    if (ni === -1) {
+        // Queue ended - stop playback
+        audioPlayer.pause();
+        const icon = playPauseIcon();
+        if (icon) { icon.classList.remove('mdi-pause'); icon.classList.add('mdi-play'); }
+        return;
+    }
+    queueIndex = ni;
+    startCurrent();
+}
+
+function prevTrack() {
+    // If in jam mode, go back to the previously played radio track
+    if (isJamMode && currentSongId) {
+        const prevId = radioPlayed.pop();
+        if (!prevId) {
+            seekAudio(0);
+            return;
+        }
+        const current = songMeta.get(String(currentSongId));
+        if (current) radioQueue.unshift(current);
+        fetchSongMeta([prevId])
+            .then(([data]) => {
+                if (data && data.stream_url) {
+                    playSong(data.stream_url, data.title, data.artist, data.cover, data.id, jamSourceElement);
+                }
+            })
+            .catch(err => console.error('Failed to fetch previous song:', err));
+        return;
+    }
+
+    // Normal mode
+    const pi = getPrevIndex();
+    if (pi === -1) {
+        // No previous in queue - do nothing or replay current
+        if (playerTime() > 3) {
+            seekAudio(0);
+        }
+        return;
+    }
+    queueIndex = pi;
+    startCurrent();
+}
+function playSong(url, title, artist, cover, id, clickedElement = null, autoplay = true) {
+    currentSongId = id || null;
+    currentPlayingElement = clickedElement; // Save the element that was clicked
+    // also expose on window for other handlers
+    window.currentSongId = currentSongId;
+    document.getElementById('player').style.display = 'flex';
+    document.getElementById('current-song-title').textContent = title;
+    document.getElementById('current-song-artist').textContent = artist;
+    cardImage.src = cover || "";
+    // set add-to-playlist link in player menu
+    const addLink = document.getElementById('player-add-to-playlist');
+    if (addLink && id) addLink.href = `/song/${id}/add-to-playlist/`;
+    clearTimeout(seekTimer);
+    trackUrl = url;
+    seekBase = 0;
+    trackDuration = 0;
+    pendingOffset = null;
+    audioPlayer.src = url;
+    if (autoplay) audioPlayer.play();
+    saveQueue();
+
+    // Increment play count
+    if (id && autoplay) {
+        fetch(`/song/${id}/play/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+                'X-Requested-With': 'XMLHttpRequest',
+            }
+        }).catch(err => console.error('Failed to track play:', err));
+    }
+
+    const icon = playPauseIcon();
+    if (icon && autoplay) { icon.classList.remove('mdi-play'); icon.classList.add('mdi-pause'); }
+    // reflect liked state for current song if possible
+    const playerLikeBtn = document.getElementById('player-like-btn');
+    if (playerLikeBtn) {
+        // attempt to find a corresponding button elsewhere to copy state
+        const other = document.querySelector(`button[onclick*="toggleFavorite('${id}')"]`);
+        if (other && other.classList.contains('favorited')) {
+            playerLikeBtn.classList.add('favorited');
+            const icon = playerLikeBtn.querySelector('i');
+            if (icon) { icon.classList.remove('mdi-heart-outline'); icon.classList.add('mdi-heart'); }
+        } else {
+            playerLikeBtn.classList.remove('favorited');
+            const icon = playerLikeBtn.querySelector('i');
+            if (icon) { icon.classList.remove('mdi-heart'); icon.classList.add('mdi-heart-outline'); }
+        }
+    }
+    // clear previous playing markers
+    document.querySelectorAll('.playing').forEach(el => el.classList.remove('playing'));
+
+    // Mark the specific element that was clicked, or find by ID
+    if (clickedElement) {
+        clickedElement.classList.add('playing');
+        currentPlayingElement = clickedElement;
+    } else if (id) {
+        // Find element by ID when no specific element provided (e.g., next/prev)
+        const listItem = document.querySelector(`li.song-item[data-song-id="${id}"]`);
+        if (listItem) {
+            listItem.classList.add('playing');
+            currentPlayingElement = listItem;
+        } else {
+            const cardItem = document.querySelector(`.song-card[data-song-id="${id}"]`);
+            if (cardItem) {
+                cardItem.classList.add('playing');
+                currentPlayingElement = cardItem;
+            } else {
+                currentPlayingElement = null;
+            }
+        }
+    } else {
+        currentPlayingElement = null;
+    }
+
+    // Update fullscreen player
+    updateFullscreenPlayer();
+
+    // Update MediaSession API for background playback
+    if ('mediaSession' in navigator) {
+        navigator.mediaSession.metadata = new MediaMetadata({
+            title: title,
+            artist: artist,
+            artwork: [
+                { src: cover || '', sizes: '512x512', type: 'image/jpeg' }
+            ]
+        });
+
+        navigator.mediaSession.setActionHandler('play', () => {
+            audioPlayer.play();
+        });
+
+        navigator.mediaSession.setActionHandler('pause', () => {
+            audioPlayer.pause();
+        });
+
+        navigator.mediaSession.setActionHandler('previoustrack', () => {
+            prevTrack();
+        });
+
+        navigator.mediaSession.setActionHandler('nexttrack', () => {
+            nextTrack();
+        });
+    }
+}
+
+// Play/Pause button handler
+playPauseBtn.addEventListener('click', () => {
+    togglePlayPause();
+});
+
+// Fullscreen play button handler
+fullscreenPlayBtn.addEventListener('click', (e) => {
+    e.stopPropagation();
+    togglePlayPause();
+});
+
+// Fullscreen like button handler
+if (fullscreenLikeBtn) {
+    fullscreenLikeBtn.addEventListener('click', (e) => {
+        e.stopPropagation();
+        if (window.currentSongId) {
+            toggleFavorite(window.currentSongId);
+        }
+    });
+}
+
+// Fullscreen mode button handler
+if (fullscreenModeBtn) {
+    fullscreenModeBtn.addEventListener('click', (e) => {
+        e.stopPropagation();
+        cycleMode();
+    });
+}
+
+function togglePlayPause() {
+    if (audioPlayer.paused) {
+        audioPlayer.play();
+        const icon = playPauseIcon();
+        if (icon) { icon.classList.remove('mdi-play'); icon.classList.add('mdi-pause'); }
+        // Update fullscreen button
+        if (fullscreenPlayBtn) {
+            const fsIcon = fullscreenPlayBtn.querySelector('i');
+            if (fsIcon) { fsIcon.classList.remove('mdi-play'); fsIcon.classList.add('mdi-pause'); }
+        }
+    } else {
+        audioPlayer.pause();
+        const icon = playPauseIcon();
+        if (icon) { icon.classList.remove('mdi-pause'); icon.classList.add('mdi-play'); }
+        // Update fullscreen button
+        if (fullscreenPlayBtn) {
+            const fsIcon = fullscreenPlayBtn.querySelector('i');
+            if (fsIcon) { fsIcon.classList.remove('mdi-pause'); fsIcon.classList.add('mdi-play'); }
+        }
+    }
+}
+
+prevBtn.addEventListener('click', (e) => { e.stopPropagation(); prevTrack(); });
+nextBtn.addEventListener('click', (e) => { e.stopPropagation(); nextTrack(); });
+
+// Time formatting helper
+function fmt(sec) {
+    if (!isFinite(sec)) return '0:00';
+    sec = Math.max(0, Math.floor(sec));
+    const m = Math.floor(sec / 60);
+    const s = sec % 60;
+    return m + ':' + (s < 10 ? '0' + s : s);
+}
+
+// Перемотка: внутри буфера — обычный currentTime, дальше — запрос ?t=,
+// который сервер начинает прямо с нужного кадра по таблице перемотки.
+// Поток с ?t= начинается с seekBase, поэтому время и длительность
+// трека считаем сами.
+let trackUrl = '';
+let seekBase = 0;
+let trackDuration = 0;
+let pendingOffset = null;
+let seekTimer = null;
+
+function playerTime() {
+    return seekBase + (audioPlayer.currentTime || 0);
+}
+
+function playerDuration() {
+    return trackDuration || audioPlayer.duration || 0;
+}
+
+function isBuffered(time) {
+    const ranges = audioPlayer.buffered;
+    for (let i = 0; i < ranges.length; i++) {
+        if (time >= ranges.start(i) && time <= ranges.end(i)) return true;
+    }
+    return false;
+}
+
+function seekAudio(target) {
+    if (!trackUrl || !isFinite(target) || target < 0) return;
+    clearTimeout(seekTimer);
+    const local = target - seekBase;
+    if (local >= 0 && isBuffered(local)) {
+        audioPlayer.currentTime = local;
+        return;
+    }
+    // При перетаскивании ползунка запрос уходит один раз, по последней позиции
+    seekTimer = setTimeout(() => {
+        const base = Math.floor(target);
+        seekBase = base;
+        pendingOffset = target - base;
+        audioPlayer.src = base ? `${trackUrl}?t=${base}` : trackUrl;
+        audioPlayer.play();
+    }, 150);
+}
+
+// Нет таблицы перемотки (404) — обычный URL и перемотка средствами браузера
+audioPlayer.addEventListener('error', () => {
+    if (!seekBase || !trackUrl) return;
+    pendingOffset = seekBase + (pendingOffset || 0);
+    seekBase = 0;
+    audioPlayer.src = trackUrl;
+    audioPlayer.play();
+});
+
+// Update progress bar and time
+audioPlayer.addEventListener('loadedmetadata', () => {
+    if (!seekBase && isFinite(audioPlayer.duration)) trackDuration = audioPlayer.duration;
+    if (pendingOffset) audioPlayer.currentTime = pendingOffset;
+    pendingOffset = null;
+    totTimeEl.textContent = fmt(playerDuration());
+});
+
+let isDragging = false;
+
+audioPlayer.addEventListener('timeupdate', () => {
+    if (isDragging) return; // Don't update while dragging
+    const dur = playerDuration();
+    const cur = playerTime();
+    const progress = dur ? (cur / dur) * 100 : 0;
+    progressFill.style.width = progress + '%';
+    curTimeEl.textContent = fmt(cur);
+    if (dur) totTimeEl.textContent = fmt(dur);
+
+    // Update fullscreen player progress
+    if (!fullscreenProgressDragging) {
+        fullscreenProgressFill.style.width = progress + '%';
+        fullscreenCurrentTime.textContent = fmt(cur);
+        if (dur) fullscreenTotalTime.textContent = fmt(dur);
+    }
+});
+
+// Seek functionality
+function seekTo(clientX) {
+    const rect = progressBar.getBoundingClientRect();
+    const ratio = Math.min(1, Math.max(0, (clientX - rect.left) / rect.width));
+    const targetTime = ratio * playerDuration();
+
+    if (isFinite(targetTime) && targetTime >= 0) {
+        seekAudio(targetTime);
+        const progress = ratio * 100;
+        progressFill.style.width = progress + '%';
+        curTimeEl.textContent = fmt(targetTime);
+    }
+}
+
+progressBar.addEventListener('click', (e) => {
+    e.stopPropagation();
+    seekTo(e.clientX);
+});
+
+progressBar.addEventListener('mousedown', (e) => {
+    e.stopPropagation();
+    isDragging = true;
+    seekTo(e.clientX);
+});
+
+document.addEventListener('mousemove', (e) => {
+    if (isDragging) {
+        seekTo(e.clientX);
+    }
+});
+
+document.addEventListener('mouseup', () => {
+    isDragging = false;
+});
+
+// Touch support for mobile
+progressBar.addEventListener('touchstart', (e) => {
+    e.stopPropagation();
+    isDragging = true;
+    if (e.touches[0]) {
+        seekTo(e.touches[0].clientX);
+    }
+}, { passive: true });
+
+progressBar.addEventListener('touchmove', (e) => {
+    if (isDragging && e.touches[0]) {
+        seekTo(e.touches[0].clientX);
+    }
+}, { passive: true });
+
+progressBar.addEventListener('touchend', () => {
+    isDragging = false;
+});
+
+audioPlayer.addEventListener('ended', () => {
+    nextTrack();
+});
+
+// init mode icon
+setMode('sequential');
+
+// Support playing from card grids on pages like Home
+window.playFromCard = function(cardEl) {
+    // Check if we're on the home page or search page
+    const isHomePage = window.location.pathname === '/' || window.location.pathname === '/home/';
+    const isSearchPage = window.location.pathname.startsWith('/search');
+
+    // Build queue from ALL song cards on the page, not just current grid
+    const allCards = Array.from(document.querySelectorAll('.song-card'));
+    const q = allCards.map((c, index) => ({
+        id: c.dataset.songId,
+        url: c.dataset.audio,
+        title: c.dataset.title,
+        artist: c.dataset.artist,
+        cover: c.dataset.cover,
+        element: c // Store reference to the actual DOM element
+    })).filter(x => x.url);
+
+    if (!q.length) {
+        // Fallback to single song
+        const s = {
+            id: cardEl.dataset.songId,
+            url: cardEl.dataset.audio,
+            title: cardEl.dataset.title,
+            artist: cardEl.dataset.artist,
+            cover: cardEl.dataset.cover,
+            element: cardEl
+        };
+        if (s.url) { 
+            playQueue = [s]; 
+            queueIndex = 0;
+
+            if (isHomePage || isSearchPage) {
+                isJamMode = true;
+                jamSourceElement = cardEl;
+                startRadio(cardEl.dataset.songId);
+            } else {
+                isJamMode = false;
+                jamSourceElement = null;
+            }
+
+            const s2 = playQueue[0];
+            playSong(s2.url, s2.title, s2.artist, s2.cover, s2.id, s2.element);
+        }
+        return;
+    }
+
+    playQueue = q;
+    const id = cardEl.dataset.songId;
+    queueIndex = q.findIndex(s => s.element === cardEl); // Find by actual element reference
+    if (queueIndex < 0) {
+        // Fallback to ID search if element not found
+        queueIndex = q.findIndex(s => String(s.id) === String(id));
+    }
+    if (queueIndex < 0) queueIndex = 0;
+
+    if (isHomePage || isSearchPage) {
+        // Jam mode: next tracks will be random from DB
+        isJamMode = true;
+        jamSourceElement = cardEl;
+        startRadio(cardEl.dataset.songId);
+    } else {
+        // Normal mode: play from queue
+        isJamMode = false;
+        jamSourceElement = null;
+    }
+
+    const s = playQueue[queueIndex];
+    playSong(s.url, s.title, s.artist, s.cover, s.id, s.element);
+}
+
+// Метаданные треков по id (/api/songs/): вся очередь одним запросом на каждые
+// SONG_BATCH треков, уже известные треки не запрашиваются повторно
+const SONG_BATCH = 100;
+const songMeta = new Map();
+
+function fetchSongMeta(ids) {
+    const missing = [...new Set(ids.map(String))].filter(id => !songMeta.has(id));
+    const requests = [];
+    for (let i = 0; i < missing.length; i += SONG_BATCH) {
+        const chunk = missing.slice(i, i + SONG_BATCH);
+        requests.push(fetch(`/api/songs/?ids=${chunk.join(',')}`)
+            .then(res => res.ok ? res.json() : { songs: [] })
+            .then(data => data.songs.forEach(s => songMeta.set(String(s.id), s))));
+    }
+    return Promise.all(requests).then(() => ids.map(id => songMeta.get(String(id))).filter(Boolean));
+}
+
+// Радио джем-режима (/api/radio/): следующие треки приходят пачкой заранее,
+// а когда их остаётся мало, в фоне подгружается продолжение по токену
+const RADIO_BATCH = 20;
+const RADIO_PREFETCH_AT = 5;
+let radioSeed = null;
+let radioQueue = [];
+let radioToken = null;
+let radioLoading = null;
+let radioPlayed = [];
+
+function startRadio(seedId) {
+    radioSeed = seedId;
+    radioQueue = [];
+    radioToken = null;
+    radioLoading = null;
+    radioPlayed = [];
+    return loadRadio();
+}
+
+function loadRadio() {
+    if (radioLoading) return radioLoading;
+    const seed = radioSeed;
+    const params = new URLSearchParams({ n: RADIO_BATCH });
+    if (radioToken) params.set('continue', radioToken);
+    const request = fetch(`/api/radio/${seed}/?${params}`)
+        .then(res => res.ok ? res.json() : { songs: [], continue: null })
+        .then(data => {
+            if (seed !== radioSeed) return;  // радио уже перезапустили с другого трека
+            data.songs.forEach(s => songMeta.set(String(s.id), s));
+            radioQueue.push(...data.songs);
+            radioToken = data.continue;
+        })
+        .finally(() => { if (radioLoading === request) radioLoading = null; });
+    radioLoading = request;
+    return request;
+}
+
+function nextRadioSong() {
+    const take = () => {
+        const s = radioQueue.shift();
+        if (radioQueue.length < RADIO_PREFETCH_AT) loadRadio();
+        return s;
+    };
+    if (!radioSeed) startRadio(currentSongId);
+    return radioQueue.length ? Promise.resolve(take()) : loadRadio().then(take);
+}
+
+// Очередь переживает переход по страницам: храним только id, остальное — из /api/songs/
+const QUEUE_KEY = 'bjfy:queue';
+
+function saveQueue() {
+    const ids = isJamMode || !playQueue.length ? [currentSongId] : playQueue.map(s => s.id);
+    try {
+        sessionStorage.setItem(QUEUE_KEY, JSON.stringify({ ids: ids.filter(Boolean), current: currentSongId }));
+    } catch (e) { /* приватный режим или переполнение — просто не сохраняем */ }
+}
+
+function restoreQueue() {
+    let saved = null;
+    try { saved = JSON.parse(sessionStorage.getItem(QUEUE_KEY)); } catch (e) { }
+    if (!saved || !Array.isArray(saved.ids) || !saved.ids.length) return;
+    fetchSongMeta(saved.ids).then(songs => {
+        // Пока грузили, пользователь мог уже что-то включить
+        if (!songs.length || currentSongId) return;
+        playQueue = songs.map(s => ({
+            id: String(s.id), url: s.stream_url, title: s.title, artist: s.artist, cover: s.cover, element: null,
+        }));
+        queueIndex = Math.max(0, playQueue.findIndex(s => s.id === String(saved.current)));
+        const s = playQueue[queueIndex];
+        playSong(s.url, s.title, s.artist, s.cover, s.id, null, false);
+    }).catch(err => console.error('Failed to restore queue:', err));
+}
+
+restoreQueue();
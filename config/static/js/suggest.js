@@ -0,0 +1,91 @@
+// search-as-you-type suggestions for inputs marked with data-suggest
+document.querySelectorAll('.search-input[data-suggest]').forEach(input => {
+    const dropdown = input.parentElement.querySelector('.suggest-dropdown');
+    let lastQuery = '';
+
+    input.addEventListener('input', () => {
+        const q = input.value.trim();
+        lastQuery = q;
+        if (!q) {
+            dropdown.style.display = 'none';
+            return;
+        }
+        fetch(`${input.dataset.suggest}?q=${encodeURIComponent(q)}`)
+            .then(r => r.json())
+            .then(data => {
+                if (data.query.trim() !== lastQuery) return;
+                dropdown.innerHTML = '';
+                data.results.forEach(item => {
+                    const link = document.createElement('a');
+                    link.href = item.url;
+                    link.textContent = item.title;
+                    if (item.subtitle) {
+                        const sub = document.createElement('span');
+                        sub.className = 'suggest-subtitle';
+                        sub.textContent = item.subtitle;
+                        link.appendChild(sub);
+                    }
+                    dropdown.appendChild(link);
+                });
+                dropdown.style.display = data.results.length ? 'block' : 'none';
+            })
+            .catch(() => { dropdown.style.display = 'none'; });
+    });
+
+    input.addEventListener('blur', () => {
+        // let a click on a suggestion land before hiding
+        setTimeout(() => { dropdown.style.display = 'none'; }, 150);
+    });
+});
+
+// menu helpers
+function closeAllMenus() {
+    document.querySelectorAll('.menu-dropdown').forEach(el => el.style.display = 'none');
+}
+
+function openMenu(btn) {
+    closeAllMenus();
+    // Look for menu in parent element (works for both regular and fullscreen)
+    const parent = btn.parentElement;
+    const dropdown = parent.querySelector('.menu-dropdown');
+    if (dropdown) {
+        dropdown.style.display = 'block';
+        // Prevent click from immediately closing
+        setTimeout(() => {
+            dropdown.dataset.justOpened = 'true';
+        }, 10);
+    }
+}
+
+document.addEventListener('click', function(e){
+    // Don't close if clicking inside card-controls, fullscreen-actions, or menu itself
+    if (e.target.closest('.card-controls') || 
+        e.target.closest('.fullscreen-actions') || 
+        e.target.closest('.menu-dropdown')) {
+        return;
+    }
+    closeAllMenus();
+});
+
+// Prevent music from stopping when switching tabs or navigating
+let wasPlayingBeforeHidden = false;
+
+document.addEventListener('visibilitychange', function() {
+    if (document.hidden) {
+        // Tab is hidden - remember if music was playing
+        wasPlayingBeforeHidden = !audioPlayer.paused;
+    } else {
+        // Tab is visible again - resume if was playing AND user didn't pause manually
+        if (wasPlayingBeforeHidden && audioPlayer.paused && !userPausedManually) {
+            audioPlayer.play().catch(err => {
+                console.log('Auto-play prevented:', err);
+            });
+        }
+    }
+});
+
+// Keep audio playing during page unload (navigation)
+window.addEventListener('beforeunload', function(e) {
+    // Don't pause - let browser handle it
+    // Some browsers will keep playing, others won't
+});
@@ -0,0 +1,43 @@
+# Gunicorn configuration for the ASGI part of the site
+# Обслуживает стриминг и лёгкие API-эндпоинты (music/async_views.py),
+# nginx проксирует на него только эти пути (см. nginx.conf)
+
+# Server socket
+bind = "127.0.0.1:8001"
+
+# Worker processes
+workers = 2
+worker_class = "uvicorn.workers.UvicornWorker"
+max_requests = 10000
+max_requests_jitter = 500
+
+# Timeouts
+# Долгие загрузки не должны считаться зависшим воркером
+timeout = 120
+keepalive = 5
+graceful_timeout = 30
+
+# Logging
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
+
+# Process naming
+proc_name = "bjfy-asgi"
+
+# Server mechanics
+daemon = False
+pidfile = None
+umask = 0
+user = None
+group = None
+tmp_upload_dir = None
+
+
+# Server hooks
+def worker_exit(server, worker):
+    # Сбрасываем накопленные в буфере прослушивания перед остановкой воркера
+    from music.plays import flush_plays
+    flushed = flush_plays()
+    if flushed:
+        server.log.info("Worker %s flushed %d buffered plays", worker.pid, flushed)
@@ -35,3 +35,12 @@ tmp_upload_dir = None
 # SSL (если нужен HTTPS на уровне Gunicorn)
 # keyfile = "/path/to/key.pem"
 # certfile = "/path/to/cert.pem"
+
+
+# Server hooks
+def worker_exit(server, worker):
+    # Сбрасываем накопленные в буфере прослушивания перед остановкой воркера
+    from music.plays import flush_plays
+    flushed = flush_plays()
+    if flushed:
+        server.log.info("Worker %s flushed %d buffered plays", worker.pid, flushed)